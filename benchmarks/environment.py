@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Configuration minimale pour importer le bot sans serveur ni base réels ; le journal local va dans un dossier jetable.
+# À importer avant config et les modules du bot.
+for name, value in (('DISCORD_TOKEN', 'benchmark'), ('GUILD_ID', '1'), ('SUPABASE_URL', 'http://localhost:54321'),
+                    ('SUPABASE_KEY', 'benchmark.benchmark.benchmark'), ('VOICE_CHANNEL_PAUSE_ID', '2'),
+                    ('STATISTIQUES_CHANNEL_ID', '3'), ('GENERAL_CHANNEL_ID', '4'), ('CLASSEMENT_LIVE_CHANNEL_ID', '5')):
+    os.environ.setdefault(name, value)
+os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='focusbot-bench-')
+os.environ['METRICS_PORT'] = '0'
@@ -0,0 +1,484 @@
+import bisect
+import datetime
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from postgrest.types import CountMethod, ReturnMethod
+
+# Colonnes converties en valeurs Python, dans les filtres comme dans les écritures
+COLUMN_TYPES: Dict[str, Callable[[Any], Any]] = {
+    'start_time': lambda value: parse_moment(value),
+    'end_time': lambda value: parse_moment(value),
+    'last_check': lambda value: parse_moment(value),
+    'day': lambda value: value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value)),
+    'month': lambda value: value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value)),
+}
+
+# Clé de conflit par défaut des tables (clé primaire ou contrainte UNIQUE du schéma)
+UNIQUE_KEYS = {
+    'sessions': 'session_key',
+    'streaks': 'user_id',
+    'user_roles': 'user_id',
+    'user_discipline': 'user_id',
+}
+
+def parse_moment(value: Any) -> Optional[datetime.datetime]:
+    """Date et heure naïve, comme celles du bot"""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    return datetime.datetime.fromisoformat(str(value)).replace(tzinfo=None)
+
+def convert(column: str, value: Any) -> Any:
+    converter = COLUMN_TYPES.get(column)
+    return converter(value) if converter is not None and value is not None else value
+
+def serialize(row: Dict, columns: Optional[List[str]] = None) -> Dict:
+    """Ligne telle que la renvoie PostgREST : dates au format ISO"""
+    keys = columns if columns is not None else list(row)
+    return {key: row.get(key).isoformat() if isinstance(row.get(key), (datetime.date, datetime.datetime)) else row.get(key)
+            for key in keys}
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    'eq': lambda left, right: left == right,
+    'neq': lambda left, right: left != right,
+    'gt': lambda left, right: left is not None and left > right,
+    'gte': lambda left, right: left is not None and left >= right,
+    'lt': lambda left, right: left is not None and left < right,
+    'lte': lambda left, right: left is not None and left <= right,
+}
+
+@dataclass
+class FakeResponse:
+    data: Any
+    count: Optional[int] = None
+
+@dataclass
+class FakeQuery:
+    """Constructeur de requêtes compatible avec celui de supabase-py, pour les méthodes utilisées par le bot"""
+    database: 'FakeDatabase'
+    table: str
+    action: str = 'select'
+    columns: Optional[List[str]] = None
+    payload: Any = None
+    on_conflict: str = ''
+    returning: ReturnMethod = ReturnMethod.representation
+    filters: List[Tuple[str, str, Any]] = field(default_factory=list)
+    order_by: List[Tuple[str, bool]] = field(default_factory=list)
+    offset: int = 0
+    row_limit: Optional[int] = None
+    count: Optional[CountMethod] = None
+
+    def select(self, *columns: str, count: Optional[CountMethod] = None) -> 'FakeQuery':
+        self.count = count
+        names = [name.strip() for column in columns for name in column.split(',') if name.strip()]
+        self.columns = None if not names or names == ['*'] else names
+        return self
+
+    def insert(self, json, *, count=None, returning: ReturnMethod = ReturnMethod.representation, upsert: bool = False) -> 'FakeQuery':
+        self.action, self.payload, self.returning = ('upsert' if upsert else 'insert'), json, returning
+        return self
+
+    def upsert(self, json, *, count=None, returning: ReturnMethod = ReturnMethod.representation,
+               ignore_duplicates: bool = False, on_conflict: str = '') -> 'FakeQuery':
+        self.action, self.payload, self.returning, self.on_conflict = 'upsert', json, returning, on_conflict
+        return self
+
+    def update(self, json, *, count=None, returning: ReturnMethod = ReturnMethod.representation) -> 'FakeQuery':
+        self.action, self.payload, self.returning = 'update', json, returning
+        return self
+
+    def delete(self, *, count=None, returning: ReturnMethod = ReturnMethod.representation) -> 'FakeQuery':
+        self.action, self.returning = 'delete', returning
+        return self
+
+    def _filter(self, operator: str, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append((column, operator, convert(column, value)))
+        return self
+
+    def eq(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('eq', column, value)
+
+    def neq(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('neq', column, value)
+
+    def gt(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('gt', column, value)
+
+    def gte(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('gte', column, value)
+
+    def lt(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('lt', column, value)
+
+    def lte(self, column: str, value: Any) -> 'FakeQuery':
+        return self._filter('lte', column, value)
+
+    def order(self, column: str, *, desc: bool = False, nullsfirst: bool = False) -> 'FakeQuery':
+        # Comme PostgREST : "a,b" trie sur les deux colonnes, le sens ne porte que sur la dernière
+        names = [name.strip() for name in column.split(',')]
+        self.order_by.extend((name, desc and i == len(names) - 1) for i, name in enumerate(names))
+        return self
+
+    def limit(self, size: int) -> 'FakeQuery':
+        self.row_limit = size
+        return self
+
+    def range(self, start: int, end: int) -> 'FakeQuery':
+        # postgrest-py 0.13 (supabase 2.3.0) envoie "Range: start-(end - 1)" : la fin est exclue
+        self.offset, self.row_limit = start, max(end - start, 0)
+        return self
+
+    def execute(self) -> FakeResponse:
+        return self.database.round_trip(f"{self.table}.{self.action}", lambda: self.database.run_query(self))
+
+@dataclass
+class FakeRPC:
+    database: 'FakeDatabase'
+    name: str
+    params: Dict
+
+    def execute(self) -> FakeResponse:
+        return self.database.round_trip(f"rpc.{self.name}", lambda: self.database.run_rpc(self.name, self.params))
+
+class FakeDatabase:
+    """Base en mémoire qui reproduit les tables, le trigger du cumul quotidien et les fonctions RPC de schema.sql"""
+
+    def __init__(self, latency: float = 0.0, max_rows: Optional[int] = None):
+        self.latency = latency  # Délai simulé par aller-retour, en secondes
+        self.max_rows = max_rows  # Comme db-max-rows de PostgREST : plafond des lignes renvoyées par une lecture
+        self.lock = threading.RLock()
+        self.round_trips: Counter = Counter()
+        self.backend_seconds = 0.0
+
+        self.sessions: Dict[int, Dict] = {}
+        self.session_order: List[Tuple[datetime.datetime, int]] = []  # Index trié (start_time, id)
+        self.session_keys: Dict[str, int] = {}
+        self.next_session_id = 1
+        self.daily_by_user: Dict[int, Dict[datetime.date, int]] = {}
+        self.daily_by_day: Dict[datetime.date, Dict[int, int]] = {}
+        self.monthly_stats: Dict[Tuple[int, datetime.date], int] = {}
+        # Petites tables, indexées par leur clé unique (user_id)
+        self.rows: Dict[str, Dict[Any, Dict]] = {'streaks': {}, 'user_roles': {}, 'user_discipline': {}}
+        self.next_ids: Counter = Counter()
+        # Résultats des agrégats coûteux, valables tant qu'aucune écriture n'a eu lieu (pages successives d'un même classement)
+        self.version = 0
+        self.memo: Dict[Tuple, Any] = {}
+        self.memo_version = 0
+
+    # Mesure
+
+    def round_trip(self, label: str, operation: Callable[[], Any]) -> FakeResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        start = time.perf_counter()
+        with self.lock:
+            self.round_trips[label] += 1
+            result = operation()
+            self.backend_seconds += time.perf_counter() - start
+        return result if isinstance(result, FakeResponse) else FakeResponse(result)
+
+    def reset_counters(self):
+        with self.lock:
+            self.round_trips.clear()
+            self.backend_seconds = 0.0
+
+    # Sessions et cumul quotidien (trigger update_daily_user_totals)
+
+    def _add_daily(self, user_id: int, day: datetime.date, seconds: int):
+        self.version += 1
+        days = self.daily_by_user.setdefault(user_id, {})
+        total = days.get(day, 0) + seconds
+        users = self.daily_by_day.setdefault(day, {})
+        days[day] = total
+        users[user_id] = total
+
+    def _remove_daily_if_empty(self, user_id: int, day: datetime.date):
+        if self.daily_by_user.get(user_id, {}).get(day, 1) <= 0:
+            del self.daily_by_user[user_id][day]
+            del self.daily_by_day[day][user_id]
+
+    def insert_session(self, row: Dict) -> Dict:
+        row = {key: convert(key, value) for key, value in row.items()}
+        row.setdefault('id', self.next_session_id)
+        self.next_session_id = max(self.next_session_id, row['id'] + 1)
+        self.sessions[row['id']] = row
+        bisect.insort(self.session_order, (row['start_time'], row['id']))
+        if row.get('session_key'):
+            self.session_keys[str(row['session_key'])] = row['id']
+        self._add_daily(row['user_id'], row['start_time'].date(), row['duration_seconds'])
+        return row
+
+    def load_sessions(self, rows: Iterable[Dict]):
+        """Chargement en masse : l'index trié est construit une seule fois à la fin"""
+        for row in rows:
+            row['id'] = self.next_session_id
+            self.next_session_id += 1
+            self.sessions[row['id']] = row
+            self.session_order.append((row['start_time'], row['id']))
+            self._add_daily(row['user_id'], row['start_time'].date(), row['duration_seconds'])
+        self.session_order.sort()
+
+    def update_session(self, row: Dict, changes: Dict) -> Dict:
+        self._add_daily(row['user_id'], row['start_time'].date(), -row['duration_seconds'])
+        if 'start_time' in changes:
+            del self.session_order[bisect.bisect_left(self.session_order, (row['start_time'], row['id']))]
+        row.update({key: convert(key, value) for key, value in changes.items()})
+        if 'start_time' in changes:
+            bisect.insort(self.session_order, (row['start_time'], row['id']))
+        self._add_daily(row['user_id'], row['start_time'].date(), row['duration_seconds'])
+        return row
+
+    def delete_session(self, row: Dict, indexed: bool = True):
+        del self.sessions[row['id']]
+        if indexed:
+            del self.session_order[bisect.bisect_left(self.session_order, (row['start_time'], row['id']))]
+        self.session_keys.pop(str(row.get('session_key')), None)
+        self._add_daily(row['user_id'], row['start_time'].date(), -row['duration_seconds'])
+        self._remove_daily_if_empty(row['user_id'], row['start_time'].date())
+
+    def _session_slice(self, start: Optional[datetime.datetime], end: Optional[datetime.datetime]) -> Tuple[int, int]:
+        low = 0 if start is None else bisect.bisect_left(self.session_order, (start,))
+        high = len(self.session_order) if end is None else bisect.bisect_left(self.session_order, (end,))
+        return low, high
+
+    def sessions_between(self, start: Optional[datetime.datetime], end: Optional[datetime.datetime]) -> List[Dict]:
+        """Sessions dont start_time est dans [start, end), dans l'ordre (start_time, id)"""
+        low, high = self._session_slice(start, end)
+        return [self.sessions[session_id] for _, session_id in self.session_order[low:high]]
+
+    def cached(self, key: Tuple, compute: Callable[[], Any]) -> Any:
+        if self.memo_version != self.version:
+            self.memo.clear()
+            self.memo_version = self.version
+        if key not in self.memo:
+            self.memo[key] = compute()
+        return self.memo[key]
+
+    # Requêtes sur les tables
+
+    def _bounds(self, filters: List[Tuple[str, str, Any]], column: str) -> Tuple[Any, Any]:
+        """Bornes [basse, haute) tirées des filtres d'une colonne indexée (les filtres restent appliqués ensuite)"""
+        low = high = None
+        for name, operator, value in filters:
+            if name != column:
+                continue
+            if operator in ('eq', 'gte', 'gt'):
+                low = value if low is None else max(low, value)
+            if operator in ('eq', 'lte', 'lt'):
+                # Borne haute inclusive : élargie d'une unité, le filtre exact est réappliqué
+                bound = value + (datetime.timedelta(microseconds=1) if isinstance(value, datetime.datetime) else datetime.timedelta(days=1)) \
+                    if operator != 'lt' else value
+                high = bound if high is None else min(high, bound)
+        return low, high
+
+    def candidates(self, query: FakeQuery) -> Iterable[Dict]:
+        """Lignes susceptibles de passer les filtres, en s'appuyant sur les index des grosses tables"""
+        if query.table == 'sessions':
+            return self.sessions_between(*self._bounds(query.filters, 'start_time'))
+
+        if query.table == 'daily_user_totals':
+            user_ids = [value for name, operator, value in query.filters if name == 'user_id' and operator == 'eq']
+            if user_ids:
+                return [{'user_id': user_ids[0], 'day': day, 'seconds': seconds}
+                        for day, seconds in self.daily_by_user.get(user_ids[0], {}).items()]
+            low, high = self._bounds(query.filters, 'day')
+            return [{'user_id': user_id, 'day': day, 'seconds': seconds}
+                    for day, users in self.daily_by_day.items()
+                    if (low is None or day >= low) and (high is None or day < high)
+                    for user_id, seconds in users.items()]
+
+        if query.table == 'monthly_stats':
+            return [{'user_id': user_id, 'month': month, 'total_seconds': seconds}
+                    for (user_id, month), seconds in self.monthly_stats.items()]
+
+        # Recherche directe sur la clé unique, comme par l'index de la contrainte
+        unique = UNIQUE_KEYS[query.table]
+        keys = [value for name, operator, value in query.filters if name == unique and operator == 'eq']
+        if keys:
+            row = self.rows[query.table].get(keys[0])
+            return [row] if row is not None else []
+        return list(self.rows[query.table].values())
+
+    def select(self, query: FakeQuery) -> List[Dict]:
+        rows = [row for row in self.candidates(query)
+                if all(OPERATORS[operator](row.get(column), value) for column, operator, value in query.filters)]
+        for column, desc in reversed(query.order_by):
+            rows.sort(key=lambda row: row.get(column), reverse=desc)
+        end = None if query.row_limit is None else query.offset + query.row_limit
+        return rows[query.offset:end]
+
+    def run_query(self, query: FakeQuery) -> List[Dict]:
+        if query.action == 'select':
+            rows = self.select(query)
+            data = [serialize(row, query.columns) for row in self.capped(rows)]
+            if query.count is None:
+                return data
+            # Nombre de lignes satisfaisant les filtres, hors pagination, comme l'en-tête Content-Range
+            return FakeResponse(data, len(self.select(FakeQuery(self, query.table, filters=query.filters))))
+
+        if query.action in ('insert', 'upsert'):
+            payload = query.payload if isinstance(query.payload, list) else [query.payload]
+            key = query.on_conflict or UNIQUE_KEYS.get(query.table)
+            written = [self.write_row(query.table, row, key if query.action == 'upsert' else None) for row in payload]
+        else:
+            if query.table != 'sessions' and query.table not in self.rows:
+                raise NotImplementedError(f"{query.action} sur {query.table} n'est pas simulé")
+            # Ces tables sont stockées ligne par ligne : la sélection renvoie les lignes elles-mêmes
+            written = self.select(FakeQuery(self, query.table, filters=query.filters))
+            for row in written:
+                if query.table == 'sessions':
+                    if query.action == 'update':
+                        self.update_session(row, query.payload)
+                    else:
+                        self.delete_session(row)
+                elif query.action == 'update':
+                    row.update({key: convert(key, value) for key, value in query.payload.items()})
+                else:
+                    del self.rows[query.table][row[UNIQUE_KEYS[query.table]]]
+
+        if query.returning == ReturnMethod.minimal:
+            return []
+        return [serialize(row) for row in written]
+
+    def write_row(self, table: str, row: Dict, conflict: Optional[str]) -> Dict:
+        row = {key: convert(key, value) for key, value in row.items()}
+        if table == 'sessions':
+            existing = self.session_keys.get(str(row.get('session_key'))) if conflict else None
+            if existing is not None:
+                return self.update_session(self.sessions[existing], row)
+            return self.insert_session(row)
+
+        key = row[UNIQUE_KEYS[table]]
+        current = self.rows[table].get(key)
+        if current is not None:
+            if not conflict:
+                raise ValueError(f"Clé {UNIQUE_KEYS[table]}={key} déjà présente dans {table}")
+            current.update(row)
+            return current
+        self.next_ids[table] += 1
+        row.setdefault('id', self.next_ids[table])
+        self.rows[table][key] = row
+        return row
+
+    # Fonctions RPC
+
+    def run_rpc(self, name: str, params: Dict) -> Any:
+        handler = getattr(self, f"rpc_{name}", None)
+        if handler is None:
+            raise NotImplementedError(f"Fonction RPC {name} non simulée")
+        result = handler(**params)
+        return self.capped(result) if isinstance(result, list) else result
+
+    def capped(self, rows: List[Dict]) -> List[Dict]:
+        return rows if self.max_rows is None else rows[:self.max_rows]
+
+    def _period_totals(self, start: Optional[datetime.date], end: Optional[datetime.date]) -> Dict[int, int]:
+        totals: Dict[int, int] = {}
+        for day, users in self.daily_by_day.items():
+            if (start is None or day >= start) and (end is None or day < end):
+                for user_id, seconds in users.items():
+                    if seconds > 0:
+                        totals[user_id] = totals.get(user_id, 0) + seconds
+        return totals
+
+    def rpc_get_leaderboard_page(self, p_start=None, p_end=None, p_limit=10, p_offset=0) -> List[Dict]:
+        start, end = parse_moment(p_start), parse_moment(p_end)
+        aligned = all(moment is None or moment == datetime.datetime.combine(moment.date(), datetime.time())
+                      for moment in (start, end))
+
+        def rank():
+            if aligned:
+                totals = self._period_totals(start and start.date(), end and end.date())
+            else:
+                totals = {}
+                for row in self.sessions_between(start, end):
+                    totals[row['user_id']] = totals.get(row['user_id'], 0) + row['duration_seconds']
+            return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+        ranked = self.cached(('leaderboard', start, end), rank)
+        return [{'user_id': user_id, 'total_seconds': seconds, 'total_count': len(ranked)}
+                for user_id, seconds in ranked[p_offset:p_offset + p_limit]]
+
+    def rpc_get_period_leaderboards(self, p_daily=None, p_weekly=None, p_monthly=None, p_yearly=None,
+                                    p_end=None, p_limit=10) -> List[Dict]:
+        end = convert('day', p_end)
+        rows = []
+        for period, start in (('daily', p_daily), ('monthly', p_monthly), ('weekly', p_weekly), ('yearly', p_yearly)):
+            if start is None:
+                continue
+            totals = self._period_totals(convert('day', start), end)
+            ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:p_limit]
+            rows.extend({'period': period, 'user_id': user_id, 'total_seconds': seconds} for user_id, seconds in ranked)
+        return rows
+
+    def rpc_get_users_lifetime_seconds(self, p_user_ids: List[int]) -> List[Dict]:
+        archived: Dict[int, int] = {}
+        wanted = set(p_user_ids)
+        for (user_id, _), seconds in self.monthly_stats.items():
+            if user_id in wanted:
+                archived[user_id] = archived.get(user_id, 0) + seconds
+        return [{'user_id': user_id,
+                 'total_seconds': sum(self.daily_by_user.get(user_id, {}).values()) + archived.get(user_id, 0)}
+                for user_id in p_user_ids]
+
+    def rpc_get_discipline_window(self, p_start, p_end, p_min_seconds, p_after_user_id=None, p_limit=1000) -> List[Dict]:
+        start, end = convert('day', p_start), convert('day', p_end)
+        users = sorted((row for row in self.rows['user_discipline'].values()
+                        if p_after_user_id is None or row['user_id'] > p_after_user_id),
+                       key=lambda row: row['user_id'])[:p_limit]
+        result = []
+        for row in users:
+            days = self.daily_by_user.get(row['user_id'], {})
+            validated = sum(1 for day, seconds in days.items() if start <= day <= end and seconds >= p_min_seconds)
+            entry = serialize(row, ['user_id', 'discipline_level', 'best_discipline_level', 'last_check'])
+            entry['validated_days'] = validated
+            result.append(entry)
+        return result
+
+    def rpc_archive_sessions(self, p_from, p_to) -> int:
+        low, high = self._session_slice(parse_moment(p_from), parse_moment(p_to))
+        archived = [self.sessions[session_id] for _, session_id in self.session_order[low:high]]
+        # Suppression de la tranche d'index en une fois, comme le DELETE sur un intervalle de start_time
+        del self.session_order[low:high]
+        for row in archived:
+            month = row['start_time'].date().replace(day=1)
+            key = (row['user_id'], month)
+            self.monthly_stats[key] = self.monthly_stats.get(key, 0) + row['duration_seconds']
+            self.delete_session(row, indexed=False)
+        return len(archived)
+
+    def rpc_compact_sessions(self, p_from, p_before) -> int:
+        start, before = parse_moment(p_from), parse_moment(p_before)
+        chains: Dict[int, Dict] = {}  # {user_id: tête de la chaîne en cours}
+        merged = []
+        for row in sorted((row for row in self.sessions_between(start, before) if row['end_time'] < before),
+                          key=lambda row: (row['user_id'], row['start_time'], row['id'])):
+            head = chains.get(row['user_id'])
+            if head is not None and head['end_time'] == row['start_time'] and head['start_time'].date() == row['start_time'].date():
+                self.update_session(head, {'end_time': row['end_time'],
+                                           'duration_seconds': head['duration_seconds'] + row['duration_seconds']})
+                merged.append(row)
+            else:
+                chains[row['user_id']] = row
+        for row in merged:
+            self.delete_session(row)
+        return len(merged)
+
+class FakeSupabase:
+    """Remplace le client supabase-py (SupabaseClient.client) : mêmes appels table() et rpc()"""
+
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.database, name)
+
+    def from_(self, name: str) -> FakeQuery:
+        return self.table(name)
+
+    def rpc(self, name: str, params: Optional[Dict] = None) -> FakeRPC:
+        return FakeRPC(self.database, name, params or {})
@@ -0,0 +1,255 @@
+"""Mesure des opérations coûteuses du bot contre une base Supabase simulée en mémoire
+
+    python -m benchmarks.run --members 5000 --sessions-per-member 100
+    python -m benchmarks.run --save-baseline    # enregistre les résultats comme nouvelle référence
+    python -m benchmarks.run --check-time       # compare aussi le temps et la mémoire (même machine uniquement)
+    python -m benchmarks.run --max-rows 250     # lectures plafonnées comme par db-max-rows
+
+Le vrai code des cogs et de SupabaseClient est exécuté ; seul le client supabase-py est remplacé
+par benchmarks.fake_supabase. Pour chaque opération : allers-retours vers la base, appels REST
+à Discord, temps total, temps passé dans la base simulée et pic de mémoire. Le code de sortie est 1
+si une opération fait plus d'allers-retours ou d'appels Discord que la référence enregistrée pour le
+même scénario ; le temps et la mémoire, qui dépendent de la machine, ne sont comparés qu'avec --check-time.
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import datetime
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, Optional
+import benchmarks.environment  # Doit précéder l'import du bot
+
+from database.supabase_client import supabase
+from database.journal import journal
+from cogs.roles import RoleManager
+from cogs.voice_tracking import VoiceTracking
+from cogs.discipline import Discipline
+from cogs.stats import Stats
+from config import MINIMUM_DAILY_MINUTES
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.scenario import Scenario, FakeBot, FakeContext
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+STATS_SAMPLE = 20  # Nombre de commandes /stats exécutées
+TIME_FLOOR = 0.25  # Écart de temps hors base (s) en dessous duquel --check-time ne signale rien
+MEMORY_FLOOR_KIB = 1024  # Écart de pic mémoire en dessous duquel --check-time ne signale rien
+
+class Benchmark:
+    def __init__(self, scenario: Scenario, latency: float, max_rows: Optional[int] = None):
+        self.scenario = scenario
+        self.now = datetime.datetime.now()
+        self.database, self.guild = scenario.build(self.now, latency, max_rows)
+        supabase.client = FakeSupabase(self.database)
+        self.bot = FakeBot(self.guild)
+
+    async def setup(self):
+        # Les cogs sont construits sans cog_load : aucune tâche de fond ne tourne pendant les mesures
+        self.roles = RoleManager(self.bot)
+        self.voice = VoiceTracking(self.bot)
+        self.discipline = Discipline(self.bot)
+        self.discipline.check_discipline.cancel()
+        self.stats = Stats(self.bot)
+        self.stats.aggregate_stats.cancel()
+        for cog in (self.roles, self.voice, self.discipline, self.stats):
+            self.bot.add_cog(cog)
+        # Cache des temps totaux chargé comme après le démarrage : les mesures ne dépendent pas des opérations choisies
+        await self.voice.lifetime.reconcile([member.id for member in self.guild.members], self.now)
+
+    async def drain_roles(self):
+        """Applique les changements de rôles en attente, comme le ferait reconcile_worker"""
+        while self.roles.pending:
+            user_id = next(iter(self.roles.pending))
+            del self.roles.pending[user_id]
+            await self.roles.apply(user_id)
+
+    async def get_leaderboard(self):
+        for period in ('daily', 'weekly', 'monthly', 'yearly', 'all'):
+            await supabase.get_leaderboard(period)
+
+    async def periodic_role_check(self):
+        await self.voice.update_all_roles(self.guild, reconcile=True)
+        await self.drain_roles()
+
+    async def stats_command(self):
+        step = max(1, len(self.guild.members) // STATS_SAMPLE)
+        for member in self.guild.members[::step][:STATS_SAMPLE]:
+            await Stats.stats.callback(self.stats, FakeContext(member))
+
+    async def weekly_warm(self):
+        await self.voice.weekly.warm(self.now)
+
+    async def rankings_warm(self):
+        await self.voice.rankings.warm(self.now)
+
+    async def check_discipline(self):
+        await self.discipline.check_discipline.coro(self.discipline)
+        await self.drain_roles()
+
+    async def check_missed_updates(self):
+        """Rattrapage de 7 jours manqués, tous validés par tous les membres : plus de lignes qu'une page de get_validated_days"""
+        missed_days = 7
+        today = self.now.date()
+        self.database.load_sessions([{
+            'user_id': member.id,
+            'start_time': datetime.datetime.combine(today - datetime.timedelta(days=day), datetime.time(10)),
+            'end_time': datetime.datetime.combine(today - datetime.timedelta(days=day), datetime.time(10))
+                + datetime.timedelta(minutes=MINIMUM_DAILY_MINUTES),
+            'duration_seconds': MINIMUM_DAILY_MINUTES * 60
+        } for member in self.guild.members for day in range(1, missed_days + 1)])
+        levels = {}
+        for row in self.database.rows['user_discipline'].values():
+            row['last_check'] = self.now - datetime.timedelta(days=missed_days + 1)
+            levels[row['user_id']] = row['discipline_level']
+
+        await self.discipline.check_missed_updates()
+        await self.drain_roles()
+
+        # Aucun membre ne doit retomber à 0 : chaque jour manqué est validé
+        wrong = [user_id for user_id, level in levels.items()
+                 if self.database.rows['user_discipline'][user_id]['discipline_level'] != min(level + missed_days, 10)]
+        if wrong:
+            raise AssertionError(f"check_missed_updates : niveau erroné pour {len(wrong)} membre(s) sur {len(levels)}")
+
+    async def aggregate_old_sessions(self):
+        await supabase.aggregate_old_sessions()
+
+    def operations(self) -> Dict[str, Callable[[], Awaitable]]:
+        # Les opérations qui écrivent passent en dernier : l'agrégation supprime les sessions anciennes
+        return {
+            'get_leaderboard': self.get_leaderboard,
+            'periodic_role_check': self.periodic_role_check,
+            'stats': self.stats_command,
+            'weekly_warm': self.weekly_warm,
+            'rankings_warm': self.rankings_warm,
+            'check_discipline': self.check_discipline,
+            'check_missed_updates': self.check_missed_updates,
+            'aggregate_old_sessions': self.aggregate_old_sessions,
+        }
+
+    async def measure(self, operation: Callable[[], Awaitable]) -> Dict:
+        self.database.reset_counters()
+        discord_calls = self.guild.discord_calls
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        await operation()
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - memory_before
+        return {
+            'round_trips': sum(self.database.round_trips.values()),
+            'round_trips_detail': dict(sorted(self.database.round_trips.items())),
+            'discord_calls': self.guild.discord_calls - discord_calls,
+            'wall_seconds': round(wall, 4),
+            # Temps passé dans la base simulée : à retrancher pour juger le code du bot
+            'backend_seconds': round(self.database.backend_seconds, 4),
+            'peak_kib': round(peak / 1024, 1)
+        }
+
+    async def run(self, selected: List[str]) -> Dict[str, Dict]:
+        await self.setup()
+        results = {}
+        tracemalloc.start()
+        try:
+            for name, operation in self.operations().items():
+                if selected and name not in selected:
+                    continue
+                results[name] = await self.measure(operation)
+        finally:
+            tracemalloc.stop()
+            journal.close()
+        return results
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float, check_time: bool = False) -> List[str]:
+    """Régressions par rapport à la référence : tout aller-retour ou appel Discord en plus ;
+    avec check_time, temps ou mémoire au-delà de la tolérance"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for key in ('round_trips', 'discord_calls'):
+            if result[key] > reference[key]:
+                regressions.append(f"{name}: {key} {reference[key]} → {result[key]}")
+        if not check_time:
+            continue
+        client_seconds = result['wall_seconds'] - result['backend_seconds']
+        reference_seconds = reference['wall_seconds'] - reference['backend_seconds']
+        # Un plancher absolu évite de signaler le bruit des opérations de quelques dixièmes de seconde
+        if client_seconds > reference_seconds * (1 + tolerance) and client_seconds - reference_seconds > TIME_FLOOR:
+            regressions.append(f"{name}: temps hors base {reference_seconds:.3f}s → {client_seconds:.3f}s")
+        if result['peak_kib'] > reference['peak_kib'] * (1 + tolerance) and result['peak_kib'] - reference['peak_kib'] > MEMORY_FLOOR_KIB:
+            regressions.append(f"{name}: pic mémoire {reference['peak_kib']:.0f} Kio → {result['peak_kib']:.0f} Kio")
+    return regressions
+
+def print_results(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    header = f"{'opération':<24}{'allers-retours':>16}{'Discord':>9}{'total (s)':>11}{'base (s)':>10}{'pic (Kio)':>11}"
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        reference = baseline.get(name, {})
+        trips = f"{result['round_trips']}" + (f" ({reference['round_trips']})" if reference else '')
+        print(f"{name:<24}{trips:>16}{result['discord_calls']:>9}{result['wall_seconds']:>11.3f}"
+              f"{result['backend_seconds']:>10.3f}{result['peak_kib']:>11.0f}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks du bot contre une base Supabase simulée")
+    parser.add_argument('--members', type=int, default=1000, help="Membres du serveur synthétique (100 à 50 000)")
+    parser.add_argument('--sessions-per-member', type=int, default=50, help="Sessions par membre")
+    parser.add_argument('--days', type=int, default=400, help="Jours d'historique couverts par les sessions")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence simulée par aller-retour, en millisecondes")
+    parser.add_argument('--max-rows', type=int, default=None,
+                        help="Plafond de lignes par lecture, comme db-max-rows de PostgREST (aucun par défaut)")
+    parser.add_argument('--only', nargs='*', default=[], help="Opérations à mesurer (toutes par défaut)")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Fichier de référence")
+    parser.add_argument('--save-baseline', action='store_true', help="Enregistre les résultats comme référence du scénario")
+    parser.add_argument('--check-time', action='store_true',
+                        help="Compare aussi le temps et la mémoire à la référence (seulement sur la machine qui l'a enregistrée)")
+    parser.add_argument('--tolerance', type=float, default=1.0, help="Marge tolérée sur le temps et la mémoire avec --check-time (1.0 = +100%%)")
+    parser.add_argument('--json', action='store_true', help="Affiche les résultats au format JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    scenario = Scenario(args.members, args.sessions_per_member, args.days, args.seed)
+    key = f"members={scenario.members},sessions_per_member={scenario.sessions_per_member},days={scenario.days},seed={scenario.seed},latency={args.latency:g}"
+    if args.max_rows is not None:
+        key += f",max_rows={args.max_rows}"
+
+    started = time.perf_counter()
+    benchmark = Benchmark(scenario, args.latency / 1000, args.max_rows)
+    print(f"Scénario {key} : {len(benchmark.database.sessions)} sessions générées en {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    results = asyncio.run(benchmark.run(args.only))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+    baseline = baselines.get(key, {})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, baseline)
+
+    if args.save_baseline:
+        baselines[key] = {**baseline, **results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Référence enregistrée dans {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not baseline:
+        print("Aucune référence pour ce scénario (--save-baseline pour en créer une)", file=sys.stderr)
+        return 0
+    regressions = compare(results, baseline, args.tolerance, args.check_time)
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import random
+import asyncio
+import datetime
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from config import GUILD_ID, ROLES, PODIUM_ROLES, DISCIPLINE_ROLE_PREFIX
+from benchmarks.fake_supabase import FakeDatabase
+
+@dataclass(frozen=True)
+class FakeRole:
+    id: int
+    name: str
+    default: bool = False
+
+    def is_default(self) -> bool:
+        return self.default
+
+@dataclass(eq=False)
+class FakeMember:
+    """Membre Discord réduit à ce que lisent les cogs ; chaque edit() compte comme un appel REST"""
+    id: int
+    name: str
+    roles: List[FakeRole]
+    guild: 'FakeGuild'
+    bot: bool = False
+
+    @property
+    def display_name(self) -> str:
+        return self.name
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    async def edit(self, *, roles: List[FakeRole], reason: Optional[str] = None):
+        self.guild.discord_calls += 1
+        self.roles = [self.guild.default_role] + [role for role in roles if not role.is_default()]
+
+@dataclass(eq=False)
+class FakeGuild:
+    id: int
+    name: str
+    roles: List[FakeRole]
+    members: List[FakeMember] = field(default_factory=list)
+    voice_channels: List = field(default_factory=list)
+    discord_calls: int = 0
+
+    def __post_init__(self):
+        self.default_role = self.roles[0]
+        self.members_by_id: Dict[int, FakeMember] = {}
+
+    def add_member(self, member: FakeMember):
+        self.members.append(member)
+        self.members_by_id[member.id] = member
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members_by_id.get(user_id)
+
+class FakeContext:
+    """Contexte de commande hybride : seul send() est utilisé"""
+
+    def __init__(self, author: FakeMember):
+        self.author = author
+        self.guild = author.guild
+
+    async def send(self, *args, **kwargs):
+        self.guild.discord_calls += 1
+
+class FakeBot:
+    """Bot réduit aux accès des cogs mesurés ; les cogs sont enregistrés sans démarrer leurs tâches de fond"""
+
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+        self.cogs: Dict[str, object] = {}
+        self.latency = 0.0
+        self.events: Counter = Counter()  # Événements dispatch() émis, par nom
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return asyncio.get_running_loop()
+
+    def add_cog(self, cog):
+        self.cogs[type(cog).__name__] = cog
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guild if guild_id == self.guild.id else None
+
+    def is_ready(self) -> bool:
+        return True
+
+    def dispatch(self, event: str, *args):
+        """Comme discord.py : chaque écouteur on_<event> des cogs enregistrés tourne dans sa propre tâche"""
+        self.events[event] += 1
+        for cog in self.cogs.values():
+            listener = getattr(cog, f'on_{event}', None)
+            if listener is not None:
+                asyncio.create_task(listener(*args))
+
+    async def wait_until_ready(self):
+        return
+
+@dataclass
+class Scenario:
+    """Serveur synthétique : membres, rôles actuels, sessions sur une période et état de discipline"""
+    members: int = 1000
+    sessions_per_member: int = 50
+    days: int = 400  # Historique couvert : au-delà de 180 jours, les sessions sont à agréger
+    seed: int = 42
+
+    def build(self, now: datetime.datetime, latency: float = 0.0, max_rows: Optional[int] = None):
+        rng = random.Random(self.seed)
+        database = FakeDatabase(latency, max_rows)
+
+        role_names = ['@everyone'] + list(ROLES) + [f"{DISCIPLINE_ROLE_PREFIX} {level}" for level in range(1, 11)] \
+            + list(PODIUM_ROLES.values())
+        roles = [FakeRole(index, name, default=index == 0) for index, name in enumerate(role_names)]
+        roles_by_name = {role.name: role for role in roles}
+        guild = FakeGuild(GUILD_ID, 'Benchmark', roles)
+
+        start = now - datetime.timedelta(days=self.days)
+        span = int((now - start).total_seconds())
+        thresholds = sorted(ROLES.items(), key=lambda item: item[1], reverse=True)
+        rows = []
+        for index in range(self.members):
+            user_id = 100_000_000_000_000_000 + index
+            sessions = []
+            for _ in range(self.sessions_per_member):
+                session_start = start + datetime.timedelta(seconds=rng.randrange(span))
+                duration = rng.randrange(5 * 60, 3 * 3600)
+                sessions.append((session_start, duration))
+            sessions.sort()
+            rows.extend({
+                'user_id': user_id,
+                'start_time': session_start,
+                'end_time': session_start + datetime.timedelta(seconds=duration),
+                'duration_seconds': duration
+            } for session_start, duration in sessions)
+
+            # Un membre sur quatre a un rôle de progression périmé : la vérification devra le corriger
+            hours = sum(duration for _, duration in sessions) / 3600
+            role_name = next((name for name, required in thresholds if hours >= required), None)
+            if rng.random() < 0.25:
+                role_name = rng.choice(list(ROLES))
+            member_roles = [guild.default_role] + ([roles_by_name[role_name]] if role_name else [])
+            guild.add_member(FakeMember(user_id, f"membre{index}", member_roles, guild))
+
+            # Dernière vérification de discipline hier : la vérification quotidienne évalue tout le monde
+            database.write_row('user_discipline', {
+                'user_id': user_id,
+                'discipline_level': rng.randrange(0, 11),
+                'best_discipline_level': 10,
+                'last_check': now - datetime.timedelta(days=1, hours=rng.randrange(1, 12))
+            }, None)
+
+        database.load_sessions(rows)
+        return database, guild
@@ -0,0 +1,353 @@
+"""Rejoue des traces d'événements vocaux dans VoiceTracking, sur une horloge simulée
+
+    python -m benchmarks.voice_replay --users 500 --hours 6
+    python -m benchmarks.voice_replay --save-trace trace.jsonl     # enregistre la trace générée
+    python -m benchmarks.voice_replay --trace trace.jsonl          # rejoue une trace enregistrée
+
+Les événements passent par le vrai gestionnaire on_voice_state_update, la file et la tâche
+process_voice_events ; les sauvegardes périodiques (run_checkpoint) sont déclenchées à chaque minute
+de l'horloge simulée. À la fin, le cog est déchargé deux fois comme lors d'un arrêt (SIGTERM puis
+bot.close()), le journal est rejoué vers la base simulée et le temps enregistré par membre et par jour
+est comparé au temps réellement passé en vocal d'après la trace ; l'instantané des sessions actives
+doit contenir exactement les membres encore en vocal. Le code de sortie vaut 1 au moindre écart.
+"""
+import sys
+import json
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+import benchmarks.environment  # Doit précéder l'import du bot
+
+from config import GUILD_ID, VOICE_CHANNEL_PAUSE_ID
+from database.supabase_client import supabase
+from database.journal import journal
+from cogs.voice_tracking import VoiceTracking
+from benchmarks.fake_supabase import FakeDatabase, FakeSupabase
+from benchmarks.scenario import FakeBot, FakeGuild, FakeMember, FakeRole
+
+TRACKED_CHANNELS = (10, 11, 12, 13, 14)  # Salons vocaux suivis de la trace générée, en plus du salon Pause
+
+@dataclass(slots=True)
+class VoiceEvent:
+    """Changement de salon d'un membre (None : hors vocal)"""
+    time: datetime.datetime
+    user_id: int
+    before: Optional[int]
+    after: Optional[int]
+
+@dataclass(slots=True)
+class FakeChannel:
+    id: int
+    name: str
+
+@dataclass(slots=True)
+class FakeVoiceState:
+    channel: Optional[FakeChannel]
+
+class ManualClock:
+    """Horloge avancée à la main par le rejeu"""
+
+    def __init__(self, now: datetime.datetime):
+        self.now = now
+
+    def __call__(self) -> datetime.datetime:
+        return self.now
+
+def is_tracked(channel_id: Optional[int]) -> bool:
+    return channel_id is not None and channel_id != VOICE_CHANNEL_PAUSE_ID
+
+def generate_trace(users: int, hours: float, seed: int, start: datetime.datetime, storms: int = 3) -> List[VoiceEvent]:
+    """Trace synthétique : sessions ordinaires, déplacements, passages en Pause, reconnexions en rafale
+    et vagues d'arrivées et de départs simultanés"""
+    rng = random.Random(seed)
+    end = start + datetime.timedelta(hours=hours)
+    span = int((end - start).total_seconds())
+    # Instants de vague : une partie des membres arrive à la même seconde, puis repart ensemble une demi-heure après
+    storm_times = sorted(rng.randrange(span) for _ in range(storms))
+    events: List[VoiceEvent] = []
+
+    for user_id in range(1, users + 1):
+        channel: Optional[int] = None
+        t = rng.randrange(0, 1800)
+
+        def move(to: Optional[int]):
+            nonlocal channel
+            if to != channel and t < span:
+                events.append(VoiceEvent(start + datetime.timedelta(seconds=t), user_id, channel, to))
+                channel = to
+
+        while t < span:
+            # Hors vocal, ou arrivée calée sur une vague proche
+            storm = next((s for s in storm_times if t <= s < t + 3600), None)
+            t = storm if storm is not None and rng.random() < 0.5 else t + int(rng.expovariate(1 / 1200))
+            move(rng.choice(TRACKED_CHANNELS))
+
+            stay_end = t + int(rng.expovariate(1 / 2700)) + 1
+            if storm is not None and t == storm and rng.random() < 0.7:
+                stay_end = storm + 1800
+            while t < min(stay_end, span):
+                behaviour = rng.random()
+                if behaviour < 0.15:
+                    # Déplacement entre salons suivis : aucun effet sur le temps
+                    move(rng.choice([c for c in TRACKED_CHANNELS if c != channel]))
+                elif behaviour < 0.25:
+                    # Pause de quelques minutes puis retour
+                    move(VOICE_CHANNEL_PAUSE_ID)
+                    t += rng.randrange(60, 900)
+                    move(rng.choice(TRACKED_CHANNELS))
+                elif behaviour < 0.35:
+                    # Connexion instable : déconnexions et reconnexions à quelques secondes d'intervalle
+                    for _ in range(rng.randrange(3, 9)):
+                        current = channel
+                        move(None)
+                        t += rng.randrange(0, 3)
+                        move(current)
+                        t += rng.randrange(1, 4)
+                t += rng.randrange(60, 1200)
+            t = min(t, stay_end)
+            move(None)
+            t += 1
+
+    events.sort(key=lambda event: (event.time, event.user_id))
+    return events
+
+def save_trace(path: str, events: List[VoiceEvent], end: datetime.datetime):
+    with open(path, 'w', encoding='utf-8') as file:
+        for event in events:
+            file.write(json.dumps({'time': event.time.isoformat(), 'user_id': event.user_id,
+                                   'before': event.before, 'after': event.after}) + '\n')
+        file.write(json.dumps({'end': end.isoformat()}) + '\n')
+
+def load_trace(path: str) -> Tuple[List[VoiceEvent], datetime.datetime]:
+    """Trace au format JSON lines ; une ligne {"end": ...} fixe la fin, sinon le dernier événement"""
+    events, end = [], None
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if 'end' in row:
+                end = datetime.datetime.fromisoformat(row['end'])
+                continue
+            events.append(VoiceEvent(datetime.datetime.fromisoformat(row['time']), row['user_id'], row['before'], row['after']))
+    events.sort(key=lambda event: event.time)
+    return events, end or events[-1].time
+
+def present_at_end(events: List[VoiceEvent]) -> Set[int]:
+    """Membres dans un salon suivi à la fin de la trace"""
+    present: Set[int] = set()
+    for event in events:
+        if is_tracked(event.after):
+            present.add(event.user_id)
+        else:
+            present.discard(event.user_id)
+    return present
+
+def ground_truth(events: List[VoiceEvent], end: datetime.datetime) -> Tuple[Dict[Tuple[int, datetime.date], float], Dict[int, int]]:
+    """Secondes passées dans un salon suivi par membre et par jour d'après la trace seule,
+    et nombre de tronçons (session × jour) de chaque membre"""
+    seconds: Dict[Tuple[int, datetime.date], float] = {}
+    pieces: Dict[int, int] = {}
+    since: Dict[int, datetime.datetime] = {}
+
+    def close(user_id: int, until: datetime.datetime):
+        moment = since.pop(user_id)
+        while moment < until:
+            midnight = datetime.datetime.combine(moment.date() + datetime.timedelta(days=1), datetime.time())
+            piece_end = min(until, midnight)
+            key = (user_id, moment.date())
+            seconds[key] = seconds.get(key, 0) + (piece_end - moment).total_seconds()
+            pieces[user_id] = pieces.get(user_id, 0) + 1
+            moment = piece_end
+
+    for event in events:
+        if is_tracked(event.after) and event.user_id not in since:
+            since[event.user_id] = event.time
+        elif not is_tracked(event.after) and event.user_id in since:
+            close(event.user_id, event.time)
+    for user_id in list(since):
+        close(user_id, end)
+    return seconds, pieces
+
+class VoiceReplay:
+    def __init__(self, events: List[VoiceEvent], end: datetime.datetime, start: Optional[datetime.datetime] = None):
+        self.events = events
+        self.end = end
+        self.start = start or (events[0].time if events else end)
+        self.clock = ManualClock(self.start)
+        self.stats = {'checkpoints': 0, 'segments': 0, 'journal_appends': 0,
+                      'max_active_sessions': 0, 'max_tasks': 0, 'max_threshold_timers': 0}
+
+    async def checkpoint(self, voice: VoiceTracking, moment: datetime.datetime):
+        # Les événements antérieurs doivent être appliqués avant la sauvegarde, comme en temps réel
+        await voice.voice_events.join()
+        self.clock.now = moment
+        self.stats['checkpoints'] += 1
+        await voice.run_checkpoint(moment)
+        self.stats['max_active_sessions'] = max(self.stats['max_active_sessions'], len(voice.active_sessions))
+        self.stats['max_tasks'] = max(self.stats['max_tasks'], len(asyncio.all_tasks()))
+        self.stats['max_threshold_timers'] = max(self.stats['max_threshold_timers'], len(voice.threshold_timers))
+
+    async def run(self) -> Dict:
+        database = FakeDatabase()
+        supabase.client = FakeSupabase(database)
+        guild = FakeGuild(GUILD_ID, 'Replay', [FakeRole(0, '@everyone', default=True)])
+        channels = {channel_id: FakeChannel(channel_id, f"salon-{channel_id}")
+                    for event in self.events for channel_id in (event.before, event.after) if channel_id is not None}
+        for user_id in sorted({event.user_id for event in self.events}):
+            guild.add_member(FakeMember(user_id, f"membre{user_id}", [guild.default_role], guild))
+
+        bot = FakeBot(guild)
+        voice = VoiceTracking(bot, clock=self.clock)
+        bot.add_cog(voice)
+        # Cache des temps totaux chargé (base vide) : les seuils sont programmés comme en production
+        await voice.lifetime.reconcile([member.id for member in guild.members], self.clock())
+        # Démarrage comme après on_ready : personne en vocal, l'instantané (vide) est lu avant toute sauvegarde
+        await voice.restore_sessions()
+
+        # Volume écrit dans le journal à chaque lot (événements et sauvegardes périodiques)
+        append = journal.append
+
+        async def counted_append(sessions):
+            self.stats['journal_appends'] += 1
+            self.stats['segments'] += len(sessions)
+            await append(sessions)
+
+        journal.append = counted_append
+        consumer = asyncio.create_task(voice.process_voice_events())
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        next_checkpoint = self.start + datetime.timedelta(seconds=voice.session_save_interval)
+        for event in self.events:
+            while next_checkpoint <= event.time:
+                await self.checkpoint(voice, next_checkpoint)
+                next_checkpoint += datetime.timedelta(seconds=voice.session_save_interval)
+            self.clock.now = event.time
+            member = guild.get_member(event.user_id)
+            await voice.on_voice_state_update(
+                member,
+                FakeVoiceState(channels.get(event.before)),
+                FakeVoiceState(channels.get(event.after))
+            )
+        while next_checkpoint < self.end:
+            await self.checkpoint(voice, next_checkpoint)
+            next_checkpoint += datetime.timedelta(seconds=voice.session_save_interval)
+        await self.checkpoint(voice, self.end)
+        wall = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        journal.append = append
+        # Arrêt comme lors d'un déploiement : le second déchargement ne doit pas écraser l'instantané
+        voice.voice_event_task = consumer
+        await voice.cog_unload()
+        await voice.cog_unload()
+        snapshot = {row['user_id'] for row in voice._read_snapshot()}
+        # Rejeu du journal vers la base simulée, comme le ferait replay_forever
+        while await journal.replay_once():
+            pass
+        journal.close()
+        # Classement du jour en cours à la fin de la trace, incrémenté à chaque écriture
+        voice.rankings.roll(self.end)
+
+        return {
+            'events': len(self.events),
+            'users': len(guild.members),
+            'simulated_hours': round((self.end - self.start).total_seconds() / 3600, 2),
+            'wall_seconds': round(wall, 3),
+            'events_per_second': round(len(self.events) / wall) if wall else None,
+            **self.stats,
+            'database_round_trips': sum(database.round_trips.values()),
+            'peak_kib': round(peak / 1024, 1),
+            'recorded': {(user_id, day): seconds
+                         for user_id, days in database.daily_by_user.items() for day, seconds in days.items()},
+            'lifetime': dict(voice.lifetime.totals),
+            'daily_ranking': dict(voice.rankings.indexes['daily'].totals),
+            'ranking_day': self.end.date(),
+            'snapshot': snapshot
+        }
+
+def check(report: Dict, truth: Dict[Tuple[int, datetime.date], float], pieces: Dict[int, int], present: Set[int]) -> List[str]:
+    """Écarts entre le temps enregistré et la trace : exact pour une trace à la seconde,
+    sinon moins d'une seconde perdue par tronçon (les fractions de la dernière seconde ne sont pas comptées)"""
+    integral = all(float(seconds).is_integer() for seconds in truth.values())
+    errors = []
+
+    def compare(label: str, expected: float, actual: int, allowance: int):
+        difference = expected - actual
+        if (integral and difference != 0) or not 0 <= difference < max(1, allowance):
+            errors.append(f"{label}: attendu {expected:.0f}s, enregistré {actual}s")
+
+    recorded = report['recorded']
+    for key in sorted(set(truth) | set(recorded)):
+        if truth.get(key, 0) or recorded.get(key, 0):
+            compare(f"membre {key[0]} le {key[1]}", truth.get(key, 0), recorded.get(key, 0), pieces.get(key[0], 0))
+
+    totals: Dict[int, float] = {}
+    for (user_id, _), seconds in truth.items():
+        totals[user_id] = totals.get(user_id, 0) + seconds
+    for user_id in sorted(set(totals) | set(report['lifetime'])):
+        compare(f"membre {user_id} (cache des temps totaux)", totals.get(user_id, 0),
+                report['lifetime'].get(user_id, 0), pieces.get(user_id, 0))
+
+    day = report['ranking_day']
+    for user_id in sorted({user_id for user_id, key_day in truth if key_day == day} | set(report['daily_ranking'])):
+        compare(f"membre {user_id} (classement du jour)", truth.get((user_id, day), 0),
+                report['daily_ranking'].get(user_id, 0), pieces.get(user_id, 0))
+
+    if report['snapshot'] != present:
+        errors.append(f"instantané après arrêt: {len(present)} membre(s) en vocal attendu(s), {len(report['snapshot'])} enregistré(s)")
+    return errors
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rejeu de traces vocales dans VoiceTracking sur une horloge simulée")
+    parser.add_argument('--users', type=int, default=300, help="Membres de la trace générée")
+    parser.add_argument('--hours', type=float, default=4, help="Durée de la trace générée")
+    parser.add_argument('--storms', type=int, default=3, help="Vagues d'arrivées et de départs simultanés")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--start', default='2024-03-09T22:00:00', help="Début de la trace générée (passage de minuit compris par défaut)")
+    parser.add_argument('--trace', help="Trace enregistrée à rejouer (JSON lines) au lieu d'une trace générée")
+    parser.add_argument('--save-trace', help="Enregistre la trace rejouée")
+    parser.add_argument('--json', action='store_true', help="Affiche le rapport au format JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    start = None
+    if args.trace:
+        events, end = load_trace(args.trace)
+    else:
+        start = datetime.datetime.fromisoformat(args.start)
+        events = generate_trace(args.users, args.hours, args.seed, start, args.storms)
+        end = start + datetime.timedelta(hours=args.hours)
+    if not events:
+        print("Trace vide", file=sys.stderr)
+        return 1
+    if args.save_trace:
+        save_trace(args.save_trace, events, end)
+
+    truth, pieces = ground_truth(events, end)
+    report = asyncio.run(VoiceReplay(events, end, start).run())
+    errors = check(report, truth, pieces, present_at_end(events))
+
+    summary = {key: value for key, value in report.items() if key not in ('recorded', 'lifetime', 'daily_ranking', 'ranking_day', 'snapshot')}
+    summary['snapshot_sessions'] = len(report['snapshot'])
+    summary['tracked_seconds'] = int(sum(truth.values()))
+    summary['mismatches'] = len(errors)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for key, value in summary.items():
+            print(f"{key:<24}{value}")
+    for error in errors[:20]:
+        print(f"ÉCART {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
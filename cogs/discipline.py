@@ -2,9 +2,11 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from datetime import datetime, timedelta
-from config import MINIMUM_DAILY_MINUTES
+from typing import List, Set
+from config import MINIMUM_DAILY_MINUTES, DISCIPLINE_ROLE_PREFIX
 from database.supabase_client import supabase
 import logging
+import asyncio
 import os
 
 logger = logging.getLogger('Focusbot')
@@ -12,123 +14,170 @@ logger = logging.getLogger('Focusbot')
 class Discipline(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.catch_up_task = None
         self.check_discipline.start()
 
     async def cog_load(self):
-        """Vérifie les mises à jour manquées lors du chargement du cog"""
-        await self.check_missed_updates()
+        """Lance le rattrapage des mises à jour manquées en arrière-plan, sans bloquer le démarrage"""
+        self.catch_up_task = asyncio.create_task(self.check_missed_updates())
+
+    @staticmethod
+    def parse_last_check(value: str) -> datetime:
+        """Date de dernière vérification en heure locale naïve, comme toutes les dates du bot"""
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+
+    @staticmethod
+    def replay_missed_days(discipline_level: int, missed_days: List, validated_days: Set) -> int:
+        """Rejoue jour par jour la règle de discipline : +1 par jour validé (10 maximum), retour à 0 au premier jour manqué"""
+        for day in missed_days:
+            if day in validated_days:
+                discipline_level = min(discipline_level + 1, 10)
+            else:
+                return 0
+        return discipline_level
 
     async def check_missed_updates(self):
         """Vérifie et effectue les mises à jour manquées depuis la dernière exécution"""
         try:
-            # Récupérer tous les utilisateurs
-            response = supabase.client.table('user_discipline').select('*').execute()
-            users = response.data
+            now = datetime.now()
+            users = await supabase.get_all_discipline()
+
+            # Jours manqués de chaque utilisateur : jours complets seulement, entre sa dernière vérification et aujourd'hui exclus
+            # (aujourd'hui n'est pas terminé et sera évalué par la vérification quotidienne)
+            missed = {}
+            for user in users:
+                last_check = self.parse_last_check(user['last_check'])
+                days_to_check = min((now.date() - last_check.date()).days - 1, 7)  # Maximum 7 jours
+                if days_to_check >= 1:
+                    missed[user['user_id']] = [last_check.date() + timedelta(days=day + 1) for day in range(days_to_check)]
+
+            if not missed:
+                logger.info("Aucune mise à jour de discipline manquée")
+                return
 
+            # Une seule requête pour toute la plage manquée, tous utilisateurs confondus
+            validated = await supabase.get_validated_days(
+                min(days[0] for days in missed.values()),
+                max(days[-1] for days in missed.values()),
+                MINIMUM_DAILY_MINUTES * 60  # MINIMUM_DAILY_MINUTES en secondes
+            )
+
+            updates = []
+            changed = []
             for user in users:
-                user_id = user['user_id']
-                last_check = datetime.fromisoformat(user['last_check'])
-                now = datetime.now()
-
-                # Si la dernière vérification date de plus d'un jour
-                if (now - last_check).days >= 1:
-                    # Calculer le nombre de jours à vérifier
-                    days_to_check = min((now - last_check).days, 7)  # Maximum 7 jours
-                    
-                    # Vérifier les jours manqués
-                    for day in range(days_to_check):
-                        check_date = last_check + timedelta(days=day+1)
-                        # Vérifier le temps passé en vocal pour ce jour
-                        day_stats = await supabase.get_day_stats(user_id, check_date)
-                        if day_stats and day_stats['total_seconds'] >= MINIMUM_DAILY_MINUTES * 60:  # MINIMUM_DAILY_MINUTES en secondes
-                            await self.update_discipline(user_id, user['discipline_level'] + 1)
-                        else:
-                            await self.update_discipline(user_id, 0)
-                            break  # Arrêter si un jour n'est pas validé
-
-            logger.info("Vérification des mises à jour manquées terminée")
+                missed_days = missed.get(user['user_id'])
+                if not missed_days:
+                    continue
+                discipline_level = self.replay_missed_days(
+                    user['discipline_level'], missed_days, validated.get(user['user_id'], set())
+                )
+                # Seul l'état final est écrit
+                updates.append({
+                    'user_id': user['user_id'],
+                    'discipline_level': discipline_level,
+                    'best_discipline_level': max(user['best_discipline_level'], discipline_level),
+                    'last_check': now.isoformat()
+                })
+                if discipline_level != user['discipline_level']:
+                    changed.append((user['user_id'], discipline_level))
+
+            await supabase.upsert_discipline(updates)
+
+            # Les rôles ne peuvent être mis à jour qu'une fois le serveur disponible
+            await self.bot.wait_until_ready()
+            for user_id, discipline_level in changed:
+                await self.update_discord_role(user_id, discipline_level)
+
+            logger.info(f"Vérification des mises à jour manquées terminée: {len(updates)} utilisateur(s) rattrapé(s), {len(changed)} niveau(x) modifié(s)")
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Erreur lors de la vérification des mises à jour manquées: {e}")
 
     def cog_unload(self):
         """Arrête les tâches planifiées lors du déchargement du cog"""
         self.check_discipline.cancel()
+        if self.catch_up_task:
+            self.catch_up_task.cancel()
 
     @tasks.loop(hours=24)
     async def check_discipline(self):
         """Vérifie la discipline de tous les utilisateurs chaque jour à minuit"""
         try:
-            # Récupérer tous les utilisateurs
-            response = supabase.client.table('user_discipline').select('*').execute()
-            users = response.data
+            # Le rattrapage écrit lui aussi last_check : il doit être terminé avant l'évaluation quotidienne
+            if self.catch_up_task and not self.catch_up_task.done():
+                await asyncio.wait([self.catch_up_task])
+
+            # Jours validés des 7 derniers jours complets, pour tous les utilisateurs en une requête
+            today = datetime.now().date()
+            users = await supabase.get_discipline_window(
+                today - timedelta(days=7),
+                today - timedelta(days=1),
+                MINIMUM_DAILY_MINUTES * 60  # MINIMUM_DAILY_MINUTES en secondes
+            )
 
+            now = datetime.now()
+            updates = []
+            changed = []
             for user in users:
-                user_id = user['user_id']
-                # Vérifier les 7 derniers jours
-                last_7_days_stats = await supabase.get_period_stats(user_id, 'weekly')
-                if not last_7_days_stats:
-                    logger.warning(f"Impossible de récupérer les stats pour l'utilisateur {user_id} pour la discipline.")
+                # Déjà évalué aujourd'hui (redémarrage ou rattrapage) : ne pas compter deux fois
+                if self.parse_last_check(user['last_check']).date() >= today:
                     continue
 
-                # Calculer le nombre de jours validés (MINIMUM_DAILY_MINUTES minimum)
-                validated_days = 0
-                for day_stats in last_7_days_stats:
-                    if day_stats['total_seconds'] >= MINIMUM_DAILY_MINUTES * 60:  # MINIMUM_DAILY_MINUTES en secondes
-                        validated_days += 1
-
-                # Mettre à jour le niveau de discipline
-                if validated_days >= 5:  # Au moins 5 jours sur 7
-                    await self.update_discipline(user_id, user['discipline_level'] + 1)
+                # Au moins 5 jours sur 7 : niveau suivant (10 maximum), sinon retour à 0
+                if user['validated_days'] >= 5:
+                    discipline_level = min(user['discipline_level'] + 1, 10)
                 else:
-                    await self.update_discipline(user_id, 0)
+                    discipline_level = 0
+
+                updates.append({
+                    'user_id': user['user_id'],
+                    'discipline_level': discipline_level,
+                    'best_discipline_level': max(user['best_discipline_level'], discipline_level),
+                    'last_check': now.isoformat()
+                })
+                if discipline_level != user['discipline_level']:
+                    changed.append((user['user_id'], discipline_level))
+
+            await supabase.upsert_discipline(updates)
+
+            # Seuls les niveaux qui ont changé touchent aux rôles Discord
+            for user_id, discipline_level in changed:
+                await self.update_discord_role(user_id, discipline_level)
+
+            logger.info(f"Discipline vérifiée pour {len(updates)} utilisateur(s), {len(changed)} niveau(x) modifié(s)")
 
         except Exception as e:
             logger.error(f"Erreur lors de la vérification de la discipline: {e}")
 
-    async def update_discipline(self, user_id: int, discipline_level: int) -> None:
-        """Met à jour le niveau de discipline d'un utilisateur"""
+    @commands.Cog.listener()
+    async def on_daily_minimum_reached(self, member: discord.Member, day):
+        """Prolonge le streak d'un membre dès qu'il atteint le minimum quotidien, une seule fois par jour"""
         try:
-            # Limiter le niveau de discipline à 10
-            discipline_level = min(discipline_level, 10)
-            
-            # Récupérer les données actuelles
-            current_data = await supabase.get_user_discipline(user_id)
-            if current_data:
-                # Mettre à jour le meilleur niveau si nécessaire
-                best_level = max(current_data['best_discipline_level'], discipline_level)
-            else:
-                best_level = discipline_level
-
-            # Mettre à jour la discipline avec la date actuelle
-            await supabase.update_discipline(user_id, discipline_level, best_level, datetime.now())
-            
-            # Mettre à jour le rôle Discord
-            await self.update_discord_role(user_id, discipline_level)
-            
+            streak = await supabase.get_user_streak(member.id)
+            last_active = datetime.fromisoformat(streak['last_active_date']).date() \
+                if streak and streak.get('last_active_date') else None
+            if last_active == day:
+                return  # Déjà compté aujourd'hui (redémarrage ou nouvelle session)
+
+            # Le streak continue si le membre était actif la veille, sinon il repart à 1
+            current_streak = streak['current_streak'] + 1 if last_active == day - timedelta(days=1) else 1
+            longest_streak = max(streak['longest_streak'] if streak else 0, current_streak)
+            await supabase.update_streak(member.id, current_streak, longest_streak, day)
         except Exception as e:
-            logger.error(f"Erreur lors de la mise à jour de la discipline: {e}")
+            logger.error(f"Erreur lors de la mise à jour du streak de {member.name}: {e}")
 
     async def update_discord_role(self, user_id: int, discipline_level: int) -> None:
         """Met à jour le rôle Discord en fonction du niveau de discipline"""
         try:
-            # Récupérer le serveur et l'utilisateur
-            guild = self.bot.guilds[0]  # Premier serveur
-            member = guild.get_member(user_id)
-            if not member:
+            role_manager = self.bot.get_cog('RoleManager')
+            if not role_manager:
+                logger.error("Le cog RoleManager n'a pas été trouvé.")
                 return
 
-            # Supprimer tous les rôles de discipline existants
-            discipline_roles = [role for role in guild.roles if role.name.startswith("Discipline")]
-            for role in discipline_roles:
-                if role in member.roles:
-                    await member.remove_roles(role)
-
-            # Ajouter le nouveau rôle si le niveau est > 0
-            if discipline_level > 0:
-                role_name = f"Discipline {discipline_level}"
-                role = discord.utils.get(guild.roles, name=role_name)
-                if role:
-                    await member.add_roles(role)
+            # Un seul rôle de discipline, aucun sous le niveau 1 ; rien n'est envoyé si le membre l'a déjà
+            role_name = f"{DISCIPLINE_ROLE_PREFIX} {discipline_level}" if discipline_level > 0 else None
+            role_manager.set_role(user_id, 'discipline', role_name)
 
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour du rôle: {e}")
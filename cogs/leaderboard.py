@@ -3,20 +3,19 @@ from discord.ext import commands, tasks
 from discord import app_commands
 import datetime
 from config import REPORT_CONFIG, STATISTIQUES_CHANNEL_ID, GENERAL_CHANNEL_ID
-from database.supabase_client import supabase
+from database.supabase_client import supabase, get_period_start
+from database.rank_index import RankIndex
 import logging
-from typing import List, Tuple
-from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger('Focusbot')
 
+LEADERBOARD_PAGE_SIZE = 10  # Membres affichés par page de classement
+
 class Leaderboard(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.daily_report.start()
-        self.weekly_report.start()
-        self.monthly_report.start()
-        self.yearly_report.start()
+        self.scheduled_reports.start()
 
     def format_duration(self, total_seconds: int) -> str:
         """Formate une durée en secondes en format h/min/s"""
@@ -33,45 +32,64 @@ class Leaderboard(commands.Cog):
 
     def cog_unload(self):
         """Arrête les tâches planifiées lors du déchargement du cog"""
-        self.daily_report.cancel()
-        self.weekly_report.cancel()
-        self.monthly_report.cancel()
-        self.yearly_report.cancel()
-
-    @tasks.loop(time=datetime.time(23, 59))
-    async def daily_report(self):
-        """Rapport journalier"""
-        await self.send_report('daily')
-
-    @tasks.loop(time=datetime.time(23, 59))
-    async def weekly_report(self):
-        """Rapport hebdomadaire"""
-        if datetime.datetime.now().strftime('%A').lower() == 'sunday':
-            await self.send_report('weekly')
-
-    @tasks.loop(time=datetime.time(0, 0))
-    async def monthly_report(self):
-        """Rapport mensuel"""
-        if datetime.datetime.now().day == 1:
-            await self.send_report('monthly')
-
-    @tasks.loop(time=datetime.time(0, 0))
-    async def yearly_report(self):
-        """Rapport annuel"""
-        now = datetime.datetime.now()
-        if now.month == 1 and now.day == 1:
-            await self.send_report('yearly')
-
-    async def send_report(self, report_type: str):
+        self.scheduled_reports.cancel()
+
+    @staticmethod
+    def get_due_reports(now: datetime.datetime) -> Tuple[Dict[str, datetime.date], datetime.date]:
+        """Débuts des périodes dont le rapport est dû à cette échéance, et fin commune (exclue) de ces périodes"""
+        today = now.date()
+        if now.hour >= 12:
+            # 23h59 : journée en cours, et semaine en cours le dimanche
+            starts = {'daily': today}
+            if today.weekday() == 6:  # 6 = dimanche
+                starts['weekly'] = today - datetime.timedelta(days=6)
+            return starts, today + datetime.timedelta(days=1)
+
+        # 00h00 : le mois (ou l'année) qui vient de se terminer
+        starts = {}
+        yesterday = today - datetime.timedelta(days=1)
+        if today.day == 1:
+            starts['monthly'] = yesterday.replace(day=1)
+            if today.month == 1:
+                starts['yearly'] = yesterday.replace(month=1, day=1)
+        return starts, today
+
+    @tasks.loop(time=[datetime.time(23, 59), datetime.time(0, 0)])
+    async def scheduled_reports(self):
+        """Rapports journalier et hebdomadaire à 23h59, mensuel et annuel à 00h00, calculés en une seule requête"""
+        try:
+            starts, end = self.get_due_reports(datetime.datetime.now())
+            if not starts:
+                return
+
+            leaderboards = await supabase.get_period_leaderboards(starts, end, limit=10)
+
+            for report_type in ('daily', 'weekly', 'monthly', 'yearly'):
+                if report_type in starts:
+                    await self.send_report(report_type, leaderboards[report_type])
+
+            # Le résumé hebdomadaire du podium reprend le classement de la semaine
+            if 'weekly' in starts:
+                podium_cog = self.bot.get_cog('Podium')
+                if podium_cog:
+                    ranking = [(entry['user_id'], entry['total_seconds'] / 3600) for entry in leaderboards['weekly']]
+                    await podium_cog.weekly_summary(ranking)
+
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul des rapports planifiés: {e}")
+
+    @scheduled_reports.before_loop
+    async def before_scheduled_reports(self):
+        """Attend que le bot soit prêt avant de planifier les rapports"""
+        await self.bot.wait_until_ready()
+
+    async def send_report(self, report_type: str, leaderboard: List[Dict]):
         """Envoie un rapport de classement dans les canaux configurés"""
         try:
             # Récupérer la configuration du rapport
             config = REPORT_CONFIG[report_type]
             
-            # Récupérer les données du classement
-            leaderboard_data = await self.get_leaderboard_data(report_type)
-            
-            if not leaderboard_data:
+            if not leaderboard:
                 return
             
             # Créer l'embed du classement
@@ -81,13 +99,12 @@ class Leaderboard(commands.Cog):
             )
             
             # Ajouter les utilisateurs au classement
-            for i, (user_id, total_seconds) in enumerate(leaderboard_data[:10], 1):
-                user = self.bot.get_user(user_id)
+            for i, entry in enumerate(leaderboard[:10], 1):
+                user = self.bot.get_user(entry['user_id'])
                 if user:
-                    hours, minutes, seconds = self.format_duration(total_seconds)
                     embed.add_field(
                         name=f"{i}. {user.name}",
-                        value=f"`{hours}h {minutes}m {seconds}s`",
+                        value=f"`{self.format_duration(entry['total_seconds'])}`",
                         inline=False
                     )
             
@@ -101,15 +118,32 @@ class Leaderboard(commands.Cog):
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi du rapport {report_type}: {e}")
 
-    async def send_leaderboard(self, interaction: discord.Interaction, period: str, title: str):
-        """Envoie un classement pour une période donnée"""
+    async def get_leaderboard_page(self, period: str, page: int) -> Tuple[List[Dict], Optional[int], Optional[RankIndex]]:
+        """Page du classement : (entrées, nombre total de participants, index des rangs s'il est chargé)"""
+        offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+
+        voice_tracking_cog = self.bot.get_cog('VoiceTracking')
+        index = voice_tracking_cog.get_rank_index(period) if voice_tracking_cog else None
+        if index is not None:
+            entries = [
+                {'user_id': user_id, 'total_seconds': total_seconds}
+                for user_id, total_seconds in index.page(offset, LEADERBOARD_PAGE_SIZE)
+            ]
+            return entries, len(index), index
+
+        # Index pas encore chargé (démarrage) : page agrégée côté serveur
+        result = await supabase.get_leaderboard_page(get_period_start(period), limit=LEADERBOARD_PAGE_SIZE, offset=offset)
+        return result['entries'], result['total_count'], None
+
+    async def send_leaderboard(self, interaction: discord.Interaction, period: str, title: str, page: int = 1):
+        """Envoie une page du classement pour une période donnée, avec la position de l'utilisateur"""
         await interaction.response.defer(ephemeral=True)
         
         try:
-            # Récupérer les statistiques de tous les utilisateurs
-            response = await supabase.get_leaderboard(period)
+            response, total_count, index = await self.get_leaderboard_page(period, page)
             if not response:
-                await interaction.followup.send("Aucune donnée disponible pour le classement.", ephemeral=True)
+                message = "Aucune donnée disponible pour le classement." if page == 1 else "Cette page du classement est vide."
+                await interaction.followup.send(message, ephemeral=True)
                 return
 
             # Créer l'embed pour le classement
@@ -119,8 +153,9 @@ class Leaderboard(commands.Cog):
                 color=discord.Color.gold()
             )
 
-            # Ajouter les 10 premiers au classement
-            for i, user in enumerate(response[:10], 1):
+            # Ajouter les membres de la page au classement
+            offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+            for i, user in enumerate(response[:LEADERBOARD_PAGE_SIZE], offset + 1):
                 member = interaction.guild.get_member(user['user_id'])
                 if member:
                     username = member.display_name
@@ -131,8 +166,21 @@ class Leaderboard(commands.Cog):
                         inline=False
                     )
 
+            # Position de l'utilisateur, lue dans l'index sans trier le classement
+            if index is not None:
+                rank = index.rank(interaction.user.id)
+                if rank:
+                    value = f"#{rank} sur {total_count} — ⏱️ {self.format_duration(index.totals[interaction.user.id])}"
+                else:
+                    value = "Pas encore de temps enregistré sur cette période"
+                embed.add_field(name="Votre position", value=value, inline=False)
+
             # Ajouter le footer
-            embed.set_footer(text="Le classement est mis à jour en temps réel")
+            footer = "Le classement est mis à jour en temps réel"
+            if total_count:
+                pages = (total_count + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+                footer = f"Page {page}/{pages} • {footer}"
+            embed.set_footer(text=footer)
 
             await interaction.followup.send(embed=embed, ephemeral=True)
             
@@ -141,62 +189,28 @@ class Leaderboard(commands.Cog):
             await interaction.followup.send("Une erreur est survenue lors de la récupération du classement.", ephemeral=True)
 
     @app_commands.command(name="classement", description="Affiche le classement journalier")
-    async def daily_leaderboard(self, interaction: discord.Interaction):
+    @app_commands.describe(page="Page du classement (10 membres par page)")
+    async def daily_leaderboard(self, interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
         """Commande /classement pour afficher le classement journalier"""
-        await self.send_leaderboard(interaction, 'daily', "Classement Journalier")
+        await self.send_leaderboard(interaction, 'daily', "Classement Journalier", page)
 
     @app_commands.command(name="classement-semaine", description="Affiche le classement hebdomadaire")
-    async def weekly_leaderboard(self, interaction: discord.Interaction):
+    @app_commands.describe(page="Page du classement (10 membres par page)")
+    async def weekly_leaderboard(self, interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
         """Commande /classement-semaine pour afficher le classement hebdomadaire"""
-        await self.send_leaderboard(interaction, 'weekly', "Classement Hebdomadaire")
+        await self.send_leaderboard(interaction, 'weekly', "Classement Hebdomadaire", page)
 
     @app_commands.command(name="classement-mois", description="Affiche le classement mensuel")
-    async def monthly_leaderboard(self, interaction: discord.Interaction):
+    @app_commands.describe(page="Page du classement (10 membres par page)")
+    async def monthly_leaderboard(self, interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
         """Commande /classement-mois pour afficher le classement mensuel"""
-        await self.send_leaderboard(interaction, 'monthly', "Classement Mensuel")
+        await self.send_leaderboard(interaction, 'monthly', "Classement Mensuel", page)
 
     @app_commands.command(name="classement-annee", description="Affiche le classement annuel")
-    async def yearly_leaderboard(self, interaction: discord.Interaction):
+    @app_commands.describe(page="Page du classement (10 membres par page)")
+    async def yearly_leaderboard(self, interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
         """Commande /classement-annee pour afficher le classement annuel"""
-        await self.send_leaderboard(interaction, 'yearly', "Classement Annuel")
-
-    async def get_leaderboard_data(self, period: str) -> List[Tuple[int, int]]:
-        """Récupère les données du classement pour une période donnée"""
-        try:
-            # Définir la date de début en fonction de la période
-            now = datetime.now()
-            if period == 'daily':
-                start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'weekly':
-                start_date = now - timedelta(days=now.weekday())
-                start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'monthly':
-                start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'yearly':
-                start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-            else:
-                return []
-
-            # Récupérer les données depuis la base de données
-            response = supabase.client.table('sessions').select('user_id, duration_seconds').gte('start_time', start_date.isoformat()).execute()
-            
-            if not response.data:
-                return []
-
-            # Calculer le temps total par utilisateur
-            user_times = {}
-            for session in response.data:
-                user_id = session['user_id']
-                duration = session['duration_seconds']
-                user_times[user_id] = user_times.get(user_id, 0) + duration
-
-            # Trier les utilisateurs par temps total
-            sorted_users = sorted(user_times.items(), key=lambda x: x[1], reverse=True)
-            return sorted_users
-
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération des données du classement: {e}")
-            return []
+        await self.send_leaderboard(interaction, 'yearly', "Classement Annuel", page)
 
 async def setup(bot):
     await bot.add_cog(Leaderboard(bot)) 
\ No newline at end of file
@@ -0,0 +1,198 @@
+import discord
+from discord.ext import commands, tasks
+from discord import app_commands
+from aiohttp import web
+import asyncio
+import functools
+import logging
+import time
+from typing import Optional
+from config import METRICS_HOST, METRICS_PORT, LOOP_WATCHDOG_THRESHOLD
+from database.journal import journal
+from metrics import registry, track_job
+from loop_watchdog import LoopWatchdog
+
+logger = logging.getLogger('Focusbot')
+
+discord_requests_total = registry.counter(
+    'focusbot_discord_requests_total', 'Appels à l\'API REST de Discord', ('method', 'route', 'status')
+)
+discord_request_seconds = registry.histogram(
+    'focusbot_discord_request_seconds', 'Durée des appels à l\'API REST de Discord, attente des limites de débit comprise', ('method', 'route')
+)
+event_loop_lag_seconds = registry.histogram(
+    'focusbot_event_loop_lag_seconds', 'Retard de la boucle d\'événements sur un réveil programmé',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+event_loop_lag_max = registry.gauge(
+    'focusbot_event_loop_lag_max_seconds', 'Plus grand retard de la boucle d\'événements depuis le dernier export'
+)
+journal_pending = registry.gauge(
+    'focusbot_journal_pending_sessions', 'Sessions du journal local en attente d\'envoi à Supabase'
+)
+
+class Monitoring(commands.Cog):
+    """Expose les métriques du bot au format Prometheus sur un point d'accès HTTP local"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.runner: Optional[web.AppRunner] = None
+        self.original_request = None
+        self.lag_task: Optional[asyncio.Task] = None
+        self.lag_interval = 1.0  # secondes entre deux mesures du retard de la boucle
+        self.max_lag = 0.0
+        self.watchdog = LoopWatchdog(LOOP_WATCHDOG_THRESHOLD)
+        self.reported_stalls = 0  # Blocages déjà couverts par le dernier rapport périodique
+
+        # Jauges lues au moment de l'export
+        registry.gauge('focusbot_active_sessions', 'Sessions vocales suivies',
+                       callback=lambda: len(self.bot.get_cog('VoiceTracking').active_sessions))
+        registry.gauge('focusbot_voice_event_queue', 'Événements vocaux en attente de traitement',
+                       callback=lambda: self.bot.get_cog('VoiceTracking').voice_events.qsize())
+        registry.gauge('focusbot_threshold_timers', 'Seuils de rôle et de minimum quotidien programmés',
+                       callback=lambda: len(self.bot.get_cog('VoiceTracking').timer_generations))
+        registry.gauge('focusbot_role_updates_pending', 'Membres en attente d\'une mise à jour de rôles',
+                       callback=lambda: len(self.bot.get_cog('RoleManager').pending))
+        registry.gauge('focusbot_gateway_latency_seconds', 'Latence de la passerelle Discord',
+                       callback=lambda: self.bot.latency)
+
+    async def cog_load(self):
+        """Instrumente le bot et démarre le point d'accès des métriques"""
+        self.instrument_http()
+        self.instrument_loops()
+        self.lag_task = self.bot.loop.create_task(self.measure_loop_lag())
+        self.journal_gauge.start()
+        self.watchdog.start(asyncio.get_running_loop())
+        self.stall_report.start()
+
+        if METRICS_PORT:
+            app = web.Application()
+            app.router.add_get('/metrics', self.handle_metrics)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, METRICS_HOST, METRICS_PORT).start()
+            logger.info(f"Métriques disponibles sur http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+    async def cog_unload(self):
+        """Arrête le point d'accès et retire l'instrumentation"""
+        self.journal_gauge.cancel()
+        self.stall_report.cancel()
+        self.watchdog.stop()
+        if self.lag_task:
+            self.lag_task.cancel()
+        if self.original_request is not None:
+            self.bot.http.request = self.original_request
+            self.original_request = None
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = registry.render()
+        self.max_lag = 0.0
+        return web.Response(text=body, content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+    def instrument_http(self):
+        """Compte chaque appel REST à Discord par route (modèle de chemin, sans identifiants)"""
+        original_request = self.bot.http.request
+
+        @functools.wraps(original_request)
+        async def request(route, **kwargs):
+            start = time.perf_counter()
+            status = 'ok'
+            try:
+                return await original_request(route, **kwargs)
+            except discord.HTTPException as e:
+                status = str(e.status)
+                raise
+            except Exception:
+                status = 'error'
+                raise
+            finally:
+                discord_request_seconds.observe(time.perf_counter() - start, method=route.method, route=route.path)
+                discord_requests_total.inc(method=route.method, route=route.path, status=status)
+
+        self.original_request = original_request
+        self.bot.http.request = request
+
+    def instrument_loops(self):
+        """Mesure la durée de chaque itération des tâches tasks.loop des cogs chargés"""
+        for cog in self.bot.cogs.values():
+            for name, attribute in type(cog).__dict__.items():
+                if not isinstance(attribute, tasks.Loop):
+                    continue
+                loop = getattr(cog, name)  # Copie propre à l'instance, celle qui tourne
+                if getattr(loop.coro, '__wrapped_job__', None):
+                    continue
+                loop.coro = self.timed_job(f'{type(cog).__name__}.{name}', loop.coro)
+
+    @staticmethod
+    def timed_job(job: str, coro):
+        @functools.wraps(coro)
+        async def wrapper(*args, **kwargs):
+            with track_job(job):
+                return await coro(*args, **kwargs)
+        wrapper.__wrapped_job__ = job
+        return wrapper
+
+    async def measure_loop_lag(self):
+        """Mesure le retard de la boucle d'événements sur un réveil programmé"""
+        while True:
+            try:
+                start = time.perf_counter()
+                await asyncio.sleep(self.lag_interval)
+                lag = max(0.0, time.perf_counter() - start - self.lag_interval)
+                event_loop_lag_seconds.observe(lag)
+                self.max_lag = max(self.max_lag, lag)
+                event_loop_lag_max.set(self.max_lag)
+            except asyncio.CancelledError:
+                break
+
+    @tasks.loop(seconds=30)
+    async def journal_gauge(self):
+        """Relève le nombre de sessions du journal en attente d'envoi"""
+        try:
+            journal_pending.set(await journal.pending_count())
+        except Exception as e:
+            logger.error(f"Erreur lors de la lecture du journal pour les métriques: {e}")
+
+    def format_offenders(self, limit: int) -> str:
+        lines = []
+        for offender in self.watchdog.worst(limit):
+            origin = f"{offender.location} (/{offender.command})" if offender.command else offender.location
+            lines.append(f"`{origin}` : {offender.count} fois, {offender.total_seconds:.2f}s au total, pire {offender.max_seconds:.2f}s")
+        return '\n'.join(lines)
+
+    @tasks.loop(hours=1)
+    async def stall_report(self):
+        """Résume dans les logs les pires blocages de la boucle, s'il y en a eu depuis le dernier rapport"""
+        stalls = self.watchdog.total_stalls()
+        if stalls > self.reported_stalls:
+            logger.warning(f"{stalls - self.reported_stalls} blocage(s) de la boucle d'événements depuis le dernier rapport, pires origines:\n{self.format_offenders(5)}")
+        self.reported_stalls = stalls
+
+    @app_commands.command(name="lenteurs", description="Affiche le code qui a le plus bloqué le bot")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.checks.has_permissions(administrator=True)
+    async def lenteurs(self, interaction: discord.Interaction, reinitialiser: bool = False):
+        """Liste les origines des blocages de la boucle d'événements depuis le démarrage"""
+        try:
+            summary = self.format_offenders(10)
+            embed = discord.Embed(
+                title="🐢 Blocages de la boucle d'événements",
+                description=summary or f"Aucun blocage de plus de {LOOP_WATCHDOG_THRESHOLD}s depuis le démarrage.",
+                color=discord.Color.orange()
+            )
+            worst = self.watchdog.worst(1)
+            if worst:
+                # Pile du pire blocage, tronquée à la limite d'un champ
+                embed.add_field(name="Dernière pile du pire blocage", value=f"```{worst[0].last_stack[-1000:]}```", inline=False)
+            if reinitialiser:
+                self.watchdog.reset()
+                self.reported_stalls = 0
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'affichage des blocages: {e}")
+            await interaction.response.send_message("Une erreur est survenue lors de la récupération des blocages.", ephemeral=True)
+
+async def setup(bot):
+    await bot.add_cog(Monitoring(bot))
@@ -4,16 +4,10 @@ import datetime
 from typing import Dict, List, Optional, Tuple
 import random
 import logging
-from database.supabase_client import supabase
-from config import CLASSEMENT_LIVE_CHANNEL_ID, GUILD_ID
+from config import CLASSEMENT_LIVE_CHANNEL_ID, GUILD_ID, PODIUM_ROLES
 
 logger = logging.getLogger('Focusbot')
 
-# Configuration des rôles et salons
-ROLE_TOP_1_NAME = "🥇N°1 de la semaine"
-ROLE_TOP_2_NAME = "🥈N°2 de la semaine"
-ROLE_TOP_3_NAME = "🥉N°3 de la semaine"
-
 # Messages pour les changements de position
 PODIUM_MESSAGES = {
     "TOP_1": [
@@ -53,76 +47,50 @@ class Podium(commands.Cog):
         self.stable_since: Optional[datetime.datetime] = None
         self.last_message_time: Optional[datetime.datetime] = None
         self.check_podium.start()
-        self.weekly_summary.start()
 
     def cog_unload(self):
         """Arrête les tâches périodiques lors du déchargement du cog"""
         self.check_podium.cancel()
-        self.weekly_summary.cancel()
 
-    async def get_weekly_ranking(self) -> List[Tuple[int, float]]:
-        """Récupère le classement hebdomadaire des temps vocaux"""
-        try:
-            # Calculer la date de début (7 jours avant)
-            start_date = datetime.datetime.now() - datetime.timedelta(days=7)
-            
-            # Récupérer les sessions des 7 derniers jours
-            response = supabase.client.table('sessions')\
-                .select('user_id, duration_seconds')\
-                .gte('start_time', start_date.isoformat())\
-                .execute()
-            
-            # Calculer le total par utilisateur
-            user_totals = {}
-            for session in response.data:
-                user_id = session['user_id']
-                if user_id not in user_totals:
-                    user_totals[user_id] = 0
-                user_totals[user_id] += session['duration_seconds']
-            
-            # Convertir en liste et trier
-            ranking = [(user_id, total/3600) for user_id, total in user_totals.items()]
-            ranking.sort(key=lambda x: x[1], reverse=True)
-            
-            return ranking
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération du classement hebdomadaire: {e}")
-            return []
+    def get_weekly_ranking(self) -> Optional[List[Tuple[int, float]]]:
+        """Récupère le classement hebdomadaire des temps vocaux ; None tant que le classement glissant n'est pas chargé
+
+        Aucune requête de secours : la vérification tourne toutes les 10 secondes et une agrégation
+        des sessions des 7 derniers jours à ce rythme surchargerait la base pendant le chargement.
+        """
+        # Classement glissant tenu en mémoire par le suivi vocal, sans requête
+        voice_tracking_cog = self.bot.get_cog('VoiceTracking')
+        if not voice_tracking_cog:
+            return None
+        top = voice_tracking_cog.get_weekly_top(10)
+        if top is None:
+            return None
+        return [(user_id, seconds / 3600) for user_id, seconds in top]
 
     async def update_roles(self, guild: discord.Guild, new_top3: Dict[int, int]):
         """Met à jour les rôles du podium"""
         try:
-            # Récupérer les rôles
-            role_top1 = discord.utils.get(guild.roles, name=ROLE_TOP_1_NAME)
-            role_top2 = discord.utils.get(guild.roles, name=ROLE_TOP_2_NAME)
-            role_top3 = discord.utils.get(guild.roles, name=ROLE_TOP_3_NAME)
-            
-            if not all([role_top1, role_top2, role_top3]):
+            role_manager = self.bot.get_cog('RoleManager')
+            if not role_manager:
+                logger.error("Le cog RoleManager n'a pas été trouvé.")
+                return
+
+            podium_roles = [role_manager.get_role(role_name) for role_name in PODIUM_ROLES.values()]
+            if not all(podium_roles):
                 logger.error("Un ou plusieurs rôles du podium sont manquants")
                 return
-            
-            # Retirer les anciens rôles
-            for position, user_id in self.current_top3.items():
-                member = guild.get_member(user_id)
-                if member:
-                    if position == 1:
-                        await member.remove_roles(role_top1)
-                    elif position == 2:
-                        await member.remove_roles(role_top2)
-                    elif position == 3:
-                        await member.remove_roles(role_top3)
-            
-            # Attribuer les nouveaux rôles
+
+            # Retirer le rôle des membres sortis du podium : détenteurs actuels (y compris d'avant un redémarrage),
+            # ancien top 3 et membres dont le rôle demandé n'a pas encore été appliqué
+            holders = {member.id for role in podium_roles for member in role.members}
+            previous = holders | set(self.current_top3.values()) | role_manager.requested('podium')
+            for user_id in previous - set(new_top3.values()):
+                role_manager.set_role(user_id, 'podium', None)
+
+            # Attribuer les nouveaux rôles ; une position inchangée ne coûte aucun appel
             for position, user_id in new_top3.items():
-                member = guild.get_member(user_id)
-                if member:
-                    if position == 1:
-                        await member.add_roles(role_top1)
-                    elif position == 2:
-                        await member.add_roles(role_top2)
-                    elif position == 3:
-                        await member.add_roles(role_top3)
-            
+                role_manager.set_role(user_id, 'podium', PODIUM_ROLES[position])
+
             self.current_top3 = new_top3.copy()
             
         except Exception as e:
@@ -146,9 +114,9 @@ class Podium(commands.Cog):
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi du message de podium: {e}")
 
-    @tasks.loop(minutes=5)
+    @tasks.loop(seconds=10)
     async def check_podium(self):
-        """Vérifie et met à jour le podium toutes les 5 minutes"""
+        """Vérifie et met à jour le podium toutes les 10 secondes"""
         try:
             guild = self.bot.get_guild(GUILD_ID)
             if not guild:
@@ -159,8 +127,8 @@ class Podium(commands.Cog):
                 logger.error(f"Canal de classement non trouvé (ID: {CLASSEMENT_LIVE_CHANNEL_ID})")
                 return
             
-            # Récupérer le classement actuel
-            ranking = await self.get_weekly_ranking()
+            # Récupérer le classement actuel ; tant qu'il n'est pas chargé, le podium et ses rôles restent en l'état
+            ranking = self.get_weekly_ranking()
             if not ranking:
                 return
             
@@ -201,13 +169,9 @@ class Podium(commands.Cog):
         except Exception as e:
             logger.error(f"Erreur lors de la vérification du podium: {e}")
 
-    @tasks.loop(time=datetime.time(23, 59))
-    async def weekly_summary(self):
-        """Envoie le résumé hebdomadaire chaque dimanche à 23h59"""
+    async def weekly_summary(self, ranking: List[Tuple[int, float]]):
+        """Envoie le résumé hebdomadaire ; appelé chaque dimanche à 23h59 avec le classement de la semaine calculé pour les rapports"""
         try:
-            if datetime.datetime.now().weekday() != 6:  # 6 = dimanche
-                return
-            
             guild = self.bot.get_guild(GUILD_ID)
             if not guild:
                 return
@@ -217,8 +181,6 @@ class Podium(commands.Cog):
                 logger.error(f"Canal de classement non trouvé (ID: {CLASSEMENT_LIVE_CHANNEL_ID})")
                 return
             
-            # Récupérer le classement final
-            ranking = await self.get_weekly_ranking()
             if not ranking:
                 return
             
@@ -238,11 +200,9 @@ class Podium(commands.Cog):
             message += "Chacun repart de zéro. À qui l'effort donnera-t-il raison cette fois ?"
             
             await channel.send(message)
-            
-            # Réinitialiser le podium
-            self.current_top3 = {}
-            self.previous_top3 = {}
-            self.stable_since = None
+
+            # Le podium suit les 7 derniers jours glissants, pas la semaine calendaire : le vider ici ferait
+            # retirer puis rendre les mêmes rôles au même top 3, annoncé une seconde fois, 15 minutes plus tard
             
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi du résumé hebdomadaire: {e}")
@@ -252,10 +212,5 @@ class Podium(commands.Cog):
         """Attend que le bot soit prêt avant de démarrer la vérification"""
         await self.bot.wait_until_ready()
 
-    @weekly_summary.before_loop
-    async def before_weekly_summary(self):
-        """Attend que le bot soit prêt avant de démarrer le résumé hebdomadaire"""
-        await self.bot.wait_until_ready()
-
 async def setup(bot):
     await bot.add_cog(Podium(bot)) 
\ No newline at end of file
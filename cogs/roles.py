@@ -0,0 +1,166 @@
+import discord
+from discord.ext import commands
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Union
+from config import GUILD_ID, ROLES, PODIUM_ROLES, DISCIPLINE_ROLE_PREFIX
+
+logger = logging.getLogger('Focusbot')
+
+def role_category(role_name: str) -> Optional[str]:
+    """Catégorie d'un rôle géré par le bot (progression, discipline ou podium), None pour les autres rôles"""
+    if role_name in ROLES:
+        return 'progression'
+    if role_name.startswith(DISCIPLINE_ROLE_PREFIX):
+        return 'discipline'
+    if role_name in PODIUM_ROLES.values():
+        return 'podium'
+    return None
+
+class RoleManager(commands.Cog):
+    """Seul point d'écriture des rôles gérés : chaque membre reçoit au plus un appel member.edit par changement réel"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.roles_by_name: Dict[str, discord.Role] = {}
+        # Rôle voulu par catégorie pour chaque membre (None : aucun rôle de cette catégorie)
+        self.desired: Dict[int, Dict[str, Optional[str]]] = {}
+        # Membres à recaler, dans l'ordre des demandes ; un membre n'y figure qu'une fois
+        self.pending: Dict[int, None] = {}
+        self.wakeup = asyncio.Event()
+        self.missing_roles = set()  # Rôles introuvables déjà signalés
+        self.worker_task: Optional[asyncio.Task] = None
+
+    async def cog_load(self):
+        """Démarre l'application des changements de rôles en arrière-plan"""
+        self.worker_task = self.bot.loop.create_task(self.reconcile_worker())
+
+    def cog_unload(self):
+        """Arrête l'application des changements de rôles"""
+        if self.worker_task:
+            self.worker_task.cancel()
+
+    def index_roles(self, guild: discord.Guild):
+        """Reconstruit l'index nom -> rôle du serveur"""
+        roles_by_name = {}
+        for role in guild.roles:
+            # Comme discord.utils.get : le premier rôle portant ce nom l'emporte
+            roles_by_name.setdefault(role.name, role)
+        self.roles_by_name = roles_by_name
+
+    def get_role(self, role_name: str) -> Optional[discord.Role]:
+        """Rôle du serveur portant ce nom"""
+        if not self.roles_by_name:
+            guild = self.bot.get_guild(GUILD_ID)
+            if guild:
+                self.index_roles(guild)
+        return self.roles_by_name.get(role_name)
+
+    def set_role(self, member: Union[discord.Member, int], category: str, role_name: Optional[str]) -> bool:
+        """Fixe le rôle voulu d'un membre dans une catégorie et programme la mise à jour si elle change quelque chose"""
+        user_id = member if isinstance(member, int) else member.id
+        self.desired.setdefault(user_id, {})[category] = role_name
+
+        if isinstance(member, int):
+            member = self.get_member(user_id)
+        if member is not None and self.desired_roles(member) is None:
+            return False
+
+        self.pending[user_id] = None
+        self.wakeup.set()
+        return True
+
+    def requested(self, category: str) -> Set[int]:
+        """Membres pour qui un rôle de cette catégorie est demandé, qu'il soit déjà appliqué ou encore en attente"""
+        return {user_id for user_id, wanted in self.desired.items() if wanted.get(category) is not None}
+
+    def get_member(self, user_id: int) -> Optional[discord.Member]:
+        guild = self.bot.get_guild(GUILD_ID)
+        return guild.get_member(user_id) if guild else None
+
+    def desired_roles(self, member: discord.Member) -> Optional[List[discord.Role]]:
+        """Liste complète des rôles voulus pour un membre, None si elle est identique à ses rôles actuels"""
+        wanted = self.desired.get(member.id, {})
+        current = [role for role in member.roles if not role.is_default()]
+
+        # Les rôles non gérés, ou d'une catégorie sans demande, sont conservés tels quels
+        roles = [role for role in current if role_category(role.name) not in wanted]
+        for role_name in wanted.values():
+            if role_name is None:
+                continue
+            role = self.get_role(role_name)
+            if role is None:
+                if role_name not in self.missing_roles:
+                    self.missing_roles.add(role_name)
+                    logger.error(f"Rôle '{role_name}' introuvable sur le serveur")
+                # Sans le rôle voulu, le rôle actuel de la catégorie est conservé
+                roles.extend(r for r in current if r.name != role_name and role_category(r.name) == role_category(role_name))
+                continue
+            roles.append(role)
+
+        if set(roles) == set(current):
+            return None
+        return roles
+
+    async def apply(self, user_id: int):
+        """Applique en un seul appel les rôles voulus d'un membre"""
+        member = self.get_member(user_id)
+        if member is None:
+            return
+        roles = self.desired_roles(member)
+        if roles is None:
+            return
+
+        added = [role.name for role in roles if role not in member.roles]
+        removed = [role.name for role in member.roles if not role.is_default() and role not in roles]
+        await member.edit(roles=roles, reason="Mise à jour des rôles Focusbot")
+        logger.info(f"Rôles de {member.name} mis à jour (ajoutés: {added}, retirés: {removed})")
+
+    async def reconcile_worker(self):
+        """Applique les changements de rôles un membre à la fois, au rythme permis par Discord"""
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(GUILD_ID)
+        if guild:
+            self.index_roles(guild)
+
+        while True:
+            try:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.pending:
+                    user_id = next(iter(self.pending))
+                    del self.pending[user_id]
+                    try:
+                        await self.apply(user_id)
+                    except discord.HTTPException as e:
+                        logger.error(f"Erreur lors de la mise à jour des rôles de {user_id}: {e}")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Erreur lors de l'application des changements de rôles: {e}")
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        # Après une reconnexion, les rôles ont pu changer sans événement reçu
+        if guild.id == GUILD_ID:
+            self.index_roles(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        if role.guild.id == GUILD_ID:
+            self.index_roles(role.guild)
+            self.missing_roles.discard(role.name)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if after.guild.id == GUILD_ID and before.name != after.name:
+            self.index_roles(after.guild)
+            self.missing_roles.discard(after.name)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        if role.guild.id == GUILD_ID:
+            self.index_roles(role.guild)
+
+async def setup(bot):
+    await bot.add_cog(RoleManager(bot))
@@ -1,9 +1,10 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from datetime import datetime, timedelta
+from datetime import datetime
 from config import ROLES
 from database.supabase_client import supabase
+from database.journal import journal
 import logging
 from discord.ext import tasks
 
@@ -20,7 +21,7 @@ class Stats(commands.Cog):
 
     @tasks.loop(hours=24)
     async def aggregate_stats(self):
-        """Agrège les anciennes sessions une fois par mois"""
+        """Compacte les sessions chaque jour et agrège les anciennes sessions une fois par mois"""
         try:
             # Vérifier si c'est le premier jour du mois
             now = datetime.now()
@@ -30,6 +31,15 @@ class Stats(commands.Cog):
         except Exception as e:
             logger.error(f"Erreur lors de l'agrégation mensuelle: {e}")
 
+        try:
+            # Une ligne encore dans le journal serait réinsérée par le rejeu après sa fusion et comptée deux fois :
+            # le rejeu reste suspendu pendant le compactage, qui attend un journal vide
+            async with journal.drained("Compactage des sessions") as drained:
+                if drained:
+                    await supabase.compact_sessions()
+        except Exception as e:
+            logger.error(f"Erreur lors du compactage des sessions: {e}")
+
     @aggregate_stats.before_loop
     async def before_aggregate_stats(self):
         """Attend que le bot soit prêt avant de démarrer la tâche"""
@@ -51,20 +61,19 @@ class Stats(commands.Cog):
     async def get_period_stats(self, user_id: int, period: str) -> dict:
         """Récupère les statistiques pour une période donnée"""
         try:
-            now = datetime.now()
-            if period == 'day':
-                start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'week':
-                start_date = now - timedelta(days=now.weekday())
-                start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'month':
-                start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            else:  # all
-                start_date = datetime.min
-
-            response = supabase.client.table('sessions').select('duration_seconds').eq('user_id', user_id).gte('start_time', start_date.isoformat()).execute()
-            
-            total_seconds = sum(session['duration_seconds'] for session in response.data)
+            if period == 'all':
+                # Temps total : cache en mémoire, ou cumul quotidien + mois archivés
+                voice_tracking = self.bot.get_cog('VoiceTracking')
+                total_seconds = voice_tracking.get_lifetime_seconds(user_id) if voice_tracking else None
+                if total_seconds is None:
+                    stats = await supabase.get_user_stats(user_id)
+                    total_seconds = stats['total_seconds']
+                return {'total_seconds': total_seconds}
+
+            # Lecture du cumul quotidien (day, week, month)
+            periods = {'day': 'daily', 'week': 'weekly', 'month': 'monthly'}
+            daily_stats = await supabase.get_period_stats(user_id, periods[period])
+            total_seconds = sum(day['total_seconds'] for day in daily_stats or [])
             return {'total_seconds': total_seconds}
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des stats: {e}")
@@ -119,12 +128,17 @@ class Stats(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            stats = await supabase.get_user_stats(interaction.user.id)
-            if not stats:
-                await interaction.followup.send("Aucune statistique trouvée.", ephemeral=True)
-                return
-
-            current_hours = stats['total_hours']
+            # Temps total en mémoire, session en cours comprise ; la base n'est lue que si le cache n'est pas prêt
+            voice_tracking = self.bot.get_cog('VoiceTracking')
+            total_seconds = voice_tracking.get_lifetime_seconds(interaction.user.id) if voice_tracking else None
+            if total_seconds is None:
+                stats = await supabase.get_user_stats(interaction.user.id)
+                if not stats:
+                    await interaction.followup.send("Aucune statistique trouvée.", ephemeral=True)
+                    return
+                total_seconds = stats['total_seconds']
+
+            current_hours = total_seconds / 3600
             next_role, hours_needed = self.get_next_role(current_hours)
             
             if next_role:
@@ -135,7 +149,7 @@ class Stats(commands.Cog):
                 )
                 embed.add_field(
                     name="⏱️ Temps Actuel",
-                    value=self.format_duration(stats['total_seconds']),
+                    value=self.format_duration(total_seconds),
                     inline=True
                 )
                 embed.add_field(
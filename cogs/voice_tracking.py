@@ -2,44 +2,170 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import datetime
-from config import VOICE_CHANNEL_PAUSE_ID, MINIMUM_DAILY_MINUTES, ROLES, GUILD_ID
+import uuid
+import os
+import json
+from dataclasses import dataclass, field
+from config import VOICE_CHANNEL_PAUSE_ID, MINIMUM_DAILY_MINUTES, ROLES, GUILD_ID, VOICE_EVENT_QUEUE_SIZE, STARTUP_WARMUP_CONCURRENCY, SESSION_SNAPSHOT_PATH
 from database.supabase_client import supabase
+from database.journal import journal
+from database.lifetime_cache import LifetimeCache
+from database.weekly_ranking import WeeklyRanking
+from database.rank_index import PeriodRankings, RankIndex
+from metrics import track_job
 import logging
 import asyncio
-from typing import Optional, Dict
+import heapq
+import itertools
+from typing import Callable, Optional, Dict, List, Tuple
 
 logger = logging.getLogger('Focusbot')
 
+@dataclass(slots=True)
+class ActiveSession:
+    """Session vocale en cours d'un membre, enregistrée comme une seule ligne ouverte par jour"""
+    user_id: int
+    start_time: datetime.datetime
+    last_save: datetime.datetime
+    session_key: str = field(default_factory=lambda: str(uuid.uuid4()))
+    saved_seconds: int = 0
+
+    def checkpoint(self, now: datetime.datetime) -> List[Dict]:
+        """Avance le point de sauvegarde et retourne l'état à jour de la ligne ouverte (plusieurs lignes si minuit est passé)"""
+        records = []
+
+        # Une ligne ne déborde jamais sur le jour suivant : elle est close à minuit et une nouvelle commence
+        next_midnight = datetime.datetime.combine(self.start_time.date() + datetime.timedelta(days=1), datetime.time())
+        while now >= next_midnight:
+            record = self._advance(next_midnight)
+            if record:
+                records.append(record)
+            self.start_time = self.last_save = next_midnight
+            self.session_key = str(uuid.uuid4())
+            self.saved_seconds = 0
+            next_midnight += datetime.timedelta(days=1)
+
+        record = self._advance(now)
+        if record:
+            records.append(record)
+        return records
+
+    def _advance(self, until: datetime.datetime) -> Optional[Dict]:
+        duration_seconds = int((until - self.last_save).total_seconds())
+        if duration_seconds < 1:
+            return None
+
+        # Les fractions de seconde restent acquises pour le point de sauvegarde suivant
+        segment_start = self.last_save
+        self.last_save += datetime.timedelta(seconds=duration_seconds)
+        self.saved_seconds += duration_seconds
+        return {
+            'session_key': self.session_key,
+            'user_id': self.user_id,
+            'start_time': self.start_time,
+            'end_time': self.last_save,
+            'duration_seconds': self.saved_seconds,
+            # Portion ajoutée par ce point de sauvegarde
+            'segment_start': segment_start,
+            'delta_seconds': duration_seconds
+        }
+
 class VoiceTracking(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, clock: Callable[[], datetime.datetime] = datetime.datetime.now):
         self.bot = bot
-        self.active_sessions: Dict[int, Dict] = {}  # {user_id: {'start_time': datetime, 'last_save': datetime}}
-        self.session_tasks: Dict[int, asyncio.Task] = {}  # {user_id: task}
+        # Heure courante : remplaçable pour rejouer des traces d'événements vocaux sur une horloge simulée
+        self.clock = clock
+        self.active_sessions: Dict[int, ActiveSession] = {}  # {user_id: ActiveSession}
+        # File bornée des entrées/sorties : en cas de rafale, les gestionnaires attendent que le traitement suive
+        self.voice_events: asyncio.Queue = asyncio.Queue(maxsize=VOICE_EVENT_QUEUE_SIZE)
         self.role_check_task: Optional[asyncio.Task] = None
-        self.role_check_interval = 300  # 5 minutes
+        self.checkpoint_task: Optional[asyncio.Task] = None
+        self.voice_event_task: Optional[asyncio.Task] = None
+        self.journal_replay_task: Optional[asyncio.Task] = None
+        self.threshold_task: Optional[asyncio.Task] = None
+        self.weekly_warmup_task: Optional[asyncio.Task] = None
+        self.rankings_warmup_task: Optional[asyncio.Task] = None
+        self.lifetime_warmup_task: Optional[asyncio.Task] = None
+        self.lifetime = LifetimeCache()  # Temps total de chaque membre, incrémenté à chaque écriture
+        self.weekly = WeeklyRanking()  # Classement des 7 derniers jours, incrémenté à chaque écriture
+        self.rankings = PeriodRankings()  # Classements ordonnés du jour, de la semaine, du mois et de l'année
+        # Les chargements de démarrage se partagent un nombre borné de créneaux pour ne pas saturer Supabase
+        self.warmup_limit = asyncio.Semaphore(STARTUP_WARMUP_CONCURRENCY)
+        # Minuteur unique : tas de (échéance, user_id, génération) ; une entrée dont la génération n'est plus celle du membre est ignorée
+        self.threshold_timers: List[Tuple[datetime.datetime, int, int]] = []
+        self.timer_generations: Dict[int, int] = {}
+        self.timer_sequence = itertools.count()
+        self.threshold_wakeup = asyncio.Event()
+        self.daily_minimum_notified: Dict[int, datetime.date] = {}  # Dernier jour où le minimum quotidien a été signalé
+        self.role_check_interval = 3600  # 1 heure : les promotions sont déclenchées par les minuteurs, ceci n'est qu'une vérification
+        self.lifetime_reconcile_interval = 3600  # 1 heure
+        self.lifetime_retry_interval = 60  # 1 minute entre deux tentatives tant que le cache n'est pas chargé
+        self.reconcile_lock = asyncio.Lock()
         self.session_save_interval = 60  # 1 minute
+        self.voice_event_batch_size = 500  # Événements traités par écriture dans le journal
+        self.snapshot_max_gap = 900  # 15 minutes : au-delà, une interruption n'est pas comptée comme du temps en vocal
+        self.sessions_restored = False
+        self.unloaded = False
         
     async def cog_load(self):
-        """Démarre la vérification périodique des rôles"""
+        """Démarre la vérification périodique des rôles, les sauvegardes groupées et le rejeu du journal"""
         self.role_check_task = self.bot.loop.create_task(self.periodic_role_check())
+        self.checkpoint_task = self.bot.loop.create_task(self.checkpoint_scheduler())
+        self.voice_event_task = self.bot.loop.create_task(self.process_voice_events())
+        self.journal_replay_task = self.bot.loop.create_task(journal.replay_forever())
+        self.threshold_task = self.bot.loop.create_task(self.threshold_timer())
+        # Rechargement du cog sur un bot déjà connecté : on_ready ne sera pas redéclenché
+        if self.bot.is_ready():
+            self.bot.loop.create_task(self.restore_sessions())
+        self.weekly_warmup_task = self.bot.loop.create_task(self.warm_in_background(self.weekly, "du classement hebdomadaire"))
+        self.rankings_warmup_task = self.bot.loop.create_task(self.warm_in_background(self.rankings, "des classements"))
+        self.lifetime_warmup_task = self.bot.loop.create_task(self.warm_lifetime())
         
     async def cog_unload(self):
-        """Arrête la vérification périodique des rôles et nettoie les sessions actives"""
-        if self.role_check_task:
-            self.role_check_task.cancel()
-            try:
-                await self.role_check_task
-            except asyncio.CancelledError:
-                pass
+        """Arrête les tâches de fond et enregistre les sessions actives"""
+        # Un second déchargement (bot.close() après un arrêt manuel) écraserait l'instantané par une liste vide
+        if self.unloaded:
+            return
+        self.unloaded = True
+
+        for task in (self.role_check_task, self.checkpoint_task, self.voice_event_task, self.threshold_task,
+                     self.weekly_warmup_task, self.rankings_warmup_task, self.lifetime_warmup_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        # Traiter les événements encore en file puis sauvegarder toutes les sessions actives
+        events = []
+        while not self.voice_events.empty():
+            events.append(self.voice_events.get_nowait())
+        segments = self.apply_voice_events(events)
+        now = self.clock()
+        for session in self.active_sessions.values():
+            segments.extend(session.checkpoint(now))
+        await self.write_segments(segments)
 
-        # Nettoyer toutes les sessions actives
-        for user_id, task in list(self.session_tasks.items()):
-            task.cancel()
+        # Les sessions restent ouvertes dans l'instantané : elles reprennent au redémarrage si le membre est toujours là
+        try:
+            await self.save_snapshot()
+        except Exception as e:
+            logger.error(f"Erreur lors de l'enregistrement des sessions actives: {e}")
+        self.active_sessions.clear()
+
+        # Dernière tentative d'envoi ; ce qui reste est conservé dans le journal pour le prochain démarrage
+        if self.journal_replay_task:
+            self.journal_replay_task.cancel()
             try:
-                await task
+                await self.journal_replay_task
             except asyncio.CancelledError:
                 pass
-            await self.save_session(user_id)
+        try:
+            while await journal.replay_once():
+                pass
+        except Exception as e:
+            logger.warning(f"Sessions conservées dans le journal local pour le prochain démarrage: {e}")
         
     async def periodic_role_check(self):
         """Vérifie périodiquement les rôles de tous les membres"""
@@ -47,15 +173,8 @@ class VoiceTracking(commands.Cog):
             try:
                 guild = self.bot.get_guild(GUILD_ID)
                 if guild:
-                    for member in guild.members:
-                        if not member.bot:
-                            try:
-                                stats = await supabase.get_user_stats(member.id)
-                                if stats:
-                                    await self.update_user_role(member, stats['total_hours'])
-                            except Exception as e:
-                                logger.error(f"Erreur lors de la vérification du rôle pour {member.name}: {e}")
-                                continue
+                    with track_job('role_check'):
+                        await self.update_all_roles(guild)
                 await asyncio.sleep(self.role_check_interval)
             except asyncio.CancelledError:
                 logger.info("Vérification périodique des rôles annulée")
@@ -64,65 +183,390 @@ class VoiceTracking(commands.Cog):
                 logger.error(f"Erreur lors de la vérification périodique des rôles: {e}")
                 await asyncio.sleep(60)  # Attendre 1 minute en cas d'erreur
 
-    async def save_session(self, user_id: int) -> bool:
-        """Sauvegarde une session vocale"""
-        if user_id not in self.active_sessions:
-            return False
+    async def checkpoint_scheduler(self):
+        """Sauvegarde toutes les sessions actives en un seul lot à chaque intervalle"""
+        while True:
+            try:
+                await asyncio.sleep(self.session_save_interval)
+                with track_job('checkpoint'):
+                    await self.run_checkpoint(self.clock())
+            except asyncio.CancelledError:
+                logger.info("Sauvegarde périodique des sessions annulée")
+                break
+            except Exception as e:
+                logger.error(f"Erreur lors de la sauvegarde périodique des sessions: {e}")
 
-        session_data = self.active_sessions[user_id]
+    async def run_checkpoint(self, now: datetime.datetime) -> int:
+        """Met à jour en une fois la ligne ouverte de toutes les sessions actives"""
+        segments = []
+        for session in self.active_sessions.values():
+            segments.extend(session.checkpoint(now))
+        await self.write_segments(segments)
         try:
-            end_time = datetime.datetime.now()
-            duration = end_time - session_data['last_save']
-            duration_seconds = int(duration.total_seconds())
-            
-            if duration_seconds >= 1:
-                await supabase.add_session(
-                    user_id=user_id,
-                    start_time=session_data['last_save'],
-                    end_time=end_time,
-                    duration_seconds=duration_seconds
-                )
-                session_data['last_save'] = end_time
-                return True
+            await self.save_snapshot()
         except Exception as e:
-            logger.error(f"Erreur lors de la sauvegarde de la session pour l'utilisateur {user_id}: {e}")
-        return False
+            logger.error(f"Erreur lors de l'enregistrement des sessions actives: {e}")
+        return len(segments)
 
-    async def track_session(self, member: discord.Member, start_time: datetime.datetime):
-        """Suivi d'une session vocale"""
-        if member.id in self.session_tasks:
-            self.session_tasks[member.id].cancel()
-            try:
-                await self.session_tasks[member.id]
-            except asyncio.CancelledError:
-                pass
+    def _write_snapshot(self, payload: Dict):
+        directory = os.path.dirname(SESSION_SNAPSHOT_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Écriture atomique : un arrêt pendant l'écriture laisse l'instantané précédent intact
+        temporary_path = f'{SESSION_SNAPSHOT_PATH}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(payload, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, SESSION_SNAPSHOT_PATH)
 
-        self.active_sessions[member.id] = {
-            'start_time': start_time,
-            'last_save': start_time
+    async def save_snapshot(self):
+        """Enregistre localement l'état sauvegardé des sessions actives"""
+        # Tant que l'instantané précédent n'a pas été lu, l'écraser ferait perdre la reprise des membres en vocal
+        if not self.sessions_restored:
+            return
+        payload = {
+            'saved_at': self.clock().isoformat(),
+            'sessions': [
+                {
+                    'user_id': session.user_id,
+                    'session_key': session.session_key,
+                    'start_time': session.start_time.isoformat(),
+                    'last_save': session.last_save.isoformat(),
+                    'saved_seconds': session.saved_seconds
+                }
+                for session in self.active_sessions.values()
+            ]
         }
+        await asyncio.to_thread(self._write_snapshot, payload)
+
+    @staticmethod
+    def _read_snapshot() -> List[Dict]:
+        try:
+            with open(SESSION_SNAPSHOT_PATH, encoding='utf-8') as file:
+                return json.load(file)['sessions']
+        except FileNotFoundError:
+            return []
 
-        async def session_tracker():
+    async def load_snapshot(self) -> Dict[int, ActiveSession]:
+        """Sessions actives enregistrées avant le dernier arrêt"""
+        rows = await asyncio.to_thread(self._read_snapshot)
+        return {
+            row['user_id']: ActiveSession(
+                user_id=row['user_id'],
+                start_time=datetime.datetime.fromisoformat(row['start_time']),
+                last_save=datetime.datetime.fromisoformat(row['last_save']),
+                session_key=row['session_key'],
+                saved_seconds=row['saved_seconds']
+            )
+            for row in rows
+        }
+
+    async def restore_sessions(self):
+        """Recale les sessions suivies sur les membres réellement présents en vocal (démarrage ou reconnexion)"""
+        try:
+            guild = self.bot.get_guild(GUILD_ID)
+            if not guild:
+                return
+            # L'instantané est lu avant la présence en vocal : plus rien n'est attendu entre la lecture des salons
+            # et la mise à jour des sessions, un départ ne peut donc pas s'intercaler
+            snapshot = {}
+            if not self.sessions_restored:
+                try:
+                    snapshot = await self.load_snapshot()
+                except Exception as e:
+                    logger.error(f"Erreur lors de la lecture des sessions actives enregistrées: {e}")
+                # Les sauvegardes de l'instantané ne reprennent qu'une fois celui-ci lu
+                self.sessions_restored = True
+
+            now = self.clock()
+            present = {
+                member.id
+                for channel in guild.voice_channels if self.is_tracked_channel(channel)
+                for member in channel.members if not member.bot
+            }
+
+            # Au premier démarrage, les sessions de l'instantané reprennent là où elles avaient été sauvegardées
+            resumed = 0
+            for user_id, session in snapshot.items():
+                if user_id in self.active_sessions or user_id not in present:
+                    continue  # Membre parti : son temps jusqu'à la dernière sauvegarde est déjà enregistré
+                if (now - session.last_save).total_seconds() > self.snapshot_max_gap:
+                    continue  # Interruption trop longue : une nouvelle session commence maintenant
+                self.active_sessions[user_id] = session
+                resumed += 1
+
+            # Membres partis pendant la déconnexion : leur session s'arrête à sa dernière sauvegarde
+            closed = 0
+            for user_id in list(self.active_sessions):
+                if user_id not in present:
+                    self.cancel_thresholds(user_id)
+                    del self.active_sessions[user_id]
+                    closed += 1
+
+            # Membres présents sans événement d'arrivée
+            started = 0
+            for user_id in present:
+                if user_id not in self.active_sessions:
+                    self.start_session(user_id, now)
+                    started += 1
+                self.schedule_thresholds(user_id, now)
+
+            await self.save_snapshot()
+            logger.info(f"Sessions vocales recalées: {resumed} reprise(s), {started} démarrée(s), {closed} clôturée(s)")
+        except Exception as e:
+            logger.error(f"Erreur lors de la reprise des sessions vocales: {e}")
+
+    async def write_segments(self, segments: List[Dict]):
+        """Écrit l'état d'un lot de sessions dans le journal local, rejoué ensuite vers Supabase"""
+        if not segments:
+            return
+        try:
+            await journal.append(segments)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'enregistrement de {len(segments)} segment(s) de session: {e}")
+            return
+
+        now = self.clock()
+        for segment in segments:
+            self.lifetime.add(segment['user_id'], segment['delta_seconds'], segment['segment_start'].date())
+            self.weekly.add(segment['user_id'], segment['segment_start'], segment['end_time'])
+            self.rankings.add(segment['user_id'], segment['delta_seconds'], segment['segment_start'], now)
+
+    def get_lifetime_seconds(self, user_id: int, now: Optional[datetime.datetime] = None) -> Optional[int]:
+        """Temps total d'un membre, portion non encore sauvegardée de sa session en cours comprise"""
+        total_seconds = self.lifetime.get(user_id)
+        if total_seconds is None:
+            return None
+
+        session = self.active_sessions.get(user_id)
+        if session:
+            now = now or self.clock()
+            total_seconds += max(0, int((now - session.last_save).total_seconds()))
+        return total_seconds
+
+    async def warm_in_background(self, ranking, label: str):
+        """Charge un classement en mémoire depuis la base, en réessayant jusqu'à réussir"""
+        while not ranking.ready:
             try:
-                while True:
-                    await asyncio.sleep(self.session_save_interval)
-                    if member.id not in self.active_sessions:
+                async with self.warmup_limit:
+                    if await ranking.warm(self.clock()):
                         break
-                    await self.save_session(member.id)
             except asyncio.CancelledError:
-                logger.info(f"Suivi de session annulé pour {member.name}")
                 raise
             except Exception as e:
-                logger.error(f"Erreur inattendue dans le suivi de session pour {member.name}: {e}")
+                logger.error(f"Erreur lors du chargement {label}: {e}")
+            await asyncio.sleep(60)
+
+    async def warm_lifetime(self):
+        """Charge le cache des temps totaux dès que le serveur est disponible, en réessayant jusqu'à réussir
+
+        Sans cache, aucun seuil n'est programmé : on n'attend pas la vérification horaire des rôles pour réessayer.
+        """
+        await self.bot.wait_until_ready()
+        while not self.lifetime.ready:
+            try:
+                guild = self.bot.get_guild(GUILD_ID)
+                if guild:
+                    async with self.warmup_limit:
+                        await self.reconcile_lifetime([member.id for member in guild.members if not member.bot])
+            except asyncio.CancelledError:
                 raise
-            finally:
-                if member.id in self.active_sessions:
-                    await self.save_session(member.id)
-                    del self.active_sessions[member.id]
-                if member.id in self.session_tasks:
-                    del self.session_tasks[member.id]
+            except Exception as e:
+                logger.error(f"Erreur lors du chargement du cache des temps totaux: {e}")
+            if not self.lifetime.ready:
+                await asyncio.sleep(self.lifetime_retry_interval)
+
+    async def reconcile_lifetime(self, user_ids: List[int], force: bool = False) -> bool:
+        """Recale le cache des temps totaux s'il est périmé puis reprogramme les seuils ; False si le recalage est reporté"""
+        async with self.reconcile_lock:
+            # Un recalage concurrent (chargement au démarrage, vérification des rôles) vient peut-être d'aboutir
+            if not force and not self.lifetime.is_stale(self.lifetime_reconcile_interval, self.clock()):
+                return True
+            if not await self.lifetime.reconcile(user_ids, self.clock()):
+                return False
+
+        # Les échéances dépendent des temps recalés
+        now = self.clock()
+        for user_id in list(self.active_sessions):
+            self.schedule_thresholds(user_id, now)
+        return True
+
+    async def load_lifetime(self, user_ids: List[int]):
+        """Charge dans le cache les membres qui n'y sont pas encore puis programme leurs seuils"""
+        now = self.clock()
+        for user_id in await self.lifetime.load(user_ids):
+            self.schedule_thresholds(user_id, now)
+
+    def get_rank_index(self, period: str) -> Optional[RankIndex]:
+        """Classement ordonné d'une période en cours (daily, weekly, monthly, yearly), None tant qu'il n'est pas chargé"""
+        return self.rankings.get(period, self.clock())
 
-        self.session_tasks[member.id] = self.bot.loop.create_task(session_tracker())
+    def get_weekly_top(self, k: int) -> Optional[List[Tuple[int, int]]]:
+        """Les k premiers (user_id, secondes) des 7 derniers jours, sessions en cours comprises ; None tant que le classement n'est pas chargé"""
+        if not self.weekly.ready:
+            return None
+        now = self.clock()
+        live = {
+            user_id: int((now - session.last_save).total_seconds())
+            for user_id, session in self.active_sessions.items()
+        }
+        return self.weekly.top(k, now, live)
+
+    def get_day_seconds(self, user_id: int, now: datetime.datetime) -> Optional[int]:
+        """Temps du jour d'un membre, portion non encore sauvegardée de sa session en cours comprise"""
+        day_seconds = self.lifetime.get_day(user_id, now.date())
+        if day_seconds is None:
+            return None
+
+        session = self.active_sessions.get(user_id)
+        if session:
+            # Seule la portion postérieure à minuit compte pour aujourd'hui
+            midnight = datetime.datetime.combine(now.date(), datetime.time())
+            day_seconds += max(0, int((now - max(session.last_save, midnight)).total_seconds()))
+        return day_seconds
+
+    def schedule_thresholds(self, user_id: int, now: datetime.datetime):
+        """Programme le prochain seuil du membre : rôle de progression suivant ou minimum quotidien"""
+        self.cancel_thresholds(user_id)
+        if user_id not in self.active_sessions:
+            return
+
+        candidates = []
+        total_seconds = self.get_lifetime_seconds(user_id, now)
+        if total_seconds is not None:
+            next_threshold = min((hours * 3600 for hours in ROLES.values() if hours * 3600 > total_seconds), default=None)
+            if next_threshold is not None:
+                candidates.append(now + datetime.timedelta(seconds=next_threshold - total_seconds))
+
+        day_seconds = self.get_day_seconds(user_id, now)
+        if day_seconds is not None:
+            minimum = MINIMUM_DAILY_MINUTES * 60  # MINIMUM_DAILY_MINUTES en secondes
+            next_midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+            if self.daily_minimum_notified.get(user_id) == now.date():
+                due = next_midnight + datetime.timedelta(seconds=minimum)
+            else:
+                due = now + datetime.timedelta(seconds=max(0, minimum - day_seconds))
+                # Le temps repart de zéro à minuit
+                if due >= next_midnight:
+                    due = next_midnight + datetime.timedelta(seconds=minimum)
+            candidates.append(due)
+
+        if not candidates:
+            return
+        generation = next(self.timer_sequence)
+        self.timer_generations[user_id] = generation
+        due = min(candidates)
+        heapq.heappush(self.threshold_timers, (due, user_id, generation))
+        if self.threshold_timers[0][2] == generation:
+            self.threshold_wakeup.set()
+
+    def cancel_thresholds(self, user_id: int):
+        """Annule le seuil programmé d'un membre (son entrée restera dans le tas jusqu'à son échéance ou au prochain nettoyage)"""
+        self.timer_generations.pop(user_id, None)
+        # Nettoyer le tas quand les entrées annulées y dominent
+        if len(self.threshold_timers) > 2 * len(self.timer_generations) + 64:
+            self.threshold_timers = [
+                timer for timer in self.threshold_timers
+                if self.timer_generations.get(timer[1]) == timer[2]
+            ]
+            heapq.heapify(self.threshold_timers)
+
+    async def threshold_timer(self):
+        """Minuteur unique : attend la prochaine échéance du tas et déclenche les seuils atteints"""
+        while True:
+            try:
+                timeout = None
+                if self.threshold_timers:
+                    timeout = max(0.0, (self.threshold_timers[0][0] - self.clock()).total_seconds())
+                try:
+                    await asyncio.wait_for(self.threshold_wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self.threshold_wakeup.clear()
+
+                now = self.clock()
+                while self.threshold_timers and self.threshold_timers[0][0] <= now:
+                    _, user_id, generation = heapq.heappop(self.threshold_timers)
+                    if self.timer_generations.get(user_id) != generation:
+                        continue  # Seuil annulé ou reprogrammé
+                    del self.timer_generations[user_id]
+                    await self.fire_thresholds(user_id, now)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Erreur dans le minuteur des seuils: {e}")
+
+    async def fire_thresholds(self, user_id: int, now: datetime.datetime):
+        """Applique les seuils atteints par un membre puis programme le suivant"""
+        try:
+            guild = self.bot.get_guild(GUILD_ID)
+            member = guild.get_member(user_id) if guild else None
+            if member is None or user_id not in self.active_sessions:
+                return
+
+            total_seconds = self.get_lifetime_seconds(user_id, now)
+            if total_seconds is not None:
+                await self.update_user_role(member, total_seconds / 3600)
+
+            # Minimum quotidien atteint : signalé une fois par jour, le streak est tenu par le cog Discipline
+            day_seconds = self.get_day_seconds(user_id, now)
+            if (day_seconds is not None and day_seconds >= MINIMUM_DAILY_MINUTES * 60
+                    and self.daily_minimum_notified.get(user_id) != now.date()):
+                self.daily_minimum_notified[user_id] = now.date()
+                logger.info(f"{member.name} a atteint le minimum quotidien ({MINIMUM_DAILY_MINUTES} minutes)")
+                self.bot.dispatch('daily_minimum_reached', member, now.date())
+        finally:
+            self.schedule_thresholds(user_id, now)
+
+    def start_session(self, user_id: int, start_time: datetime.datetime):
+        """Démarre le suivi d'une session vocale"""
+        if user_id not in self.active_sessions:
+            self.active_sessions[user_id] = ActiveSession(user_id, start_time, start_time)
+
+    def end_session(self, user_id: int, end_time: datetime.datetime) -> List[Dict]:
+        """Arrête le suivi d'une session et retourne l'état final de sa ligne"""
+        session = self.active_sessions.pop(user_id, None)
+        if not session:
+            return []
+        return session.checkpoint(end_time)
+
+    def apply_voice_events(self, events: List[tuple]) -> List[Dict]:
+        """Applique un lot d'entrées/sorties et retourne les segments des sessions clôturées"""
+        segments = []
+        for member, channel, timestamp in events:
+            if channel is not None:
+                self.start_session(member.id, timestamp)
+                self.schedule_thresholds(member.id, timestamp)
+                logger.info(f"{member.name} est entré dans {channel.name}")
+            else:
+                self.cancel_thresholds(member.id)
+                segments.extend(self.end_session(member.id, timestamp))
+                logger.info(f"Session de {member.name} terminée")
+        return segments
+
+    async def process_voice_events(self):
+        """Consomme la file des événements vocaux par lots"""
+        while True:
+            try:
+                events = [await self.voice_events.get()]
+                while len(events) < self.voice_event_batch_size and not self.voice_events.empty():
+                    events.append(self.voice_events.get_nowait())
+                try:
+                    await self.write_segments(self.apply_voice_events(events))
+                finally:
+                    # voice_events.join() attend que tous les événements reçus soient appliqués
+                    for _ in events:
+                        self.voice_events.task_done()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Erreur lors du traitement des événements vocaux: {e}")
+
+    @staticmethod
+    def is_tracked_channel(channel) -> bool:
+        """Un salon compte pour le suivi s'il existe et n'est pas le salon Pause"""
+        return channel is not None and channel.id != VOICE_CHANNEL_PAUSE_ID
 
     async def check_all_roles(self):
         """Vérifie les rôles de tous les membres"""
@@ -131,22 +575,53 @@ class VoiceTracking(commands.Cog):
             if guild:
                 logger.info(f"Serveur Discord trouvé: {guild.name} ({guild.id})")
                 logger.info("Démarrage de la vérification des rôles pour tous les membres")
-                for member in guild.members:
-                    if not member.bot:
-                        stats = await supabase.get_user_stats(member.id)
-                        if stats:
-                            logger.info(f"Vérification du rôle pour {member.name}")
-                            await self.update_user_role(member, stats['total_hours'])
+                # Le cache est recalé s'il n'a pas encore été chargé par warm_lifetime
+                async with self.warmup_limit:
+                    await self.update_all_roles(guild)
                 logger.info("Vérification des rôles terminée")
             else:
                 logger.warning(f"Serveur Discord (ID: {GUILD_ID}) non trouvé.")
         except Exception as e:
             logger.error(f"Erreur lors de la vérification des rôles: {e}")
 
+    async def update_all_roles(self, guild: discord.Guild, reconcile: bool = False):
+        """Met à jour les rôles de tous les membres à partir du cache des temps totaux"""
+        members = [member for member in guild.members if not member.bot]
+        user_ids = [member.id for member in members]
+
+        # Le cache est recalé sur la base périodiquement, en une requête groupée
+        if reconcile or self.lifetime.is_stale(self.lifetime_reconcile_interval, self.clock()):
+            try:
+                await self.reconcile_lifetime(user_ids, force=reconcile)
+            except Exception as e:
+                logger.error(f"Erreur lors du recalage du cache des temps totaux: {e}")
+
+        if self.lifetime.ready:
+            # Membres arrivés depuis le dernier recalage : chargés en une requête, jamais comptés à 0
+            try:
+                await self.load_lifetime(user_ids)
+            except Exception as e:
+                logger.error(f"Erreur lors du chargement des temps totaux des nouveaux membres: {e}")
+            totals = {user_id: self.get_lifetime_seconds(user_id) for user_id in user_ids}
+        else:
+            # Cache pas encore chargé : lecture groupée directe
+            all_stats = await supabase.get_users_stats(user_ids)
+            totals = {user_id: stats['total_seconds'] for user_id, stats in all_stats.items()}
+
+        for member in members:
+            total_seconds = totals.get(member.id)
+            if total_seconds is None:
+                continue
+            try:
+                await self.update_user_role(member, total_seconds / 3600)
+            except Exception as e:
+                logger.error(f"Erreur lors de la vérification du rôle pour {member.name}: {e}")
+
     async def update_user_role(self, member: discord.Member, total_hours: float):
         """Met à jour le rôle d'un utilisateur en fonction de son temps total"""
         try:
-            logger.info(f"Vérification du rôle pour {member.name} avec {total_hours} heures")
+            # Appelé pour chaque membre à chaque vérification : détail visible seulement en DEBUG
+            logger.debug(f"Vérification du rôle pour {member.name} avec {total_hours} heures")
             
             # Déterminer le rôle approprié en fonction des heures totales
             new_role_name = None
@@ -155,30 +630,19 @@ class VoiceTracking(commands.Cog):
                     new_role_name = role_name
                     break
 
-            logger.info(f"Rôle éligible trouvé pour {member.name}: {new_role_name if new_role_name else 'Aucun'}")
-
-            # Vérifier si l'utilisateur a déjà le bon rôle
-            current_role = None
-            for role in member.roles:
-                if role.name in ROLES:
-                    current_role = role.name
-                    break
+            logger.debug(f"Rôle éligible trouvé pour {member.name}: {new_role_name if new_role_name else 'Aucun'}")
 
-            # Ne faire les modifications que si le rôle a changé
-            if current_role != new_role_name:
-                # Retirer l'ancien rôle si nécessaire
-                if current_role:
-                    discord_role = discord.utils.get(member.guild.roles, name=current_role)
-                    if discord_role:
-                        await member.remove_roles(discord_role)
-                        logger.info(f"Ancien rôle '{current_role}' retiré de {member.name} sur Discord.")
+            role_manager = self.bot.get_cog('RoleManager')
+            if not role_manager:
+                logger.error("Le cog RoleManager n'a pas été trouvé.")
+                return
 
-                # Attribuer le nouveau rôle si nécessaire
+            # Ne faire les modifications que si le rôle a changé : le gestionnaire compare aux rôles actuels du membre
+            # et retire l'ancien rôle en ajoutant le nouveau en un seul appel
+            if role_manager.set_role(member, 'progression', new_role_name):
                 if new_role_name:
-                    discord_new_role = discord.utils.get(member.guild.roles, name=new_role_name)
-                    if discord_new_role:
-                        await member.add_roles(discord_new_role)
-                        logger.info(f"Rôle '{new_role_name}' attribué à {member.name} sur Discord.")
+                    if role_manager.get_role(new_role_name):
+                        logger.info(f"Rôle '{new_role_name}' demandé pour {member.name} sur Discord.")
                         await supabase.update_user_role(member.id, new_role_name, ROLES[new_role_name])
                         logger.info(f"Rôle '{new_role_name}' mis à jour dans la base de données pour {member.name}.")
                 else:
@@ -188,53 +652,37 @@ class VoiceTracking(commands.Cog):
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour du rôle: {e}", exc_info=True)
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Reprend le suivi des membres déjà en vocal, au démarrage comme après une reconnexion"""
+        await self.restore_sessions()
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        """Charge le temps total d'un membre arrivé après le dernier recalage du cache"""
+        if member.bot or not self.lifetime.ready:
+            return
+        try:
+            await self.load_lifetime([member.id])
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement du temps total de {member.name}: {e}")
+
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
         """Gère les changements d'état vocal des membres"""
         # Ignorer les bots
         if member.bot:
             return
-            
-        # Gestion de l'entrée dans un salon vocal
-        if before.channel is None and after.channel is not None:
-            # Ignorer le salon "Pause"
-            if after.channel.id == VOICE_CHANNEL_PAUSE_ID:
-                return
-                
-            start_time = datetime.datetime.now()
-            self.active_sessions[member.id] = start_time
-            
-            # Démarrer le suivi de la session
-            task = asyncio.create_task(self.track_session(member, start_time))
-            self.session_tasks[member.id] = task
-            
-            logger.info(f"{member.name} est entré dans {after.channel.name}")
-            
-        # Gestion de la sortie d'un salon vocal
-        elif before.channel is not None and after.channel is None:
-            if member.id in self.active_sessions:
-                # Annuler la tâche de suivi
-                if member.id in self.session_tasks:
-                    self.session_tasks[member.id].cancel()
-                    del self.session_tasks[member.id]
-                    
-                start_time = self.active_sessions.pop(member.id)
-                end_time = datetime.datetime.now()
-                duration = end_time - start_time
-                duration_seconds = int(duration.total_seconds())
-                
-                # Ignorer les sessions de moins d'une seconde
-                if duration_seconds < 1:
-                    return
-                    
-                # Enregistrer la session dans la base de données
-                await supabase.add_session(
-                    user_id=member.id,
-                    start_time=start_time,
-                    end_time=end_time,
-                    duration_seconds=duration_seconds
-                )
-                logger.info(f"Session de {member.name} enregistrée: {duration_seconds} secondes")
+
+        # Seules les entrées et sorties du suivi comptent (un déplacement vers Pause est une sortie)
+        was_tracked = self.is_tracked_channel(before.channel)
+        is_tracked = self.is_tracked_channel(after.channel)
+        if was_tracked == is_tracked:
+            return
+
+        # L'horodatage est pris ici pour que l'attente dans la file ne fausse pas les durées
+        channel = after.channel if is_tracked else None
+        await self.voice_events.put((member, channel, self.clock()))
 
 async def setup(bot):
     await bot.add_cog(VoiceTracking(bot))
\ No newline at end of file
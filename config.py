@@ -12,6 +12,33 @@ GUILD_ID = int(os.getenv('GUILD_ID'))
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 SUPABASE_SECRET = os.getenv('SUPABASE_SECRET')
+SUPABASE_MAX_CONCURRENCY = int(os.getenv('SUPABASE_MAX_CONCURRENCY', 8))  # Nombre maximum de requêtes Supabase simultanées
+
+# Stockage local (journal des sessions, état de démarrage)
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+JOURNAL_PATH = os.path.join(DATA_DIR, 'journal.sqlite3')
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', 500))  # Sessions envoyées à Supabase par requête lors du rejeu
+COMMAND_TREE_HASH_PATH = os.path.join(DATA_DIR, 'command_tree.sha256')  # Empreinte des commandes slash déjà synchronisées
+SESSION_SNAPSHOT_PATH = os.path.join(DATA_DIR, 'active_sessions.json')  # Sessions vocales en cours, pour les reprendre après un redémarrage
+
+# Démarrage
+STARTUP_WARMUP_CONCURRENCY = int(os.getenv('STARTUP_WARMUP_CONCURRENCY', 2))  # Chargements de caches menés en parallèle au démarrage
+
+# Suivi vocal
+VOICE_EVENT_QUEUE_SIZE = int(os.getenv('VOICE_EVENT_QUEUE_SIZE', 1000))  # Événements vocaux en attente avant de ralentir les gestionnaires
+
+# Journalisation
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' ou 'json' (une ligne JSON par message)
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))  # Taille d'un fichier de log avant rotation
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))  # Anciens fichiers de log conservés
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))  # Messages par minute au plus pour une même ligne de code
+
+# Métriques (format Prometheus, servies en local)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))  # 0 pour désactiver le point d'accès /metrics
+LOOP_WATCHDOG_THRESHOLD = float(os.getenv('LOOP_WATCHDOG_THRESHOLD', 0.25))  # Secondes de blocage de la boucle signalées, 0 pour désactiver
 
 # Configuration des canaux
 VOICE_CHANNEL_PAUSE_ID = int(os.getenv('VOICE_CHANNEL_PAUSE_ID'))
@@ -31,6 +58,16 @@ ROLES = {
     'Divin': 10000
 }
 
+# Rôles du podium hebdomadaire, par position
+PODIUM_ROLES = {
+    1: "🥇N°1 de la semaine",
+    2: "🥈N°2 de la semaine",
+    3: "🥉N°3 de la semaine"
+}
+
+# Préfixe des rôles de discipline ("Discipline 1" à "Discipline 10")
+DISCIPLINE_ROLE_PREFIX = "Discipline"
+
 # Configuration des streaks
 MINIMUM_DAILY_MINUTES = int(os.getenv('MINIMUM_DAILY_MINUTES', 30))  # Minutes minimum par jour pour valider le streak, par défaut 30 minutes
 
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import asyncio
+import logging
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List
+from config import JOURNAL_PATH, JOURNAL_BATCH_SIZE
+from database.supabase_client import supabase
+
+logger = logging.getLogger('Focusbot')
+
+class SessionJournal:
+    """Journal local (SQLite) par lequel passe toute écriture de session avant d'être rejouée vers Supabase"""
+
+    def __init__(self, path: str, batch_size: int = JOURNAL_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.retry_interval = 5  # secondes entre deux tentatives quand rien ne réveille le rejeu
+        self.max_retry_interval = 300  # 5 minutes maximum entre deux tentatives pendant une panne
+        # Une seule connexion SQLite, utilisée exclusivement depuis ce thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='journal')
+        self.connection: sqlite3.Connection = None
+        self.wakeup = asyncio.Event()
+        self.replay_lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Ouvre le journal et crée la table si nécessaire (dans le thread du journal)"""
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path)
+            # synchronous=FULL : chaque commit est fsyncé avant de rendre la main
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=FULL')
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS pending_sessions (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_key TEXT NOT NULL UNIQUE,
+                    user_id INTEGER NOT NULL,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    duration_seconds INTEGER NOT NULL,
+                    revision INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(pending_sessions)')]
+            if 'revision' not in columns:
+                self.connection.execute('ALTER TABLE pending_sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+            self.connection.commit()
+        return self.connection
+
+    def _append(self, rows: List[Dict]):
+        connection = self._connect()
+        with connection:
+            # Une session ouverte n'a qu'une entrée en attente : seul son dernier état sera envoyé
+            connection.executemany(
+                'INSERT INTO pending_sessions (session_key, user_id, start_time, end_time, duration_seconds) '
+                'VALUES (:session_key, :user_id, :start_time, :end_time, :duration_seconds) '
+                'ON CONFLICT(session_key) DO UPDATE SET '
+                'end_time = excluded.end_time, duration_seconds = excluded.duration_seconds, revision = revision + 1',
+                rows
+            )
+
+    def _fetch_batch(self, limit: int) -> List[Dict]:
+        cursor = self._connect().execute(
+            'SELECT session_key, user_id, start_time, end_time, duration_seconds, revision '
+            'FROM pending_sessions ORDER BY seq LIMIT ?',
+            (limit,)
+        )
+        return [
+            {
+                'session_key': session_key,
+                'user_id': user_id,
+                'start_time': start_time,
+                'end_time': end_time,
+                'duration_seconds': duration_seconds,
+                'revision': revision
+            }
+            for session_key, user_id, start_time, end_time, duration_seconds, revision in cursor.fetchall()
+        ]
+
+    def _delete(self, rows: List[Dict]):
+        connection = self._connect()
+        with connection:
+            # Une entrée mise à jour pendant l'envoi est conservée pour le prochain lot
+            connection.executemany(
+                'DELETE FROM pending_sessions WHERE session_key = :session_key AND revision = :revision',
+                rows
+            )
+
+    def _count(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM pending_sessions').fetchone()[0]
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def append(self, sessions: List[Dict]):
+        """Enregistre durablement l'état d'un lot de sessions ; il sera envoyé à Supabase par le rejeu en arrière-plan"""
+        if not sessions:
+            return
+        rows = [
+            {
+                'session_key': session['session_key'],  # Clé d'idempotence : un rejeu ne compte jamais deux fois
+                'user_id': session['user_id'],
+                'start_time': session['start_time'].isoformat(),
+                'end_time': session['end_time'].isoformat(),
+                'duration_seconds': session['duration_seconds']
+            }
+            for session in sessions
+        ]
+        await self._run(self._append, rows)
+        self.wakeup.set()
+
+    async def pending_count(self) -> int:
+        """Nombre de sessions en attente d'envoi"""
+        return await self._run(self._count)
+
+    @contextlib.asynccontextmanager
+    async def drained(self, label: str) -> AsyncIterator[bool]:
+        """Suspend le rejeu le temps d'une lecture de la base ; produit False si des sessions attendent encore d'être envoyées"""
+        # Le rejeu est suspendu pendant la lecture : ce qui est écrit entre-temps n'est pas encore en base
+        async with self.replay_lock:
+            # Une écriture non envoyée n'est pas encore visible en base : lire maintenant perdrait son temps
+            pending = await self.pending_count()
+            if pending:
+                logger.info(f"{label} reporté: {pending} session(s) en attente d'envoi")
+            yield not pending
+
+    async def replay_once(self) -> int:
+        """Envoie un lot de sessions en attente à Supabase et retourne le nombre de sessions envoyées"""
+        async with self.replay_lock:
+            rows = await self._run(self._fetch_batch, self.batch_size)
+            if not rows:
+                return 0
+            await supabase.upsert_sessions([
+                {key: value for key, value in row.items() if key != 'revision'}
+                for row in rows
+            ])
+            await self._run(self._delete, rows)
+            return len(rows)
+
+    async def replay_forever(self):
+        """Vide le journal vers Supabase dès qu'il est joignable, avec un délai croissant pendant les pannes"""
+        retry_interval = self.retry_interval
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=retry_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+
+                replayed = 0
+                while True:
+                    count = await self.replay_once()
+                    if not count:
+                        break
+                    replayed += count
+                if replayed:
+                    logger.info(f"{replayed} session(s) du journal envoyée(s) à Supabase")
+                retry_interval = self.retry_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                retry_interval = min(retry_interval * 2, self.max_retry_interval)
+                # Le comptage lit lui aussi SQLite : son échec ne doit pas arrêter le rejeu
+                try:
+                    pending = f"{await self.pending_count()} session(s) en attente"
+                except Exception as count_error:
+                    pending = f"sessions en attente inconnues: {count_error}"
+                logger.warning(f"Rejeu du journal impossible ({pending}). Nouvelle tentative dans {retry_interval}s. Erreur: {e}")
+
+    def close(self):
+        """Ferme le journal"""
+        self.executor.submit(self._close)
+        self.executor.shutdown(wait=True)
+
+    def _close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+# Création et exportation de l'instance
+journal = SessionJournal(JOURNAL_PATH)
@@ -0,0 +1,105 @@
+import logging
+import datetime
+from typing import Dict, List, Optional, Set
+from database.supabase_client import supabase
+from database.journal import journal
+
+logger = logging.getLogger('Focusbot')
+
+class LifetimeCache:
+    """Temps total et temps du jour (en secondes) de chaque utilisateur, gardés en mémoire et incrémentés à chaque écriture de session"""
+
+    def __init__(self):
+        self.totals: Dict[int, int] = {}
+        self.loaded: Set[int] = set()  # Utilisateurs dont le temps a été lu en base : les autres ne valent pas 0
+        # Temps par jour, à partir du jour du dernier recalage (seuls ce jour et le suivant sont conservés)
+        self.daily: Dict[datetime.date, Dict[int, int]] = {}
+        self.first_day: Optional[datetime.date] = None
+        self.ready = False
+        self.last_reconcile: Optional[datetime.datetime] = None
+        # Incréments reçus pendant un recalage, ajoutés au résultat de la requête
+        self.reconcile_deltas: Optional[Dict[int, int]] = None
+        self.reconcile_day: Optional[datetime.date] = None
+        self.reconcile_day_deltas: Optional[Dict[int, int]] = None
+
+    def add(self, user_id: int, seconds: int, day: Optional[datetime.date] = None):
+        """Ajoute le temps d'une écriture de session, compté pour le jour donné"""
+        if user_id in self.loaded:
+            self.totals[user_id] += seconds
+        if self.reconcile_deltas is not None:
+            self.reconcile_deltas[user_id] = self.reconcile_deltas.get(user_id, 0) + seconds
+
+        if day is None:
+            return
+        day_totals = self.daily.setdefault(day, {})
+        day_totals[user_id] = day_totals.get(user_id, 0) + seconds
+        if self.reconcile_day_deltas is not None and day == self.reconcile_day:
+            self.reconcile_day_deltas[user_id] = self.reconcile_day_deltas.get(user_id, 0) + seconds
+
+        # Les jours passés ne servent plus
+        for old_day in [d for d in self.daily if d < day - datetime.timedelta(days=1)]:
+            del self.daily[old_day]
+
+    def get(self, user_id: int) -> Optional[int]:
+        """Temps total enregistré d'un utilisateur, None tant que le cache n'a pas été chargé ou que l'utilisateur n'y a pas été lu"""
+        if not self.ready or user_id not in self.loaded:
+            return None
+        return self.totals[user_id]
+
+    def get_day(self, user_id: int, day: datetime.date) -> Optional[int]:
+        """Temps enregistré d'un utilisateur pour un jour, None si ce jour n'est pas suivi par le cache"""
+        if not self.ready or self.first_day is None or day < self.first_day:
+            return None
+        return self.daily.get(day, {}).get(user_id, 0)
+
+    def is_stale(self, max_age: int, now: datetime.datetime) -> bool:
+        """Indique si, à now, le dernier recalage date de plus de max_age secondes"""
+        if self.last_reconcile is None:
+            return True
+        return (now - self.last_reconcile).total_seconds() >= max_age
+
+    async def fetch(self, user_ids: List[int], label: str, today: Optional[datetime.date] = None) -> bool:
+        """Lit en une requête groupée le temps total d'utilisateurs, et celui de tous pour today s'il est donné ;
+        False si le journal n'est pas encore vidé"""
+        async with journal.drained(label) as drained:
+            if not drained:
+                return False
+
+            self.reconcile_deltas = {}
+            self.reconcile_day, self.reconcile_day_deltas = today, {}
+            try:
+                stats = await supabase.get_users_stats(user_ids)
+                day_totals = await supabase.get_day_totals(today) if today is not None else None
+                for user_id, user_stats in stats.items():
+                    self.totals[user_id] = user_stats['total_seconds'] + self.reconcile_deltas.get(user_id, 0)
+                    self.loaded.add(user_id)
+                if day_totals is not None:
+                    for user_id, seconds in self.reconcile_day_deltas.items():
+                        day_totals[user_id] = day_totals.get(user_id, 0) + seconds
+            finally:
+                self.reconcile_deltas = None
+                self.reconcile_day, self.reconcile_day_deltas = None, None
+
+            if day_totals is not None:
+                # Le jour suivant, s'il a déjà commencé pendant la requête, reste tel qu'incrémenté en mémoire
+                self.daily = {day: totals for day, totals in self.daily.items() if day > today}
+                self.daily[today] = day_totals
+                self.first_day = today
+        return True
+
+    async def reconcile(self, user_ids: List[int], now: datetime.datetime) -> bool:
+        """Recale le cache sur la base en une requête groupée"""
+        if not await self.fetch(user_ids, "Recalage du cache des temps totaux", now.date()):
+            return False
+
+        self.ready = True
+        self.last_reconcile = now
+        logger.info(f"Cache des temps totaux recalé pour {len(user_ids)} utilisateur(s)")
+        return True
+
+    async def load(self, user_ids: List[int]) -> List[int]:
+        """Charge les utilisateurs absents du cache (arrivés après le dernier recalage) et retourne ceux qui ont été chargés"""
+        missing = [user_id for user_id in user_ids if user_id not in self.loaded]
+        if not missing or not await self.fetch(missing, "Chargement des temps totaux"):
+            return []
+        return [user_id for user_id in missing if user_id in self.loaded]
@@ -0,0 +1,189 @@
+import bisect
+import logging
+import datetime
+from typing import Dict, List, Optional, Tuple
+from database.supabase_client import supabase, get_period_start
+from database.journal import journal
+
+logger = logging.getLogger('Focusbot')
+
+PERIODS = ('daily', 'weekly', 'monthly', 'yearly')
+
+class RankIndex:
+    """Classement ordonné par secondes décroissantes : rang d'un utilisateur et pages en O(log n)
+
+    Les clés (-secondes, user_id) sont rangées dans des blocs triés ; un arbre de Fenwick sur la taille
+    des blocs donne la position d'un bloc dans le classement.
+    """
+
+    load = 512  # Taille visée des blocs : un bloc est coupé en deux au-delà du double
+
+    def __init__(self):
+        self.totals: Dict[int, int] = {}
+        self.blocks: List[List[Tuple[int, int]]] = []
+        self.maxes: List[Tuple[int, int]] = []  # Dernière clé de chaque bloc
+        self.tree: List[int] = []  # Arbre de Fenwick des tailles de blocs
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    def clear(self):
+        self.totals.clear()
+        self.blocks.clear()
+        self.maxes.clear()
+        self.tree.clear()
+
+    def _build_tree(self):
+        self.tree = [len(block) for block in self.blocks]
+        for i in range(len(self.tree)):
+            parent = i | (i + 1)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def _tree_add(self, index: int, delta: int):
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index |= index + 1
+
+    def _prefix(self, end: int) -> int:
+        """Nombre de clés dans les blocs [0, end)"""
+        total = 0
+        while end > 0:
+            total += self.tree[end - 1]
+            end &= end - 1
+        return total
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """(bloc, position dans le bloc) de la clé à une position donnée du classement"""
+        block = 0
+        step = 1 << len(self.tree).bit_length()
+        while step:
+            candidate = block + step
+            if candidate <= len(self.tree) and self.tree[candidate - 1] <= position:
+                block = candidate
+                position -= self.tree[candidate - 1]
+            step >>= 1
+        return block, position
+
+    def _insert(self, key: Tuple[int, int]):
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            self._build_tree()
+            return
+
+        index = min(bisect.bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[index]
+        bisect.insort(block, key)
+        self.maxes[index] = block[-1]
+        self._tree_add(index, 1)
+
+        if len(block) > 2 * self.load:
+            self.blocks[index:index + 1] = [block[:self.load], block[self.load:]]
+            self.maxes[index:index + 1] = [block[self.load - 1], block[-1]]
+            self._build_tree()
+
+    def _remove(self, key: Tuple[int, int]):
+        index = bisect.bisect_left(self.maxes, key)
+        block = self.blocks[index]
+        del block[bisect.bisect_left(block, key)]
+        if block:
+            self.maxes[index] = block[-1]
+            self._tree_add(index, -1)
+        else:
+            del self.blocks[index]
+            del self.maxes[index]
+            self._build_tree()
+
+    def set(self, user_id: int, seconds: int):
+        """Fixe le total d'un utilisateur"""
+        old = self.totals.get(user_id)
+        if old is not None:
+            self._remove((-old, user_id))
+        if seconds > 0:
+            self.totals[user_id] = seconds
+            self._insert((-seconds, user_id))
+        else:
+            self.totals.pop(user_id, None)
+
+    def add(self, user_id: int, seconds: int):
+        """Ajoute du temps au total d'un utilisateur"""
+        self.set(user_id, self.totals.get(user_id, 0) + seconds)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Rang (à partir de 1) d'un utilisateur, None s'il n'a pas de temps sur la période"""
+        seconds = self.totals.get(user_id)
+        if seconds is None:
+            return None
+        key = (-seconds, user_id)
+        index = bisect.bisect_left(self.maxes, key)
+        return self._prefix(index) + bisect.bisect_left(self.blocks[index], key) + 1
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        """(user_id, secondes) des positions [offset, offset + limit) du classement"""
+        if offset >= len(self.totals) or limit <= 0:
+            return []
+        index, position = self._locate(offset)
+        entries = []
+        while index < len(self.blocks) and len(entries) < limit:
+            for negative, user_id in self.blocks[index][position:position + limit - len(entries)]:
+                entries.append((user_id, -negative))
+            index += 1
+            position = 0
+        return entries
+
+class PeriodRankings:
+    """Un classement ordonné par période (jour, semaine, mois, année), incrémenté à chaque écriture de session"""
+
+    def __init__(self, page_size: int = 1000):
+        self.page_size = page_size
+        self.indexes: Dict[str, RankIndex] = {period: RankIndex() for period in PERIODS}
+        self.period_starts: Dict[str, Optional[datetime.datetime]] = {period: None for period in PERIODS}
+        self.ready = False
+
+    def roll(self, now: datetime.datetime):
+        """Repart d'un classement vide pour chaque période qui vient de commencer"""
+        for period in PERIODS:
+            period_start = get_period_start(period, now)
+            if period_start != self.period_starts[period]:
+                self.indexes[period].clear()
+                self.period_starts[period] = period_start
+
+    def add(self, user_id: int, seconds: int, moment: datetime.datetime, now: datetime.datetime):
+        """Ajoute le temps d'une écriture de session aux périodes en cours (à now) qui contiennent moment"""
+        self.roll(now)
+        for period in PERIODS:
+            if moment >= self.period_starts[period]:
+                self.indexes[period].add(user_id, seconds)
+
+    def get(self, period: str, now: datetime.datetime) -> Optional[RankIndex]:
+        """Classement d'une période en cours à now, None tant que les classements ne sont pas chargés"""
+        if not self.ready or period not in self.indexes:
+            return None
+        self.roll(now)
+        return self.indexes[period]
+
+    async def warm(self, now: datetime.datetime) -> bool:
+        """Charge les classements depuis le classement agrégé côté serveur, par pages"""
+        async with journal.drained("Chargement des classements") as drained:
+            if not drained:
+                return False
+            for index in self.indexes.values():
+                index.clear()
+            self.roll(now)
+
+            for period in PERIODS:
+                offset = 0
+                while True:
+                    page = await supabase.get_leaderboard_page(self.period_starts[period], limit=self.page_size, offset=offset)
+                    # Ajout plutôt que remplacement : les écritures reçues pendant la lecture sont conservées
+                    for entry in page['entries']:
+                        self.indexes[period].add(entry['user_id'], entry['total_seconds'])
+                    # Avance du nombre de lignes reçues : db-max-rows peut renvoyer moins que page_size
+                    offset += len(page['entries'])
+                    if not page['entries'] or offset >= page['total_count']:
+                        break
+            self.ready = True
+
+        logger.info(f"Classements chargés ({', '.join(f'{period}: {len(index)}' for period, index in self.indexes.items())})")
+        return True
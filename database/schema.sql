@@ -8,10 +8,15 @@ CREATE TABLE IF NOT EXISTS sessions (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Clé d'idempotence des sessions rejouées depuis le journal local du bot
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS session_key UUID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_session_key ON sessions(session_key);
+
 -- Index pour les requêtes fréquentes
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON sessions(start_time);
 CREATE INDEX IF NOT EXISTS idx_sessions_end_time ON sessions(end_time);
+CREATE INDEX IF NOT EXISTS idx_sessions_start_time_totals ON sessions(start_time) INCLUDE (user_id, duration_seconds);
 
 -- Table des streaks
 CREATE TABLE IF NOT EXISTS streaks (
@@ -70,6 +75,17 @@ CREATE TABLE IF NOT EXISTS monthly_stats (
 CREATE INDEX IF NOT EXISTS idx_monthly_stats_user_id ON monthly_stats(user_id);
 CREATE INDEX IF NOT EXISTS idx_monthly_stats_month ON monthly_stats(month);
 
+-- Cumul quotidien par utilisateur, tenu à jour par trigger à chaque écriture dans sessions
+CREATE TABLE IF NOT EXISTS daily_user_totals (
+    user_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    seconds BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+-- Index pour les classements par période
+CREATE INDEX IF NOT EXISTS idx_daily_user_totals_day ON daily_user_totals(day);
+
 -- Fonction pour mettre à jour updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -79,34 +95,277 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Fonction pour répercuter chaque écriture de session sur daily_user_totals
+CREATE OR REPLACE FUNCTION update_daily_user_totals()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE daily_user_totals
+        SET seconds = seconds - OLD.duration_seconds
+        WHERE user_id = OLD.user_id
+          AND day = OLD.start_time::date;
+
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM daily_user_totals
+            WHERE user_id = OLD.user_id
+              AND day = OLD.start_time::date
+              AND seconds <= 0;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO daily_user_totals (user_id, day, seconds)
+        VALUES (NEW.user_id, NEW.start_time::date, NEW.duration_seconds)
+        ON CONFLICT (user_id, day)
+        DO UPDATE SET seconds = daily_user_totals.seconds + EXCLUDED.seconds;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Archivage d'une tranche de sessions : agrégation mensuelle et suppression en une seule instruction
+CREATE OR REPLACE FUNCTION archive_sessions(p_from TIMESTAMP WITH TIME ZONE, p_to TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_archived INTEGER;
+BEGIN
+    WITH archived AS (
+        DELETE FROM sessions
+        WHERE start_time >= p_from
+          AND start_time < p_to
+        RETURNING user_id, start_time, duration_seconds
+    ), monthly AS (
+        INSERT INTO monthly_stats (user_id, month, total_seconds)
+        SELECT user_id, DATE_TRUNC('month', start_time)::date, SUM(duration_seconds)
+        FROM archived
+        GROUP BY user_id, DATE_TRUNC('month', start_time)
+        ON CONFLICT (user_id, month)
+        DO UPDATE SET total_seconds = monthly_stats.total_seconds + EXCLUDED.total_seconds
+    )
+    SELECT COUNT(*) INTO v_archived FROM archived;
+
+    RETURN v_archived;
+END;
+$$;
+
 -- Procédure pour agréger les anciennes sessions
 CREATE OR REPLACE PROCEDURE aggregate_old_sessions()
 LANGUAGE plpgsql
 AS $$
 BEGIN
-    -- Agréger les anciennes sessions
-    INSERT INTO monthly_stats (user_id, month, total_seconds)
-    SELECT 
-        user_id,
-        DATE_TRUNC('month', start_time)::date,
-        SUM(duration_seconds)
-    FROM sessions
-    WHERE start_time < NOW() - INTERVAL '6 months'
-    GROUP BY user_id, DATE_TRUNC('month', start_time)
-    ON CONFLICT (user_id, month) 
-    DO UPDATE SET 
-        total_seconds = EXCLUDED.total_seconds;
-
-    -- Supprimer les anciennes sessions
-    DELETE FROM sessions 
-    WHERE start_time < NOW() - INTERVAL '6 months';
+    PERFORM archive_sessions('-infinity', NOW() - INTERVAL '6 months');
+END;
+$$;
+
+-- Classement agrégé côté serveur : une page du top trié avec le nombre total de participants
+CREATE OR REPLACE FUNCTION get_leaderboard_page(
+    p_start TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    p_end TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    p_limit INTEGER DEFAULT 10,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (user_id BIGINT, total_seconds BIGINT, total_count BIGINT)
+LANGUAGE plpgsql
+STABLE
+AS $$
+#variable_conflict use_column
+BEGIN
+    -- Bornes alignées sur des jours : lecture du cumul quotidien plutôt que des sessions
+    IF (p_start IS NULL OR p_start = DATE_TRUNC('day', p_start))
+       AND (p_end IS NULL OR p_end = DATE_TRUNC('day', p_end)) THEN
+        RETURN QUERY
+        SELECT totals.user_id, totals.total_seconds, COUNT(*) OVER () AS total_count
+        FROM (
+            SELECT d.user_id, SUM(d.seconds)::BIGINT AS total_seconds
+            FROM daily_user_totals d
+            WHERE (p_start IS NULL OR d.day >= p_start::date)
+              AND (p_end IS NULL OR d.day < p_end::date)
+              AND d.seconds > 0
+            GROUP BY d.user_id
+        ) totals
+        ORDER BY totals.total_seconds DESC, totals.user_id
+        LIMIT p_limit
+        OFFSET p_offset;
+    ELSE
+        RETURN QUERY
+        SELECT totals.user_id, totals.total_seconds, COUNT(*) OVER () AS total_count
+        FROM (
+            SELECT s.user_id, SUM(s.duration_seconds)::BIGINT AS total_seconds
+            FROM sessions s
+            WHERE (p_start IS NULL OR s.start_time >= p_start)
+              AND (p_end IS NULL OR s.start_time < p_end)
+            GROUP BY s.user_id
+        ) totals
+        ORDER BY totals.total_seconds DESC, totals.user_id
+        LIMIT p_limit
+        OFFSET p_offset;
+    END IF;
+END;
+$$;
+
+-- Classements de plusieurs périodes en une seule lecture du cumul quotidien :
+-- chaque période est une somme filtrée sur la plus large fenêtre, une période à NULL n'est pas calculée
+CREATE OR REPLACE FUNCTION get_period_leaderboards(
+    p_daily DATE DEFAULT NULL,
+    p_weekly DATE DEFAULT NULL,
+    p_monthly DATE DEFAULT NULL,
+    p_yearly DATE DEFAULT NULL,
+    p_end DATE DEFAULT NULL,
+    p_limit INTEGER DEFAULT 10
+)
+RETURNS TABLE (period TEXT, user_id BIGINT, total_seconds BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH totals AS (
+        SELECT d.user_id,
+               SUM(d.seconds) FILTER (WHERE d.day >= p_daily) AS daily,
+               SUM(d.seconds) FILTER (WHERE d.day >= p_weekly) AS weekly,
+               SUM(d.seconds) FILTER (WHERE d.day >= p_monthly) AS monthly,
+               SUM(d.seconds) FILTER (WHERE d.day >= p_yearly) AS yearly
+        FROM daily_user_totals d
+        -- LEAST ignore les NULL : la fenêtre commence au début de la plus longue période demandée
+        WHERE d.day >= LEAST(p_daily, p_weekly, p_monthly, p_yearly)
+          AND (p_end IS NULL OR d.day < p_end)
+        GROUP BY d.user_id
+    ),
+    ranked AS (
+        SELECT p.period, t.user_id, p.total_seconds::BIGINT AS total_seconds,
+               ROW_NUMBER() OVER (PARTITION BY p.period ORDER BY p.total_seconds DESC, t.user_id) AS position
+        FROM totals t
+        CROSS JOIN LATERAL (
+            VALUES ('daily', t.daily), ('weekly', t.weekly), ('monthly', t.monthly), ('yearly', t.yearly)
+        ) AS p(period, total_seconds)
+        WHERE p.total_seconds > 0
+    )
+    SELECT r.period, r.user_id, r.total_seconds
+    FROM ranked r
+    WHERE r.position <= p_limit
+    ORDER BY r.period, r.position;
+$$;
+
+-- Temps total (cumul quotidien des sessions + mois archivés) pour une liste d'utilisateurs
+CREATE OR REPLACE FUNCTION get_users_lifetime_seconds(p_user_ids BIGINT[])
+RETURNS TABLE (user_id BIGINT, total_seconds BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT ids.user_id, COALESCE(recent.seconds, 0) + COALESCE(archived.seconds, 0) AS total_seconds
+    FROM UNNEST(p_user_ids) AS ids(user_id)
+    LEFT JOIN (
+        SELECT d.user_id, SUM(d.seconds)::BIGINT AS seconds
+        FROM daily_user_totals d
+        WHERE d.user_id = ANY(p_user_ids)
+        GROUP BY d.user_id
+    ) recent ON recent.user_id = ids.user_id
+    LEFT JOIN (
+        SELECT m.user_id, SUM(m.total_seconds)::BIGINT AS seconds
+        FROM monthly_stats m
+        WHERE m.user_id = ANY(p_user_ids)
+        GROUP BY m.user_id
+    ) archived ON archived.user_id = ids.user_id;
+$$;
+
+-- État de discipline et nombre de jours validés sur une plage de jours, par pages de p_limit utilisateurs
+CREATE OR REPLACE FUNCTION get_discipline_window(
+    p_start DATE,
+    p_end DATE,
+    p_min_seconds INTEGER,
+    p_after_user_id BIGINT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    user_id BIGINT,
+    discipline_level INTEGER,
+    best_discipline_level INTEGER,
+    last_check TIMESTAMP WITH TIME ZONE,
+    validated_days INTEGER
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT u.user_id, u.discipline_level, u.best_discipline_level, u.last_check,
+           COUNT(d.day)::INTEGER AS validated_days
+    FROM user_discipline u
+    LEFT JOIN daily_user_totals d
+        ON d.user_id = u.user_id
+       AND d.day BETWEEN p_start AND p_end
+       AND d.seconds >= p_min_seconds
+    WHERE p_after_user_id IS NULL OR u.user_id > p_after_user_id
+    GROUP BY u.user_id, u.discipline_level, u.best_discipline_level, u.last_check
+    ORDER BY u.user_id
+    LIMIT p_limit;
+$$;
+
+-- Compactage : les lignes consécutives d'un même utilisateur et d'un même jour
+-- (fin d'une ligne = début de la suivante) sont fusionnées dans la première.
+-- Limité aux lignes commencées dans [p_from, p_before) : chaque passage ne lit qu'une tranche récente
+DROP FUNCTION IF EXISTS compact_sessions(TIMESTAMP WITH TIME ZONE);
+CREATE OR REPLACE FUNCTION compact_sessions(p_from TIMESTAMP WITH TIME ZONE, p_before TIMESTAMP WITH TIME ZONE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_merged INTEGER;
+BEGIN
+    DROP TABLE IF EXISTS session_chains;
+    CREATE TEMP TABLE session_chains ON COMMIT DROP AS
+    SELECT id, end_time, duration_seconds,
+           FIRST_VALUE(id) OVER (PARTITION BY user_id, chain_id ORDER BY start_time, id) AS head_id
+    FROM (
+        SELECT id, user_id, start_time, end_time, duration_seconds,
+               COUNT(*) FILTER (WHERE NOT is_chained) OVER (PARTITION BY user_id ORDER BY start_time, id) AS chain_id
+        FROM (
+            SELECT s.id, s.user_id, s.start_time, s.end_time, s.duration_seconds,
+                   COALESCE(
+                       LAG(s.end_time) OVER w = s.start_time
+                       AND LAG(s.start_time::date) OVER w = s.start_time::date,
+                       FALSE
+                   ) AS is_chained
+            FROM sessions s
+            WHERE s.start_time >= p_from
+              AND s.end_time < p_before
+            WINDOW w AS (PARTITION BY s.user_id ORDER BY s.start_time, s.id)
+        ) ordered
+    ) chained;
+
+    UPDATE sessions s
+    SET end_time = c.end_time,
+        duration_seconds = c.duration_seconds
+    FROM (
+        SELECT head_id, MAX(end_time) AS end_time, SUM(duration_seconds) AS duration_seconds
+        FROM session_chains
+        GROUP BY head_id
+        HAVING COUNT(*) > 1
+    ) c
+    WHERE s.id = c.head_id;
+
+    DELETE FROM sessions s
+    USING session_chains c
+    WHERE s.id = c.id
+      AND c.id <> c.head_id;
+    GET DIAGNOSTICS v_merged = ROW_COUNT;
+
+    RETURN v_merged;
 END;
 $$;
 
+-- Initialisation du cumul quotidien à partir des sessions existantes (recalcul idempotent)
+INSERT INTO daily_user_totals (user_id, day, seconds)
+SELECT user_id, start_time::date, SUM(duration_seconds)
+FROM sessions
+GROUP BY user_id, start_time::date
+ON CONFLICT (user_id, day)
+DO UPDATE SET seconds = EXCLUDED.seconds;
+
 -- Suppression des anciens triggers s'ils existent
 DROP TRIGGER IF EXISTS update_streaks_updated_at ON streaks;
 DROP TRIGGER IF EXISTS update_user_roles_updated_at ON user_roles;
 DROP TRIGGER IF EXISTS update_user_discipline_updated_at ON user_discipline;
+DROP TRIGGER IF EXISTS update_sessions_daily_user_totals ON sessions;
 
 -- Création des triggers
 CREATE TRIGGER update_streaks_updated_at
@@ -122,4 +381,9 @@ CREATE TRIGGER update_user_roles_updated_at
 CREATE TRIGGER update_user_discipline_updated_at
     BEFORE UPDATE ON user_discipline
     FOR EACH ROW
-    EXECUTE FUNCTION update_updated_at_column(); 
\ No newline at end of file
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_sessions_daily_user_totals
+    AFTER INSERT OR UPDATE OR DELETE ON sessions
+    FOR EACH ROW
+    EXECUTE FUNCTION update_daily_user_totals();
@@ -1,11 +1,15 @@
 import os
 from supabase import create_client, Client
-from config import SUPABASE_URL, SUPABASE_KEY
+from postgrest.types import CountMethod, ReturnMethod
+from config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_MAX_CONCURRENCY
 import logging
 import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Set, Tuple, AsyncIterator
 import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from metrics import supabase_request_seconds, supabase_retries_total, supabase_errors_total
 
 logger = logging.getLogger('Focusbot')
 
@@ -16,21 +20,42 @@ def with_retry(max_retries=3, delay=1):
         async def wrapper(*args, **kwargs):
             last_error = None
             for attempt in range(max_retries):
+                start = time.perf_counter()
                 try:
-                    return await func(*args, **kwargs)
+                    result = await func(*args, **kwargs)
+                    supabase_request_seconds.observe(time.perf_counter() - start, method=func.__name__, outcome='success')
+                    return result
                 except Exception as e:
+                    supabase_request_seconds.observe(time.perf_counter() - start, method=func.__name__, outcome='error')
                     last_error = e
                     if attempt < max_retries - 1:
                         wait_time = delay * (2 ** attempt)  # Exponential backoff
+                        supabase_retries_total.inc(method=func.__name__)
                         logger.warning(f"Tentative {attempt + 1}/{max_retries} échouée pour {func.__name__}. Nouvelle tentative dans {wait_time}s. Erreur: {e}")
                         await asyncio.sleep(wait_time)
+            supabase_errors_total.inc(method=func.__name__)
             logger.error(f"Toutes les tentatives ont échoué pour {func.__name__}. Dernière erreur: {last_error}")
             raise last_error
         return wrapper
     return decorator
 
+def get_period_start(period: str, now: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+    """Retourne le début d'une période (daily, weekly, monthly, yearly), None pour tout l'historique"""
+    now = now or datetime.datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if period == 'daily':
+        return midnight
+    elif period == 'weekly':
+        return midnight - datetime.timedelta(days=now.weekday())
+    elif period == 'monthly':
+        return midnight.replace(day=1)
+    elif period == 'yearly':
+        return midnight.replace(month=1, day=1)
+    return None
+
 class SupabaseClient:
-    def __init__(self):
+    def __init__(self, max_concurrency: int = SUPABASE_MAX_CONCURRENCY):
         try:
             if not SUPABASE_URL or not SUPABASE_KEY:
                 raise ValueError("Les variables d'environnement SUPABASE_URL et SUPABASE_KEY sont requises")
@@ -38,103 +63,160 @@ class SupabaseClient:
             self.client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
             # Configuration du timeout
             self.client.postgrest.timeout = 10  # 10 secondes de timeout
+            # Pool dédié aux appels PostgREST : le client supabase-py est synchrone,
+            # chaque .execute() est donc exécuté hors de la boucle d'événements
+            self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='supabase')
             logger.info("Connexion à Supabase établie avec succès")
         except Exception as e:
             logger.error(f"Erreur lors de l'initialisation de Supabase: {e}")
             raise
 
-    @with_retry(max_retries=3, delay=1)
-    async def add_session(self, user_id: int, start_time: datetime.datetime, end_time: datetime.datetime, duration_seconds: int):
-        """Ajoute une session vocale à la base de données"""
-        data = {
-            'user_id': user_id,
-            'start_time': start_time.isoformat(),
-            'end_time': end_time.isoformat(),
-            'duration_seconds': duration_seconds
-        }
-        response = self.client.table('sessions').insert(data).execute()
-        return response.data
+    async def execute(self, query):
+        """Exécute une requête PostgREST dans le pool dédié sans bloquer la boucle d'événements"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, query.execute)
+
+    def close(self):
+        """Libère le pool de threads des requêtes"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
     @with_retry(max_retries=3, delay=1)
+    async def upsert_sessions(self, sessions: List[Dict]):
+        """Crée ou met à jour un lot de sessions ouvertes, identifiées par leur session_key"""
+        query = self.client.table('sessions')\
+            .upsert(sessions, on_conflict='session_key', returning=ReturnMethod.minimal)
+        await self.execute(query)
+
     async def get_user_stats(self, user_id: int):
         """Récupère les statistiques d'un utilisateur"""
-        # Récupérer le temps total en secondes des 6 derniers mois
-        response = self.client.table('sessions')\
-            .select('duration_seconds')\
-            .eq('user_id', user_id)\
-            .gte('start_time', (datetime.datetime.now() - datetime.timedelta(days=180)).isoformat())\
-            .execute()
-        
-        recent_seconds = sum(session['duration_seconds'] for session in response.data)
+        stats = await self.get_users_stats([user_id])
+        return stats.get(user_id, {'total_hours': 0, 'total_seconds': 0})
+
+    @with_retry(max_retries=3, delay=1)
+    async def _get_lifetime_seconds(self, user_ids: List[int]) -> Dict[int, int]:
+        """Récupère le temps total en secondes d'un lot d'utilisateurs en une seule requête"""
+        response = await self.execute(self.client.rpc('get_users_lifetime_seconds', {'p_user_ids': user_ids}))
+        return {row['user_id']: row['total_seconds'] for row in response.data}
+
+    async def get_users_stats(self, user_ids: List[int], chunk_size: int = 1000) -> Dict[int, Dict]:
+        """Récupère les statistiques de plusieurs utilisateurs (cumul quotidien + mois archivés), par lots"""
+        lifetime_seconds = {}
+        for i in range(0, len(user_ids), chunk_size):
+            # La fonction renvoie une ligne par identifiant : ceux qu'une limite db-max-rows a coupés sont redemandés
+            remaining = user_ids[i:i + chunk_size]
+            while remaining:
+                chunk = await self._get_lifetime_seconds(remaining)
+                if not chunk:
+                    break
+                lifetime_seconds.update(chunk)
+                remaining = [user_id for user_id in remaining if user_id not in chunk]
 
-        # Récupérer les statistiques agrégées des mois plus anciens
-        old_stats = self.client.table('monthly_stats')\
-            .select('total_seconds')\
-            .eq('user_id', user_id)\
-            .execute()
-        
-        old_seconds = sum(stat['total_seconds'] for stat in old_stats.data)
-        
-        # Calculer le total
-        total_seconds = recent_seconds + old_seconds
-        total_hours = total_seconds / 3600  # Conversion en heures
-        
         return {
-            'total_hours': total_hours,
-            'total_seconds': total_seconds
+            user_id: {
+                'total_hours': total_seconds / 3600,  # Conversion en heures
+                'total_seconds': total_seconds
+            }
+            for user_id, total_seconds in lifetime_seconds.items()
         }
 
     @with_retry(max_retries=3, delay=1)
-    async def get_user_streak(self, user_id: int) -> dict:
+    async def get_user_streak(self, user_id: int) -> Optional[Dict]:
         """Récupère les données de streak d'un utilisateur"""
-        response = await self.client.table('user_stats').select('*').eq('user_id', user_id).execute()
+        response = await self.execute(self.client.table('streaks').select('*').eq('user_id', user_id))
         if response.data:
             return response.data[0]
         return None
 
     @with_retry(max_retries=3, delay=1)
-    async def update_streak(self, user_id: int, current_streak: int, longest_streak: int) -> None:
-        """Met à jour le streak d'un utilisateur"""
-        today = datetime.datetime.now().date()
+    async def update_streak(self, user_id: int, current_streak: int, longest_streak: int, day: datetime.date) -> None:
+        """Met à jour le streak d'un utilisateur, actif le jour donné"""
         data = {
             'user_id': user_id,
             'current_streak': current_streak,
             'longest_streak': longest_streak,
-            'last_active_date': today.isoformat()
+            'last_active_date': day.isoformat()
         }
-        
-        # Vérifier si l'utilisateur existe déjà
-        existing = await self.get_user_streak(user_id)
-        if existing:
-            await self.client.table('user_stats').update(data).eq('user_id', user_id).execute()
-        else:
-            await self.client.table('user_stats').insert(data).execute()
+        query = self.client.table('streaks')\
+            .upsert(data, on_conflict='user_id', returning=ReturnMethod.minimal)
+        await self.execute(query)
 
     @with_retry(max_retries=3, delay=1)
-    async def get_all_users_with_sessions(self) -> list:
-        """Récupère la liste de tous les utilisateurs qui ont des sessions"""
-        response = await self.client.table('sessions').select('user_id').execute()
-        if response.data:
-            # Retourner une liste unique d'user_ids
-            return list(set(session['user_id'] for session in response.data))
-        return []
+    async def _fetch_sessions_page(self, query) -> List[Tuple]:
+        response = await self.execute(query)
+        return [
+            (
+                row['id'],
+                row['user_id'],
+                datetime.datetime.fromisoformat(row['start_time']).replace(tzinfo=None),
+                datetime.datetime.fromisoformat(row['end_time']).replace(tzinfo=None),
+                row['duration_seconds']
+            )
+            for row in response.data
+        ]
+
+    async def iter_sessions(self, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+                            user_id: Optional[int] = None, page_size: int = 1000) -> AsyncIterator[Tuple]:
+        """Parcourt les sessions d'une plage page par page, triées par (start_time, id)
+
+        Chaque session est produite sous la forme (id, user_id, start_time, end_time, duration_seconds).
+        La pagination par clé reprend après la dernière session lue et ne s'arrête que sur une page vide :
+        aucune limite de lignes PostgREST (db-max-rows) ne tronque le parcours et la mémoire reste bornée à une page.
+        """
+        def build_query():
+            query = self.client.table('sessions')\
+                .select('id, user_id, start_time, end_time, duration_seconds')
+            if user_id is not None:
+                query = query.eq('user_id', user_id)
+            if end is not None:
+                query = query.lt('start_time', end.isoformat())
+            return query
+
+        last_start, last_id = start, None
+        while True:
+            query = build_query()
+            if last_start is not None:
+                query = query.gte('start_time', last_start.isoformat())
+            page = await self._fetch_sessions_page(query.order('start_time,id').limit(page_size))
+
+            # Les sessions déjà produites qui partagent le dernier start_time sont écartées
+            fresh = [row for row in page if last_id is None or (row[2], row[0]) > (last_start, last_id)]
+            for row in fresh:
+                yield row
+            if fresh:
+                last_start, last_id = fresh[-1][2], fresh[-1][0]
+
+            # Seule une page vide termine le parcours : une page courte peut venir de db-max-rows
+            if not page:
+                return
+            if not fresh:
+                # Page entière au même start_time : on la termine par identifiant avant d'avancer
+                while True:
+                    query = build_query().eq('start_time', last_start.isoformat()).gt('id', last_id)
+                    page = await self._fetch_sessions_page(query.order('id').limit(page_size))
+                    for row in page:
+                        yield row
+                    if not page:
+                        break
+                    last_id = page[-1][0]
+                last_start += datetime.timedelta(microseconds=1)
+                last_id = None
 
     @with_retry(max_retries=3, delay=1)
     async def get_user_role(self, user_id: int):
         """Récupère le rôle actuel d'un utilisateur"""
-        response = self.client.table('user_roles')\
+        query = self.client.table('user_roles')\
             .select('role_name')\
-            .eq('user_id', user_id)\
-            .execute()
+            .eq('user_id', user_id)
+        response = await self.execute(query)
         return response.data[0] if response.data else None
 
     @with_retry(max_retries=3, delay=1)
     async def check_user_role_exists(self, user_id: int) -> bool:
         """Vérifie si un utilisateur existe dans la table user_roles"""
-        response = self.client.table('user_roles')\
+        query = self.client.table('user_roles')\
             .select('user_id')\
-            .eq('user_id', user_id)\
-            .execute()
+            .eq('user_id', user_id)
+        response = await self.execute(query)
         return len(response.data) > 0
 
     @with_retry(max_retries=3, delay=1)
@@ -149,207 +231,287 @@ class SupabaseClient:
         # Vérifier si l'utilisateur existe déjà
         exists = await self.check_user_role_exists(user_id)
         if exists:
-            response = self.client.table('user_roles')\
+            query = self.client.table('user_roles')\
                 .update(data)\
-                .eq('user_id', user_id)\
-                .execute()
+                .eq('user_id', user_id)
+            response = await self.execute(query)
         else:
-            response = self.client.table('user_roles')\
-                .insert(data)\
-                .execute()
+            query = self.client.table('user_roles')\
+                .insert(data)
+            response = await self.execute(query)
         return response.data
 
     @with_retry(max_retries=3, delay=1)
     async def delete_user_role(self, user_id: int) -> bool:
         """Supprime le rôle d'un utilisateur de la base de données"""
-        response = self.client.table('user_roles')\
+        query = self.client.table('user_roles')\
             .delete()\
-            .eq('user_id', user_id)\
-            .execute()
+            .eq('user_id', user_id)
+        response = await self.execute(query)
         return True if response.data else False
 
     @with_retry(max_retries=3, delay=1)
-    async def get_leaderboard(self, period: str) -> Optional[List[Dict]]:
-        """Récupère le classement pour une période donnée"""
-        now = datetime.datetime.now()
-        
-        # Définir la date de début selon la période
-        if period == 'daily':
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'weekly':
-            start_date = now - datetime.timedelta(days=now.weekday())
-            start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'monthly':
-            start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'yearly':
-            start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        else:  # 'all'
-            start_date = None
-
-        # Construire la requête
-        query = self.client.table('sessions').select('user_id, duration_seconds')
-        if start_date:
-            query = query.gte('start_time', start_date.isoformat())
-        
-        response = query.execute()
-        
-        # Grouper par utilisateur et calculer le total
-        user_totals = {}
-        for session in response.data:
-            user_id = session['user_id']
-            if user_id not in user_totals:
-                user_totals[user_id] = 0
-            user_totals[user_id] += session['duration_seconds']
-        
-        # Convertir en liste et trier
-        leaderboard = [
-            {'user_id': user_id, 'total_seconds': total}
-            for user_id, total in user_totals.items()
+    async def get_leaderboard_page(self, start_date: Optional[datetime.datetime] = None, limit: int = 10, offset: int = 0,
+                                   end_date: Optional[datetime.datetime] = None) -> Dict:
+        """Récupère une page du classement agrégé côté serveur, avec le nombre total de participants"""
+        params = {
+            'p_start': start_date.isoformat() if start_date else None,
+            'p_end': end_date.isoformat() if end_date else None,
+            'p_limit': limit,
+            'p_offset': offset
+        }
+        response = await self.execute(self.client.rpc('get_leaderboard_page', params))
+
+        entries = [
+            {'user_id': row['user_id'], 'total_seconds': row['total_seconds']}
+            for row in response.data
         ]
-        leaderboard.sort(key=lambda x: x['total_seconds'], reverse=True)
-        
-        return leaderboard
+        total_count = response.data[0]['total_count'] if response.data else 0
+        return {'entries': entries, 'total_count': total_count}
+
+    async def get_leaderboard(self, period: str, limit: int = 10, offset: int = 0) -> Optional[List[Dict]]:
+        """Récupère le classement pour une période donnée (daily, weekly, monthly, yearly ou all)"""
+        page = await self.get_leaderboard_page(get_period_start(period), limit, offset)
+        return page['entries']
+
+    @with_retry(max_retries=3, delay=1)
+    async def get_period_leaderboards(self, starts: Dict[str, datetime.date], end: Optional[datetime.date] = None,
+                                      limit: int = 10) -> Dict[str, List[Dict]]:
+        """Récupère en une requête les classements de plusieurs périodes (daily, weekly, monthly, yearly) se terminant à end (exclu)"""
+        params = {f'p_{period}': start.isoformat() for period, start in starts.items()}
+        params['p_end'] = end.isoformat() if end else None
+        params['p_limit'] = limit
+        response = await self.execute(self.client.rpc('get_period_leaderboards', params))
+
+        leaderboards = {period: [] for period in starts}
+        for row in response.data:
+            leaderboards[row['period']].append({'user_id': row['user_id'], 'total_seconds': row['total_seconds']})
+        return leaderboards
 
     @with_retry(max_retries=3, delay=1)
     async def get_user_discipline(self, user_id: int) -> Optional[Dict]:
         """Récupère les données de discipline d'un utilisateur"""
-        response = self.client.table('user_discipline').select('*').eq('user_id', user_id).execute()
+        response = await self.execute(self.client.table('user_discipline').select('*').eq('user_id', user_id))
         if response.data:
             return response.data[0]
         return None
 
     @with_retry(max_retries=3, delay=1)
-    async def update_discipline(self, user_id: int, discipline_level: int, best_discipline_level: int, last_check: datetime.datetime) -> bool:
-        """Met à jour les données de discipline d'un utilisateur"""
-        data = {
-            'discipline_level': discipline_level,
-            'best_discipline_level': best_discipline_level,
-            'last_check': last_check.isoformat()
-        }
-        response = self.client.table('user_discipline').update(data).eq('user_id', user_id).execute()
-        return True if response.data else False
+    async def _get_discipline_window_page(self, params: Dict) -> List[Dict]:
+        response = await self.execute(self.client.rpc('get_discipline_window', params))
+        return response.data
+
+    async def get_discipline_window(self, start_day: datetime.date, end_day: datetime.date, min_seconds: int,
+                                    page_size: int = 1000) -> List[Dict]:
+        """Récupère l'état de discipline de tous les utilisateurs et leurs jours validés entre deux dates incluses"""
+        rows = []
+        after_user_id = None
+        while True:
+            page = await self._get_discipline_window_page({
+                'p_start': start_day.isoformat(),
+                'p_end': end_day.isoformat(),
+                'p_min_seconds': min_seconds,
+                'p_after_user_id': after_user_id,
+                'p_limit': page_size
+            })
+            if not page:
+                return rows
+            rows.extend(page)
+            after_user_id = page[-1]['user_id']
+
+    @with_retry(max_retries=3, delay=1)
+    async def _get_discipline_page(self, after_user_id: Optional[int], page_size: int) -> List[Dict]:
+        query = self.client.table('user_discipline').select('*').order('user_id').limit(page_size)
+        if after_user_id is not None:
+            query = query.gt('user_id', after_user_id)
+        response = await self.execute(query)
+        return response.data
+
+    async def get_all_discipline(self, page_size: int = 1000) -> List[Dict]:
+        """Récupère les données de discipline de tous les utilisateurs, par pages sur user_id"""
+        rows = []
+        after_user_id = None
+        while True:
+            page = await self._get_discipline_page(after_user_id, page_size)
+            if not page:
+                return rows
+            rows.extend(page)
+            after_user_id = page[-1]['user_id']
+
+    @with_retry(max_retries=3, delay=1)
+    async def _get_validated_days_page(self, query) -> List[Tuple[int, datetime.date]]:
+        response = await self.execute(query)
+        return [(row['user_id'], datetime.date.fromisoformat(row['day'])) for row in response.data]
+
+    async def get_validated_days(self, start_day: datetime.date, end_day: datetime.date, min_seconds: int,
+                                 page_size: int = 1000) -> Dict[int, Set[datetime.date]]:
+        """Récupère, pour tous les utilisateurs, les jours entre deux dates incluses où le temps atteint min_seconds
+
+        Pagination par clé sur (user_id, day), comme iter_sessions : chaque page reprend après la dernière
+        ligne lue et seule une page vide termine la lecture, sans dépendre de la sémantique de range()
+        ni de la limite de lignes PostgREST.
+        """
+        def build_query():
+            return self.client.table('daily_user_totals')\
+                .select('user_id, day')\
+                .gte('day', start_day.isoformat())\
+                .lte('day', end_day.isoformat())\
+                .gte('seconds', min_seconds)
+
+        validated: Dict[int, Set[datetime.date]] = {}
+        last_user_id, last_day = None, None
+        while True:
+            query = build_query()
+            if last_user_id is not None:
+                query = query.gte('user_id', last_user_id)
+            page = await self._get_validated_days_page(query.order('user_id,day').limit(page_size))
+
+            # Les jours déjà lus du dernier utilisateur sont écartés
+            fresh = [row for row in page if last_day is None or row > (last_user_id, last_day)]
+            for user_id, day in fresh:
+                validated.setdefault(user_id, set()).add(day)
+            if fresh:
+                last_user_id, last_day = fresh[-1]
+
+            if not page:
+                return validated
+            if not fresh:
+                # Page entière du même utilisateur : on termine ses jours avant de passer au suivant
+                while True:
+                    query = build_query().eq('user_id', last_user_id).gt('day', last_day.isoformat())
+                    page = await self._get_validated_days_page(query.order('day').limit(page_size))
+                    if not page:
+                        break
+                    for user_id, day in page:
+                        validated.setdefault(user_id, set()).add(day)
+                    last_day = page[-1][1]
+                last_user_id, last_day = last_user_id + 1, None
+
+    @with_retry(max_retries=3, delay=1)
+    async def upsert_discipline(self, rows: List[Dict], chunk_size: int = 1000):
+        """Écrit en bloc les données de discipline (user_id, discipline_level, best_discipline_level, last_check)"""
+        for i in range(0, len(rows), chunk_size):
+            query = self.client.table('user_discipline')\
+                .upsert(rows[i:i + chunk_size], on_conflict='user_id', returning=ReturnMethod.minimal)
+            await self.execute(query)
 
     @with_retry(max_retries=3, delay=1)
     async def get_period_stats(self, user_id: int, period: str) -> Optional[Dict]:
         """Récupère les statistiques d'un utilisateur pour une période donnée (daily, weekly, monthly, yearly)"""
-        now = datetime.datetime.now()
-        start_date = None
-
-        if period == 'daily':
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'weekly':
-            start_date = now - datetime.timedelta(days=now.weekday())
-            start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'monthly':
-            start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'yearly':
-            start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-
+        start_date = get_period_start(period)
         if not start_date:
             return None
 
-        response = self.client.table('sessions')\
-            .select('start_time, duration_seconds')\
-            .eq('user_id', user_id)\
-            .gte('start_time', start_date.isoformat())\
-            .order('start_time', desc=False)\
-            .execute()
-
-        if not response.data:
+        # Au plus 366 lignes du cumul quotidien, quel que soit le nombre de sessions
+        rows = []
+        while True:
+            query = self.client.table('daily_user_totals')\
+                .select('day, seconds', count=CountMethod.exact)\
+                .eq('user_id', user_id)\
+                .gte('day', start_date.date().isoformat())\
+                .gt('seconds', 0)\
+                .order('day', desc=False)
+            if rows:
+                query = query.gt('day', rows[-1]['day'])
+            response = await self.execute(query)
+            rows.extend(response.data)
+            # Le nombre de lignes, lu dans la même réponse, révèle une réponse tronquée par db-max-rows
+            if not response.data or len(response.data) >= response.count:
+                break
+
+        if not rows:
             return None
 
-        # Grouper les sessions par jour
-        daily_stats = {}
-        for session in response.data:
-            session_date = datetime.datetime.fromisoformat(session['start_time']).date()
-            if session_date not in daily_stats:
-                daily_stats[session_date] = 0
-            daily_stats[session_date] += session['duration_seconds']
-
         # Retourner une liste de dictionnaires pour chaque jour
         return [{
-            'date': date.isoformat(),
-            'total_seconds': total_seconds
-        } for date, total_seconds in daily_stats.items()]
+            'date': row['day'],
+            'total_seconds': row['seconds']
+        } for row in rows]
 
     @with_retry(max_retries=3, delay=1)
-    async def get_day_stats(self, user_id: int, date: datetime.datetime) -> Optional[Dict]:
-        """Récupère les statistiques d'un utilisateur pour un jour spécifique"""
-        start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day = date.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-        response = self.client.table('sessions')\
-            .select('duration_seconds')\
-            .eq('user_id', user_id)\
-            .gte('start_time', start_of_day.isoformat())\
-            .lte('start_time', end_of_day.isoformat())\
-            .execute()
+    async def _get_day_totals_page(self, day: datetime.date, after_user_id: Optional[int], page_size: int) -> List[Dict]:
+        query = self.client.table('daily_user_totals')\
+            .select('user_id, seconds')\
+            .eq('day', day.isoformat())\
+            .order('user_id')\
+            .limit(page_size)
+        if after_user_id is not None:
+            query = query.gt('user_id', after_user_id)
+        response = await self.execute(query)
+        return response.data
+
+    async def get_day_totals(self, day: datetime.date, page_size: int = 1000) -> Dict[int, int]:
+        """Récupère le temps de tous les utilisateurs pour un jour donné, par pages sur user_id"""
+        totals = {}
+        after_user_id = None
+        while True:
+            page = await self._get_day_totals_page(day, after_user_id, page_size)
+            if not page:
+                return totals
+            for row in page:
+                totals[row['user_id']] = row['seconds']
+            after_user_id = page[-1]['user_id']
 
+    @with_retry(max_retries=3, delay=1)
+    async def get_oldest_session_start(self, before: datetime.datetime) -> Optional[datetime.datetime]:
+        """Récupère le début de la plus ancienne session antérieure à une date"""
+        query = self.client.table('sessions')\
+            .select('start_time')\
+            .lt('start_time', before.isoformat())\
+            .order('start_time', desc=False)\
+            .limit(1)
+        response = await self.execute(query)
         if not response.data:
             return None
-
-        total_seconds = sum(session['duration_seconds'] for session in response.data)
-        return {'total_seconds': total_seconds}
+        return datetime.datetime.fromisoformat(response.data[0]['start_time']).replace(tzinfo=None)
 
     @with_retry(max_retries=3, delay=1)
-    async def aggregate_old_sessions(self) -> bool:
-        """Agrège les sessions vocales de plus de 6 mois dans une table mensuelle"""
+    async def archive_sessions(self, start: datetime.datetime, end: datetime.datetime) -> int:
+        """Archive dans monthly_stats les sessions d'une tranche de temps et les supprime (une transaction)"""
+        params = {'p_from': start.isoformat(), 'p_to': end.isoformat()}
+        response = await self.execute(self.client.rpc('archive_sessions', params))
+        return response.data or 0
+
+    async def aggregate_old_sessions(self, chunk_days: int = 7) -> bool:
+        """Agrège les sessions vocales de plus de 6 mois dans une table mensuelle, par tranches de chunk_days jours"""
         six_months_ago = datetime.datetime.now() - datetime.timedelta(days=180)
-        
-        # Récupérer les sessions à agréger
-        response = self.client.table('sessions')\
-            .select('id, user_id, duration_seconds, start_time')\
-            .lt('start_time', six_months_ago.isoformat())\
-            .execute()
-        
-        if not response.data:
+
+        # Chaque tranche est archivée atomiquement : après une interruption, on reprend à la plus ancienne restante
+        oldest = await self.get_oldest_session_start(six_months_ago)
+        if oldest is None:
             logger.info("Aucune ancienne session à agréger.")
             return False
 
-        # Agrégation par mois et par utilisateur
-        monthly_aggregates = {}
-        for session in response.data:
-            user_id = session['user_id']
-            month_year = datetime.datetime.fromisoformat(session['start_time']).strftime('%Y-%m')
-            
-            if (user_id, month_year) not in monthly_aggregates:
-                monthly_aggregates[(user_id, month_year)] = 0
-            monthly_aggregates[(user_id, month_year)] += session['duration_seconds']
-        
-        # Insérer ou mettre à jour les statistiques mensuelles
-        for (user_id, month_year), total_seconds in monthly_aggregates.items():
-            # Vérifier si l'entrée existe déjà
-            existing_stat = self.client.table('monthly_stats')\
-                .select('total_seconds')\
-                .eq('user_id', user_id)\
-                .eq('month', month_year)\
-                .execute()
-
-            if existing_stat.data:
-                # Mettre à jour
-                new_total = existing_stat.data[0]['total_seconds'] + total_seconds
-                self.client.table('monthly_stats')\
-                    .update({'total_seconds': new_total})\
-                    .eq('user_id', user_id)\
-                    .eq('month', month_year)\
-                    .execute()
-            else:
-                # Insérer
-                self.client.table('monthly_stats')\
-                    .insert({'user_id': user_id, 'month': month_year, 'total_seconds': total_seconds})\
-                    .execute()
-        
-        # Supprimer les sessions agrégées
-        session_ids_to_delete = [session['id'] for session in response.data]
-        if session_ids_to_delete:
-            self.client.table('sessions')\
-                .delete()\
-                .in_('id', session_ids_to_delete)\
-                .execute()
-        
-        logger.info(f"Agrégation de {len(response.data)} anciennes sessions terminée. {len(monthly_aggregates)} entrées mensuelles mises à jour.")
+        first_day = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+        total_days = max(1, (six_months_ago - first_day).days)
+        chunk_start = first_day
+        archived_total = 0
+        logger.info(f"Agrégation des sessions antérieures au {six_months_ago:%d/%m/%Y}, reprise au {chunk_start:%d/%m/%Y}")
+
+        while chunk_start < six_months_ago:
+            chunk_end = min(chunk_start + datetime.timedelta(days=chunk_days), six_months_ago)
+            archived = await self.archive_sessions(chunk_start, chunk_end)
+            archived_total += archived
+            progress = min(100, 100 * (chunk_end - first_day).days // total_days)
+            logger.info(f"Agrégation {chunk_start:%d/%m/%Y} → {chunk_end:%d/%m/%Y}: {archived} session(s) ({progress}%)")
+            chunk_start = chunk_end
+
+        logger.info(f"Agrégation de {archived_total} anciennes sessions terminée.")
         return True
 
+    @with_retry(max_retries=3, delay=1)
+    async def compact_sessions(self, before: Optional[datetime.datetime] = None, days: int = 1) -> int:
+        """Fusionne les sessions consécutives (fin = début de la suivante) d'un même utilisateur et d'un même jour,
+        pour les lignes commencées dans les days jours précédant before"""
+        # Par défaut, seule la journée terminée depuis plus de 24h est compactée : aucune session ouverte n'y figure
+        if before is None:
+            before = get_period_start('daily') - datetime.timedelta(days=1)
+        params = {'p_from': (before - datetime.timedelta(days=days)).isoformat(), 'p_before': before.isoformat()}
+        response = await self.execute(self.client.rpc('compact_sessions', params))
+        merged = response.data or 0
+        logger.info(f"Compactage des sessions terminé: {merged} ligne(s) fusionnée(s)")
+        return merged
+
 # Création et exportation de l'instance
 try:
     supabase = SupabaseClient()
@@ -0,0 +1,116 @@
+import bisect
+import heapq
+import logging
+import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from database.supabase_client import supabase
+from database.journal import journal
+
+logger = logging.getLogger('Focusbot')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def hour_index(moment: datetime.datetime) -> int:
+    """Numéro de l'heure contenant un instant (heure locale naïve)"""
+    return int((moment - EPOCH).total_seconds()) // 3600
+
+class WeeklyRanking:
+    """Classement glissant des 7 derniers jours, tenu en mémoire par tranches d'une heure et incrémenté à chaque écriture de session"""
+
+    def __init__(self, window_hours: int = 7 * 24):
+        self.window_hours = window_hours
+        self.buckets: Dict[int, Dict[int, int]] = {}  # {user_id: {heure: secondes}}
+        self.hour_users: Dict[int, Set[int]] = {}  # {heure: utilisateurs ayant du temps dans cette heure}
+        self.hours: List[int] = []  # Tas des heures présentes, pour l'expiration
+        self.totals: Dict[int, int] = {}
+        # Classement ordonné : (-secondes, user_id), tenu trié à chaque changement de total
+        self.ranking: List[Tuple[int, int]] = []
+        self.first_hour: Optional[int] = None  # Plus ancienne heure encore dans la fenêtre
+        self.ready = False
+
+    def clear(self):
+        self.buckets.clear()
+        self.hour_users.clear()
+        self.hours.clear()
+        self.totals.clear()
+        self.ranking.clear()
+        self.ready = False
+
+    def _set_total(self, user_id: int, total: int):
+        old = self.totals.get(user_id)
+        if old:
+            del self.ranking[bisect.bisect_left(self.ranking, (-old, user_id))]
+        if total > 0:
+            self.totals[user_id] = total
+            bisect.insort(self.ranking, (-total, user_id))
+        else:
+            self.totals.pop(user_id, None)
+
+    def _add_seconds(self, user_id: int, hour: int, seconds: int):
+        if seconds <= 0:
+            return
+        user_buckets = self.buckets.setdefault(user_id, {})
+        if hour not in self.hour_users:
+            self.hour_users[hour] = set()
+            heapq.heappush(self.hours, hour)
+        self.hour_users[hour].add(user_id)
+        user_buckets[hour] = user_buckets.get(hour, 0) + seconds
+        self._set_total(user_id, self.totals.get(user_id, 0) + seconds)
+
+    def add(self, user_id: int, start: datetime.datetime, end: datetime.datetime):
+        """Répartit le temps passé entre start et end dans les tranches horaires de l'utilisateur"""
+        total_seconds = int((end - start).total_seconds())
+        if total_seconds <= 0:
+            return
+
+        # Les secondes entières sont réparties par cumul arrondi : la somme des tranches vaut toujours total_seconds
+        elapsed = 0
+        hour = hour_index(start)
+        while elapsed < total_seconds:
+            hour_end = EPOCH + datetime.timedelta(hours=hour + 1)
+            cumulative = min(total_seconds, round((hour_end - start).total_seconds()))
+            if self.first_hour is None or hour >= self.first_hour:
+                self._add_seconds(user_id, hour, cumulative - elapsed)
+            elapsed = cumulative
+            hour += 1
+
+    def advance(self, now: datetime.datetime):
+        """Fait glisser la fenêtre jusqu'à now et retire les tranches expirées"""
+        self.first_hour = hour_index(now) - self.window_hours + 1
+        while self.hours and self.hours[0] < self.first_hour:
+            hour = heapq.heappop(self.hours)
+            for user_id in self.hour_users.pop(hour, ()):
+                user_buckets = self.buckets[user_id]
+                seconds = user_buckets.pop(hour)
+                if not user_buckets:
+                    del self.buckets[user_id]
+                self._set_total(user_id, self.totals.get(user_id, 0) - seconds)
+
+    def top(self, k: int, now: datetime.datetime, live: Optional[Dict[int, int]] = None) -> List[Tuple[int, int]]:
+        """Les k premiers (user_id, secondes) de la fenêtre, temps non encore sauvegardé des sessions en cours compris"""
+        self.advance(now)
+        live = live or {}
+
+        # Le temps en cours ne fait que monter : au-delà des k + len(live) premiers, personne ne peut entrer dans le top k
+        candidates = {user_id: -negative for negative, user_id in self.ranking[:k + len(live)]}
+        for user_id, seconds in live.items():
+            candidates[user_id] = self.totals.get(user_id, 0) + seconds
+        ranking = sorted(candidates.items(), key=lambda item: (-item[1], item[0]))
+        return [(user_id, seconds) for user_id, seconds in ranking if seconds > 0][:k]
+
+    async def warm(self, now: datetime.datetime) -> bool:
+        """Charge la fenêtre depuis la base en une lecture paginée des sessions"""
+        async with journal.drained("Chargement du classement hebdomadaire") as drained:
+            if not drained:
+                return False
+            self.clear()
+            self.advance(now)
+
+            # Les lignes sont coupées à minuit : un jour de plus couvre celles commencées avant la fenêtre
+            window_start = EPOCH + datetime.timedelta(hours=self.first_hour)
+            async for _, user_id, _, end_time, duration_seconds in supabase.iter_sessions(start=window_start - datetime.timedelta(days=1)):
+                self.add(user_id, end_time - datetime.timedelta(seconds=duration_seconds), end_time)
+            self.ready = True
+
+        logger.info(f"Classement hebdomadaire chargé pour {len(self.totals)} utilisateur(s)")
+        return True
@@ -0,0 +1,82 @@
+import json
+import queue
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Tuple
+from config import LOG_FILE, LOG_LEVEL, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_RATE_LIMIT
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par message"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'line': record.lineno,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class RateLimitFilter(logging.Filter):
+    """Limite le nombre de messages émis par une même ligne de code sur une fenêtre glissante
+
+    Les avertissements et erreurs passent toujours ; le nombre de messages écartés est signalé
+    sur le premier message accepté de la fenêtre suivante.
+    """
+
+    def __init__(self, limit: int, period: float = 60.0):
+        super().__init__()
+        self.limit = limit
+        self.period = period
+        self.windows: Dict[Tuple[str, int], list] = {}  # {(fichier, ligne): [début de fenêtre, émis, écartés]}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.pathname, record.lineno)
+        window = self.windows.get(key)
+        if window is None or record.created - window[0] >= self.period:
+            suppressed = window[2] if window else 0
+            self.windows[key] = [record.created, 1, 0]
+            if suppressed:
+                record.msg = f"{record.getMessage()} ({suppressed} message(s) similaire(s) écarté(s))"
+                record.args = None
+            return True
+
+        if window[1] < self.limit:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+def setup_logging() -> QueueListener:
+    """Configure la journalisation : le fil du bot ne fait que déposer les messages dans une file,
+    un fil dédié les écrit dans la console et dans un fichier à rotation"""
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
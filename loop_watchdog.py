@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from metrics import registry
+
+logger = logging.getLogger('Focusbot')
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+# Modules du bot qui ne sont jamais la cause d'un blocage : le chien de garde lui-même et l'instrumentation
+IGNORED_FILES = {os.path.join(PROJECT_ROOT, name) for name in ('loop_watchdog.py', 'metrics.py', 'logging_config.py')}
+
+loop_stalls_total = registry.counter(
+    'focusbot_loop_stalls_total', 'Blocages de la boucle d\'événements au-delà du seuil, par origine', ('location',)
+)
+loop_stall_seconds = registry.histogram(
+    'focusbot_loop_stall_seconds', 'Durée des blocages de la boucle d\'événements',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+@dataclass(slots=True)
+class Offender:
+    """Blocages cumulés d'une même origine"""
+    location: str
+    command: Optional[str]
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    last_stack: str = ''
+    last_seen: float = 0.0
+
+class LoopWatchdog:
+    """Surveille la boucle d'événements depuis un fil dédié
+
+    Le fil envoie un battement à la boucle ; si la boucle ne le traite pas avant le seuil, elle est occupée
+    par du code bloquant : la pile du fil de la boucle est relevée à cet instant et attribuée au code du bot
+    le plus profond (cog, commande ou méthode de SupabaseClient). La durée du blocage est mesurée quand le
+    battement est enfin traité.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.offenders: Dict[Tuple[str, Optional[str]], Offender] = {}
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Démarre la surveillance ; à appeler depuis le fil de la boucle"""
+        if self.thread is not None or self.threshold <= 0:
+            return
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='loop-watchdog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.threshold + 1)
+            self.thread = None
+
+    def run(self):
+        while not self.stopped.is_set():
+            beat = threading.Event()
+            sent = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(beat.set)
+            except RuntimeError:
+                break  # Boucle fermée
+
+            if not beat.wait(self.threshold):
+                # La boucle est bloquée : la pile est relevée pendant le blocage, pas après
+                frame = sys._current_frames().get(self.loop_thread_id)
+                location, command, stack = self.describe(frame)
+                del frame
+                while not beat.wait(self.interval):
+                    if self.stopped.is_set() or self.loop.is_closed():
+                        return
+                self.record(location, command, stack, time.perf_counter() - sent)
+
+            self.stopped.wait(self.interval)
+
+    def describe(self, frame) -> Tuple[str, Optional[str], str]:
+        """(origine, commande en cours, pile) d'un blocage"""
+        if frame is None:
+            return 'inconnu', None, ''
+        stack = ''.join(traceback.format_stack(frame))
+        innermost = frame
+
+        location = None
+        command = None
+        while frame is not None:
+            filename = os.path.abspath(frame.f_code.co_filename)
+            if location is None and filename.startswith(PROJECT_ROOT + os.sep) and filename not in IGNORED_FILES:
+                relative = os.path.relpath(filename, PROJECT_ROOT)
+                location = f"{relative}:{frame.f_code.co_qualname}"
+            if command is None and frame.f_code.co_name in ('_invoke_with_namespace', 'invoke'):
+                # Commande slash ou hybride en cours d'exécution, plus haut dans la pile
+                owner = frame.f_locals.get('self')
+                name = getattr(owner, 'qualified_name', None)
+                if isinstance(name, str):
+                    command = name
+            frame = frame.f_back
+
+        # Aucun code du bot dans la pile : blocage dans une bibliothèque, rattaché à l'appelant le plus profond
+        if location is None:
+            location = f"{os.path.basename(innermost.f_code.co_filename)}:{innermost.f_code.co_qualname}"
+        return location, command, stack
+
+    def record(self, location: str, command: Optional[str], stack: str, duration: float):
+        with self.lock:
+            offender = self.offenders.get((location, command))
+            first = offender is None
+            if first:
+                offender = self.offenders[(location, command)] = Offender(location, command)
+            offender.count += 1
+            offender.total_seconds += duration
+            offender.max_seconds = max(offender.max_seconds, duration)
+            offender.last_stack = stack
+            offender.last_seen = time.time()
+
+        loop_stalls_total.inc(location=location)
+        loop_stall_seconds.observe(duration)
+        origin = f"{location} (commande /{command})" if command else location
+        if first:
+            # Nouvelle origine : pile complète, pour repérer immédiatement une régression
+            logger.warning(f"Boucle d'événements bloquée {duration:.2f}s par {origin}\n{stack}")
+        else:
+            logger.warning(f"Boucle d'événements bloquée {duration:.2f}s par {origin}")
+
+    def worst(self, limit: int = 10) -> List[Offender]:
+        """Origines des blocages, par temps bloqué cumulé décroissant"""
+        with self.lock:
+            offenders = list(self.offenders.values())
+        return sorted(offenders, key=lambda offender: offender.total_seconds, reverse=True)[:limit]
+
+    def total_stalls(self) -> int:
+        with self.lock:
+            return sum(offender.count for offender in self.offenders.values())
+
+    def reset(self):
+        with self.lock:
+            self.offenders.clear()
@@ -1,24 +1,23 @@
 import discord
 from discord.ext import commands
 import asyncio
-from config import DISCORD_TOKEN, GUILD_ID
+from config import DISCORD_TOKEN, GUILD_ID, COMMAND_TREE_HASH_PATH
 import logging
+from logging_config import setup_logging
 from cogs.voice_tracking import VoiceTracking
+from database.supabase_client import supabase
+from database.journal import journal
 import sys
 import traceback
 import signal
 from typing import Optional
 import platform
+import os
+import json
+import hashlib
 
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Configuration du logging (écriture hors de la boucle d'événements)
+log_listener = setup_logging()
 logger = logging.getLogger('Focusbot')
 
 # Configuration des intents
@@ -34,39 +33,67 @@ MAX_RECONNECT_ATTEMPTS = 5
 RECONNECT_DELAY = 5  # secondes
 INITIAL_RECONNECT_DELAY = 1  # seconde
 
+EXTENSIONS = [
+    'cogs.roles',
+    'cogs.voice_tracking',
+    'cogs.stats',
+    'cogs.leaderboard',
+    'cogs.discipline',
+    'cogs.podium',
+    'cogs.monitoring'  # En dernier : instrumente les tâches des cogs déjà chargés
+]
+
+# Tâche de démarrage, lancée une seule fois malgré les on_ready des reconnexions
+startup_task: Optional[asyncio.Task] = None
+
 async def load_extensions():
     """Charge les extensions du bot"""
     try:
-        await bot.load_extension('cogs.voice_tracking')
-        await bot.load_extension('cogs.stats')
-        await bot.load_extension('cogs.leaderboard')
-        await bot.load_extension('cogs.discipline')
-        await bot.load_extension('cogs.podium')
+        for extension in EXTENSIONS:
+            # Une nouvelle tentative de connexion ne recharge pas les extensions déjà chargées
+            if extension not in bot.extensions:
+                await bot.load_extension(extension)
     except Exception as e:
         logger.error(f"Erreur lors du chargement des extensions: {e}")
         raise
 
-@bot.event
-async def on_ready():
-    """Événement déclenché quand le bot est prêt"""
-    logger.info(f'Bot connecté en tant que {bot.user.name}')
-    logger.info(f'ID du bot: {bot.user.id}')
+def get_command_tree_hash() -> str:
+    """Empreinte des commandes slash enregistrées, telles qu'elles seraient envoyées à Discord"""
+    payload = [command.to_dict() for command in bot.tree.get_commands()]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
 
-    # Attribuer GUILD_ID à l'objet bot pour une accessibilité globale
-    bot.guild_id = GUILD_ID
-    
+async def sync_command_tree():
+    """Synchronise les commandes slash uniquement si elles ont changé depuis la dernière synchronisation"""
+    command_hash = get_command_tree_hash()
+    try:
+        with open(COMMAND_TREE_HASH_PATH, encoding='utf-8') as file:
+            if file.read().strip() == command_hash:
+                logger.info('Commandes inchangées, synchronisation ignorée')
+                return
+    except FileNotFoundError:
+        pass
+
+    synced = await bot.tree.sync()
+    logger.info(f'Synchronisé {len(synced)} commande(s)')
+
+    # Écriture atomique : une empreinte tronquée forcerait seulement une nouvelle synchronisation
+    os.makedirs(os.path.dirname(COMMAND_TREE_HASH_PATH) or '.', exist_ok=True)
+    temporary_path = f'{COMMAND_TREE_HASH_PATH}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        file.write(command_hash)
+    os.replace(temporary_path, COMMAND_TREE_HASH_PATH)
+
+async def run_startup():
+    """Travaux de démarrage menés en arrière-plan, une fois connecté"""
     # Synchronisation des commandes slash
     try:
-        synced = await bot.tree.sync()
-        logger.info(f'Synchronisé {len(synced)} commande(s)')
+        await sync_command_tree()
     except Exception as e:
         logger.error(f'Erreur lors de la synchronisation des commandes: {e}')
 
     # Vérification du serveur
     guild = bot.get_guild(GUILD_ID)
     if guild:
-        logger.info(f'Serveur Discord trouvé: {guild.name} ({guild.id})')
-        logger.info('Démarrage de la vérification des rôles pour tous les membres')
         voice_tracking_cog = bot.get_cog('VoiceTracking')
         if voice_tracking_cog:
             await voice_tracking_cog.check_all_roles()
@@ -75,6 +102,23 @@ async def on_ready():
     else:
         logger.error(f"Le serveur avec l'ID {GUILD_ID} n'a pas été trouvé.")
 
+@bot.event
+async def on_ready():
+    """Événement déclenché quand le bot est prêt (aussi après chaque reconnexion)"""
+    global startup_task
+    logger.info(f'Bot connecté en tant que {bot.user.name}')
+    logger.info(f'ID du bot: {bot.user.id}')
+
+    # Attribuer GUILD_ID à l'objet bot pour une accessibilité globale
+    bot.guild_id = GUILD_ID
+
+    if startup_task is not None:
+        logger.info('Reconnexion : démarrage déjà effectué')
+        return
+
+    # Le suivi vocal fonctionne dès la connexion ; le reste du démarrage ne le retarde pas
+    startup_task = asyncio.create_task(run_startup())
+
 @bot.event
 async def on_error(event, *args, **kwargs):
     """Gestionnaire d'erreurs global"""
@@ -88,17 +132,18 @@ async def handle_shutdown(signal_name: Optional[str] = None):
         logger.info("Arrêt du bot...")
     
     try:
-        # Nettoyer les ressources
-        for cog in bot.cogs.values():
-            if hasattr(cog, 'cog_unload'):
-                await cog.cog_unload()
-        
-        # Fermer la connexion Discord
+        # Fermer la connexion Discord ; bot.close() décharge les extensions, donc appelle une fois le cog_unload de chaque cog
         await bot.close()
+
+        # Fermer le journal local puis libérer le pool de requêtes Supabase
+        journal.close()
+        supabase.close()
     except Exception as e:
         logger.error(f"Erreur lors de l'arrêt du bot: {e}")
     finally:
         logger.info("Bot arrêté")
+        # Vider la file des messages avant de quitter
+        log_listener.stop()
         sys.exit(0)
 
 def setup_signal_handlers():